@@ -0,0 +1,164 @@
+# answer_cache.py
+import json
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# ---------------- CONFIG ----------------
+CACHE_PATH = "./answer_cache.sqlite3"
+MAX_ENTRIES = 2000
+TTL_SECONDS = 7 * 24 * 3600
+SIMILARITY_THRESHOLD = 0.95  # cosine similarity for near-duplicate queries
+# ----------------------------------------
+
+
+def normalize_query(query):
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    q = re.sub(r"\s+", " ", query.strip().lower())
+    return q.rstrip("?!. ")
+
+
+class AnswerCache:
+    """
+    Persistent answer cache keyed on (agent, style, normalized query).
+    Entries carry the version of the collection they were answered from,
+    so a rebuilt collection silently invalidates them.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES,
+                 ttl=TTL_SECONDS, threshold=SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                agent TEXT,
+                style TEXT,
+                version TEXT,
+                embedding BLOB,
+                answer TEXT,
+                sources TEXT,
+                created_at REAL,
+                last_access REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_access ON answers(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_created ON answers(created_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(agent, style, query):
+        return f"{agent}|{style}|{normalize_query(query)}"
+
+    def _purge_stale(self, agent, version):
+        """Drop an agent's entries once its collection version moves on."""
+        if self._versions.get(agent) == version:
+            return
+        self._conn.execute("DELETE FROM answers WHERE agent = ? AND version != ?", (agent, version))
+        self._conn.commit()
+        self._versions[agent] = version
+
+    def get(self, agent, style, query, version):
+        """Exact lookup on the normalized query. Returns (answer, sources) or None."""
+        with self._lock:
+            self._purge_stale(agent, version)
+            row = self._conn.execute(
+                "SELECT key, answer, sources FROM answers WHERE key = ? AND version = ? AND created_at >= ?",
+                (self._key(agent, style, query), version, self._oldest())
+            ).fetchone()
+            if row is not None:
+                self.hits += 1
+            return self._touch(row)
+
+    def get_similar(self, agent, style, version, embedding):
+        """
+        Near-duplicate lookup: the most similar cached query above the
+        threshold. Counts a miss when nothing qualifies, so call it after get().
+        """
+        with self._lock:
+            self._purge_stale(agent, version)
+            row = self._nearest(agent, style, version, embedding)
+            if row is None:
+                self.misses += 1
+            else:
+                self.near_hits += 1
+            return self._touch(row)
+
+    def note_miss(self):
+        """For callers that skip get_similar (e.g. exact section matches)."""
+        with self._lock:
+            self.misses += 1
+
+    def _oldest(self):
+        """Entries created before this have expired; reads skip them, put() deletes them."""
+        return time.time() - self.ttl
+
+    def _touch(self, row):
+        if row is None:
+            return None
+        self._conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (time.time(), row[0]))
+        self._conn.commit()
+        return row[1], json.loads(row[2])
+
+    def _nearest(self, agent, style, version, embedding):
+        rows = self._conn.execute(
+            "SELECT key, answer, sources, embedding FROM answers "
+            "WHERE agent = ? AND style = ? AND version = ? AND created_at >= ? AND embedding IS NOT NULL",
+            (agent, style, version, self._oldest())
+        ).fetchall()
+        if not rows:
+            return None
+        q = np.asarray(embedding, dtype=np.float32)
+        q /= np.linalg.norm(q) or 1.0
+        mat = np.stack([np.frombuffer(r[3], dtype=np.float32) for r in rows])
+        sims = mat @ q / np.maximum(np.linalg.norm(mat, axis=1), 1e-12)
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        return rows[best][:3]
+
+    def put(self, agent, style, query, version, answer, sources, embedding=None):
+        now = time.time()
+        blob = None
+        if embedding is not None:
+            blob = np.asarray(embedding, dtype=np.float32).tobytes()
+        with self._lock:
+            self._purge_stale(agent, version)
+            self._conn.execute("DELETE FROM answers WHERE created_at < ?", (self._oldest(),))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._key(agent, style, query), agent, style, version, blob,
+                 answer, json.dumps(sources), now, now)
+            )
+            # LRU: keep only the most recently used max_entries rows
+            self._conn.execute(
+                "DELETE FROM answers WHERE key NOT IN "
+                "(SELECT key FROM answers ORDER BY last_access DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "size": size,
+        }
@@ -1,6 +1,8 @@
 #app.py
+import logging
 import os
 import sys
+import threading
 
 # This check ensures the code only runs in a deployed environment
 # where the issue occurs, not locally.
@@ -12,11 +14,42 @@ except ImportError:
     pass
 import streamlit as st
 import pandas as pd
-from scheduler import solve_schedule, swap_shift
-from arai_rag import answer_question
+from scheduler import solve_schedule
+from schedule_state import ScheduleState
+from arai_rag import answer_question_stream, warm_up
+import tracing
 
 st.set_page_config(layout="wide")
+SCHEDULE_PAGE_ROWS = 50  # employees per page of the schedule view
+logger = logging.getLogger("rag")
+
+
+@st.cache_resource
+def start_warm_up():
+    """
+    Once per server process: open Chroma, the collections and the models in
+    the background. Returns a status dict whose "error" is set if that fails.
+    """
+    status = {"error": None}
+
+    def run():
+        try:
+            warm_up()
+        except Exception as e:  # the first question will retry and surface the error
+            logger.exception("Warm-up failed")
+            status["error"] = f"{type(e).__name__}: {e}"
+
+    status["thread"] = threading.Thread(target=run, daemon=True)
+    status["thread"].start()
+    if tracing.METRICS_PORT:
+        tracing.serve_metrics(tracing.METRICS_PORT)
+    return status
+
+
+warm_status = start_warm_up()
 st.title("FAN - Franchise AI Navigator")
+if warm_status["error"]:
+    st.warning(f"⚠️ Warm-up failed, the first question will retry: {warm_status['error']}")
 
 # Dark mode styling
 st.markdown("""
@@ -45,6 +78,10 @@ with tabs[0]:
     with st.form("arai_form"):
         query = st.text_input("Type your question:")
         style_choice = st.selectbox("Answer style:", ["bullet", "sentence"])
+        # "auto" searches every manual and answers from the one that matches best
+        agent_choice = st.selectbox("Manual:", ["arai", "auto", "jai", "kai"])
+        # "extractive" quotes the manual without the LLM; "auto" does so for confident step lists
+        mode_choice = st.selectbox("Answer mode:", ["llm", "auto", "extractive"])
         
         # Use a submit button for the form
         submitted = st.form_submit_button("Ask Arai")
@@ -54,14 +91,36 @@ with tabs[0]:
 
     # Process form submission
     if submitted and query:
-        with st.spinner('Thinking...'):
-            response, sources = answer_question(query, style=style_choice)
+        chunks, sources = answer_question_stream(query, agent=agent_choice, style=style_choice,
+                                                 mode=mode_choice)
+        parts = []
+
+        def render(pieces):
+            for piece in pieces:
+                parts.append(piece)
+                # Replace • with - for proper Markdown bullets while streaming
+                yield piece.replace("•", "-")
+
+        live = st.empty()
+        with live.container():
+            st.write(f"**Q:** {query}")
+            st.write_stream(render(chunks))
+        live.empty()  # the history below shows the finished answer
+        response = "".join(parts).strip()
         st.session_state['arai_history'].append({
             "query": query,
             "answer": response,
             "sources": sources
         })
 
+    # Optional per-stage latency (p50/p95 over recent requests in this server process)
+    if st.checkbox("Show latency panel"):
+        stages = tracing.stage_percentiles()
+        if stages:
+            st.dataframe(pd.DataFrame.from_dict(stages, orient="index").round(1))
+        else:
+            st.caption("No traced requests yet.")
+
     # Clear button action
     if st.button("Clear Answers"):
         st.session_state['arai_history'] = []
@@ -83,7 +142,8 @@ with tabs[0]:
         # Display sources with an expander
         with st.expander(f"Show sources for '{h['query']}'"):
             for s_idx, src in enumerate(h["sources"]):
-                st.markdown(f"**Source {s_idx+1}:** {src['section']}")
+                agent_tag = f" ({src['agent'].upper()})" if src.get("agent") else ""
+                st.markdown(f"**Source {s_idx+1}:** {src['section']}{agent_tag}")
                 st.write(f"**Preview:** {src['preview']}...")
 
 # ---- Oai Tab ----
@@ -98,19 +158,21 @@ with tabs[1]:
 
         # ปุ่ม Generate Schedule
         if st.button("Generate Schedule"):
-            schedule = solve_schedule(avail_df)
-            st.session_state['schedule'] = schedule.copy()
-            st.session_state['original_schedule'] = schedule.copy()
+            # One compact copy per session; edits live in its swap journal
+            st.session_state['schedule_state'] = ScheduleState.from_frame(solve_schedule(avail_df))
+            st.session_state.pop('schedule_csv', None)
             st.success("✅ Schedule generated successfully!")
 
     # ถ้ามี schedule อยู่แล้ว
-    if 'schedule' in st.session_state:
-        schedule = st.session_state['schedule']
-        employees = schedule.index.tolist()
-        shifts = schedule.columns.tolist()
+    if 'schedule_state' in st.session_state:
+        state = st.session_state['schedule_state']
+        employees = state.employees
+        shifts = state.shifts
 
         st.subheader("Generated Schedule")
-        schedule_display = st.dataframe(schedule.style.applymap(highlight_schedule))
+        schedule_display = st.empty()  # filled in below, after any swap/undo/reset of this run
+        n_pages = max(1, -(-len(employees) // SCHEDULE_PAGE_ROWS))
+        page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1) if n_pages > 1 else 1
 
         # Swap shifts
         st.subheader("Swap Shifts")
@@ -122,24 +184,31 @@ with tabs[1]:
         with col3:
             shift_sel = st.selectbox("Shift to swap", shifts)
 
-        if st.button("Swap Shift"):
-            success = swap_shift(schedule, emp1, emp2, shift_sel)
-            if success:
-                st.session_state['schedule'] = schedule
+        col_swap, col_undo, col_redo, col_reset = st.columns(4)
+        if col_swap.button("Swap Shift"):
+            if state.swap(emp1, emp2, shift_sel):
                 st.success(f"Swapped {shift_sel} between {emp1} and {emp2}")
             else:
-                st.warning("Swap not allowed: both employees must have this shift assigned (1).")
-            st.dataframe(schedule.style.applymap(highlight_schedule))
-
-        # Download CSV
-        csv = schedule.to_csv(index=True).encode('utf-8')
-        st.download_button("Download CSV", csv, "schedule.csv", "text/csv")
-
+                st.warning("Swap not allowed: exactly one of the two employees must have this shift assigned (1).")
+        if col_undo.button("Undo", disabled=not state.can_undo):
+            state.undo()
+        if col_redo.button("Redo", disabled=not state.can_redo):
+            state.redo()
         # Reset schedule
-        if st.button("Reset Schedule"):
-            st.session_state['schedule'] = st.session_state['original_schedule'].copy()
+        if col_reset.button("Reset Schedule"):
+            state.reset()
             st.success("🔄 Schedule has been reset to the original version.")
-            schedule_display.dataframe(st.session_state['schedule'].style.applymap(highlight_schedule))
+
+        # Only the visible page is turned into a styled DataFrame
+        rows = slice((page - 1) * SCHEDULE_PAGE_ROWS, page * SCHEDULE_PAGE_ROWS)
+        schedule_display.dataframe(state.to_frame(rows=rows).style.applymap(highlight_schedule))
+
+        # Download CSV: built on request, not on every rerun, and rebuilt after any edit
+        if st.button("Prepare CSV"):
+            st.session_state['schedule_csv'] = (state.revision, state.to_csv())
+        prepared = st.session_state.get('schedule_csv')
+        if prepared and prepared[0] == state.revision:
+            st.download_button("Download CSV", prepared[1], "schedule.csv", "text/csv")
 # ---- About Tab ----
 with tabs[2]:
     st.write("FAN - Franchise AI Navigator")
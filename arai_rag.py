@@ -1,11 +1,49 @@
-import chromadb
-chromadb.config.telemetry = False
+import asyncio
+import contextvars
+import json
+import logging
 import os
-from openai import OpenAI
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from answer_cache import AnswerCache, normalize_query
+import collection_alias
+import compact_index
+import lexical_index
+import llm_guard
+import tracing
+from text_utils import count_tokens, section_sentences, split_sentences
+from embeddings import EMB_MODEL_NAME, embed_query, embed_texts, get_model
+
+# ---------------- CONFIG ----------------
+PERSIST_DIR = "./chroma_db"
+TOP_K = 5  # sections per query
+CHUNK_FETCH_FACTOR = 3  # chunked collections: results fetched per section wanted, so one big section cannot fill top_k
+# "compact": search the memory-mapped compact index in-process (Chroma for
+# collections built without one); "chroma": always query Chroma
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "compact")
+# ----------------------------------------
+COLLECTION_MAP = {
+    "arai": "arai_collection",
+    "jai": "jai_collection",
+    "kai": "kai_collection"
+}
+AUTO_AGENT = "auto"  # search every collection and answer as the agent whose manual matches best
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Chroma, OpenAI, the answer cache and the collection handles are created on
+# first use and shared by every caller in the process (all Streamlit sessions and reruns)
+_answer_cache = None
+_chroma_client = None
+_llm_client = None
+_async_llm_client = None
+_collections = {}  # logical collection name -> (physical name, handle) of the current generation
+_init_lock = threading.Lock()
+_fanout_pool = None
+logger = logging.getLogger("rag")
 
-import chromadb.segment.impl.metadata.sqlite as sqlite_module
 
 def safe_decode_seq_id(seq_id_bytes):
     if isinstance(seq_id_bytes, int):
@@ -17,57 +55,408 @@ def safe_decode_seq_id(seq_id_bytes):
     else:
         raise ValueError(f"Unexpected seq_id_bytes: {seq_id_bytes}")
 
-sqlite_module._decode_seq_id = safe_decode_seq_id
 
-import re
+def get_chroma_client():
+    global _chroma_client
+    if _chroma_client is None:
+        with _init_lock:
+            if _chroma_client is None:
+                import chromadb
+                import chromadb.segment.impl.metadata.sqlite as sqlite_module
+                chromadb.config.telemetry = False
+                sqlite_module._decode_seq_id = safe_decode_seq_id
+                _chroma_client = chromadb.PersistentClient(path=PERSIST_DIR)
+    return _chroma_client
 
-# ---------------- CONFIG ----------------
-PERSIST_DIR = "./chroma_db"
-EMB_MODEL_NAME = "all-MiniLM-L6-v2"
-TOP_K = 5
-# ----------------------------------------
-COLLECTION_MAP = {
-    "arai": "arai_collection",
-    "jai": "jai_collection",
-    "kai": "kai_collection"
-}
-# Init embeddings & DB
-# Init Chroma client + embedding function
 
-chroma_client = chromadb.PersistentClient(path=PERSIST_DIR)
+def get_llm_client():
+    global _llm_client
+    if _llm_client is None:
+        with _init_lock:
+            if _llm_client is None:
+                from openai import OpenAI
+                # Timeouts and retries are handled by llm_guard, not the client
+                _llm_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"),
+                                     timeout=llm_guard.LLM_TIMEOUT, max_retries=0)
+    return _llm_client
+
+
+def get_async_llm_client():
+    global _async_llm_client
+    if _async_llm_client is None:
+        with _init_lock:
+            if _async_llm_client is None:
+                from openai import AsyncOpenAI
+                _async_llm_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"),
+                                                timeout=llm_guard.LLM_TIMEOUT, max_retries=0)
+    return _async_llm_client
+
+
+def get_answer_cache():
+    global _answer_cache
+    if _answer_cache is None:
+        with _init_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache()
+    return _answer_cache
+
+
+def get_fanout_pool():
+    """Threads for searching every collection at once (agent="auto")."""
+    global _fanout_pool
+    if _fanout_pool is None:
+        with _init_lock:
+            if _fanout_pool is None:
+                _fanout_pool = ThreadPoolExecutor(max_workers=len(COLLECTION_MAP), thread_name_prefix="rag-fanout")
+    return _fanout_pool
 
 
 def get_collection(name):
-    c = chromadb.PersistentClient(path=PERSIST_DIR)
-    return c.get_collection(name=name)
+    physical = collection_alias.resolve(name, PERSIST_DIR)
+    cached = _collections.get(name)
+    if cached is None or cached[0] != physical:
+        # A re-ingest swaps the alias to a new physical name: the old handle is replaced, never reused
+        cached = _collections[name] = (physical, get_chroma_client().get_collection(name=physical))
+    return cached[1]
+
+
+def warm_up(agents=None, embedder=True):
+    """
+    Create the shared clients and collection handles, load the lexical
+    indexes and (optionally) the embedding model, so the first question
+    does not pay for them. Safe to call more than once.
+    """
+    for agent in agents or COLLECTION_MAP:
+        agent_collection(agent)
+        agent_lexical_index(agent)
+        agent_compact_index(agent)
+    get_llm_client()
+    if embedder:
+        get_model()
+
 
 # ---------------- HELPERS ----------------
-def retrieve(query, agent, top_k=TOP_K):
+def _physical_name(agent):
     collection_name = COLLECTION_MAP.get(agent)
     if not collection_name:
         raise ValueError(f"Unknown agent: {agent}")
-    collection = chroma_client.get_collection(name=collection_name)
+    # Ingest builds into a versioned copy and swaps the alias, so always resolve it
+    return collection_alias.resolve(collection_name, PERSIST_DIR)
+
+
+def agent_collection(agent):
+    if agent not in COLLECTION_MAP:
+        raise ValueError(f"Unknown agent: {agent}")
+    return get_collection(COLLECTION_MAP[agent])
+
+
+def agent_lexical_index(agent):
+    return lexical_index.load_index(PERSIST_DIR, _physical_name(agent))
+
+
+def agent_compact_index(agent):
+    if VECTOR_BACKEND != "compact":
+        return None
+    return compact_index.load_index(PERSIST_DIR, _physical_name(agent))
+
+
+def collection_version(collection):
+    """Version stamped by data_ingest.build_vector_db; '0' for older collections."""
+    return str((collection.metadata or {}).get("version", "0"))
+
+
+def agent_version(agent):
+    """The live collection's version, without touching Chroma when the compact index has it."""
+    if agent == AUTO_AGENT:
+        versions = []
+        for a in COLLECTION_MAP:
+            try:
+                versions.append(f"{a}:{agent_version(a)}")
+            except ValueError:  # collection not ingested yet
+                versions.append(f"{a}:missing")
+        return "|".join(versions)
+    index = agent_compact_index(agent)
+    if index is not None and index.version is not None:
+        return str(index.version)
+    return collection_version(agent_collection(agent))
+
+
+def vector_query(agent, query_embeddings, top_k):
+    """Nearest sections for each embedding, as a Chroma-style query result."""
+    index = agent_compact_index(agent)
+    with tracing.span("vector_query", queries=len(query_embeddings),
+                      backend="compact" if index is not None else "chroma") as sp:
+        if index is not None:
+            res = index.query(query_embeddings, top_k)
+        else:
+            res = agent_collection(agent).query(
+                query_embeddings=query_embeddings,
+                n_results=top_k,
+                include=["documents", "metadatas", "distances"]
+            )
+        sp["hits"] = sum(len(row) for row in res["ids"])
+        if len(query_embeddings) == 1:
+            sp["distances"] = [round(d, 4) for d in res["distances"][0]]
+    return res
+
+
+def section_distance(agent, section_id, query_embedding):
+    """Vector distance from the query to a section (its closest chunk), or None if it is not stored."""
+    index = agent_compact_index(agent)
+    if index is not None:
+        return index.section_distance(query_embedding, section_id)
+    collection = agent_collection(agent)
+    vectors = []
+    for got in (collection.get(ids=[section_id], include=["embeddings"]),
+                collection.get(where={"parent_id": section_id}, include=["embeddings"])):
+        if got["embeddings"] is not None:
+            vectors += list(got["embeddings"])
+    if not vectors:
+        return None
+    sims = np.asarray(vectors, dtype=np.float32) @ np.asarray(query_embedding, dtype=np.float32)
+    return float(2.0 - 2.0 * sims.max())
+
+
+def exact_section(query, agent, query_embedding=None):
+    """
+    Fast path for queries naming a section. A section number ("3.3.1",
+    "section 3.3.1") needs no embedding and returns the section with
+    match "section" and no distance. A section title counts only with the
+    query's embedding, and only if the section is within MAX_DISTANCE of
+    it; that hit has match "exact" and its real distance. Returns the
+    section as a hit, or None.
+    """
+    if agent == AUTO_AGENT:
+        matches = [m for m in (exact_section(query, a, query_embedding) for a in COLLECTION_MAP) if m]
+        # "2.1" or "introduction" can name a section in several manuals: not exact then
+        return matches[0] if len(matches) == 1 else None
+    index = agent_lexical_index(agent)
+    if index is None:
+        return None
+    found = index.exact_match(query)
+    if found is None:
+        return None
+    idx, kind = found
+    doc = index.parent(index.docs[idx])  # the whole section, not one of its chunks
+    hit = {"id": doc["id"], "text": doc["text"], "meta": doc["meta"], "score": None, "match": "section",
+           "agent": agent}
+    if kind == "number":
+        return hit
+    if query_embedding is None:
+        return None
+    score = section_distance(agent, doc["id"], query_embedding)
+    if score is None or score > MAX_DISTANCE:
+        return None  # the words of a title, but not what the question is about
+    return dict(hit, score=score, match="exact")
 
-    res = collection.query(
-        query_texts=[query],
-        n_results=top_k,
-        include=["documents", "metadatas", "distances"]
-    )
+
+def fetch_k(agent, top_k):
+    """How many chunks to fetch for `top_k` sections: more when sections were split into chunks."""
+    index = agent_lexical_index(agent)
+    return top_k * CHUNK_FETCH_FACTOR if index is not None and index.parents else top_k
+
+
+def _top_sections(ranked, top_k):
+    """The hits of the first `top_k` distinct sections, in rank order (a section's chunks all kept)."""
+    sections = set()
     docs = []
-    for idx in range(len(res["documents"][0])):
-        docs.append({
-            "text": res["documents"][0][idx],
-            "meta": res["metadatas"][0][idx],
-            "score": res["distances"][0][idx]
-        })
+    for hit in ranked:
+        section = hit["meta"].get("parent_id", hit["id"])
+        if section not in sections:
+            if len(sections) == top_k:
+                continue
+            sections.add(section)
+        docs.append(hit)
     return docs
 
 
+def _fuse_hits(query, agent, res, row, top_k):
+    """
+    Row `row` of a Chroma query result, fused with BM25 hits for `query`.
+    Keeps `top_k` sections; several chunks of one section count once.
+    """
+    hits = {}
+    for idx in range(len(res["documents"][row])):
+        hits[res["ids"][row][idx]] = {
+            "id": res["ids"][row][idx],
+            "text": res["documents"][row][idx],
+            "meta": res["metadatas"][row][idx],
+            "score": res["distances"][row][idx],
+            "match": "vector",
+            "agent": agent,
+        }
+    vector_ids = list(hits)
+
+    index = agent_lexical_index(agent)
+    if index is None:  # collection built before the lexical index existed
+        return _top_sections([hits[i] for i in vector_ids], top_k)
+
+    lexical_ids = []
+    with tracing.span("lexical_search") as sp:
+        lexical = index.search(query, fetch_k(agent, top_k))
+        sp["hits"] = len(lexical)
+    for idx, _ in lexical:
+        doc = index.docs[idx]
+        lexical_ids.append(doc["id"])
+        if doc["id"] in hits:
+            hits[doc["id"]]["match"] = "hybrid"
+        else:
+            hits[doc["id"]] = {"id": doc["id"], "text": doc["text"], "meta": doc["meta"],
+                               "score": None, "match": "lexical", "agent": agent}
+
+    ranked = []
+    for doc_id, rrf in lexical_index.reciprocal_rank_fusion([vector_ids, lexical_ids]):
+        hits[doc_id]["rrf"] = rrf
+        ranked.append(hits[doc_id])
+    return _top_sections(ranked, top_k)
+
+
+def retrieve(query, agent, top_k=TOP_K, query_embedding=None):
+    """
+    Hybrid retrieval. Exact section-number/title matches short-circuit;
+    otherwise vector hits and BM25 hits are fused by reciprocal rank.
+    `score` is the vector distance (None for lexical-only hits and
+    section-number matches). With agent="auto" every collection is
+    searched (see merge_agent_hits).
+    """
+    with tracing.trace("retrieve", agent=agent) as sp:
+        docs = retrieve_many([query], agent, top_k, [query_embedding])[0]
+        sp["hits"] = len(docs)
+        if docs and docs[0]["match"] in ("section", "exact"):
+            sp["match"] = docs[0]["match"]
+        return docs
+
+
+def retrieve_many(queries, agent, top_k=TOP_K, query_embeddings=None):
+    """
+    retrieve() for a list of queries with one batched embedding pass and a
+    single Chroma query. `query_embeddings`, if given, lines up with
+    `queries` (None where not yet embedded). Returns one hit list per query.
+    """
+    results = [None] * len(queries)
+    todo = []
+    for i, q in enumerate(queries):
+        exact = exact_section(q, agent)  # section numbers, before any embedding
+        if exact:
+            results[i] = [exact]
+        else:
+            todo.append(i)
+    if not todo:
+        return results
+
+    embeddings = list(query_embeddings) if query_embeddings is not None else [None] * len(queries)
+    missing = [i for i in todo if embeddings[i] is None]
+    if missing:
+        with tracing.span("embed", texts=len(missing)):
+            for i, emb in zip(missing, embed_texts([queries[i] for i in missing])):
+                embeddings[i] = emb
+
+    searched = []
+    for i in todo:
+        exact = exact_section(queries[i], agent, embeddings[i])  # titles, checked against the embedding
+        if exact:
+            results[i] = [exact]
+        else:
+            searched.append(i)
+    todo = searched
+    if not todo:
+        return results
+
+    if agent == AUTO_AGENT:
+        ranked = _fan_out(queries, todo, embeddings, top_k)
+    else:
+        res = vector_query(agent, [embeddings[i] for i in todo], fetch_k(agent, top_k))
+        ranked = [_fuse_hits(queries[i], agent, res, row, top_k) for row, i in enumerate(todo)]
+    for i, hits in zip(todo, ranked):
+        results[i] = hits
+    return results
+
+
+def _fan_out(queries, todo, embeddings, top_k):
+    """Search all collections concurrently with the shared embeddings; one merged list per query."""
+    skipped = []
+
+    def search(agent):
+        try:
+            res = vector_query(agent, [embeddings[i] for i in todo], fetch_k(agent, top_k))
+        except ValueError as e:  # Chroma: the collection does not exist (not ingested yet)
+            logger.warning("Skipping agent %s in auto search: %s", agent, e)
+            skipped.append(agent)
+            return [[] for _ in todo]
+        return [_fuse_hits(queries[i], agent, res, row, top_k) for row, i in enumerate(todo)]
+
+    with tracing.span("fan_out", agents=len(COLLECTION_MAP)) as sp:
+        pool = get_fanout_pool()
+        futures = {agent: pool.submit(contextvars.copy_context().run, search, agent)
+                   for agent in COLLECTION_MAP}
+        per_agent = {agent: fut.result() for agent, fut in futures.items()}
+        sp["skipped"] = skipped
+    return [merge_agent_hits({agent: per_agent[agent][row] for agent in COLLECTION_MAP})
+            for row in range(len(todo))]
+
+
+def merge_agent_hits(hits_by_agent):
+    """
+    One ranking from several agents' hit lists. Every collection uses the
+    same embedding model with normalized vectors, so vector distances are
+    comparable across them as they are. Agents are ordered by their closest
+    section and keep their own hybrid order, so hits[0]["agent"] is the
+    agent the question belongs to.
+    """
+    def closest(agent):
+        return min((h["score"] for h in hits_by_agent[agent] if h["score"] is not None), default=float("inf"))
+
+    merged = []
+    for agent in sorted(hits_by_agent, key=closest):
+        merged += hits_by_agent[agent]
+    return merged
+
+
+def hit_sentences(hit):
+    """Title-stripped sentences of a section: precomputed at ingest, or split now for older collections."""
+    stored = hit["meta"].get("sentences")
+    if stored:
+        return json.loads(stored)
+    return section_sentences(hit["meta"].get("title", ""), hit["text"])
 
-def split_sentences(text):
-    # Split on punctuation or "Step n:"
-    sents = re.split(r'(?<=[\.\!\?])\s+|(?=Step \d+:)', text.strip())
-    return [s.strip() for s in sents if s.strip()]
+
+def expand_hits(hits, agent, mode="neighbors"):
+    """
+    One hit per section from chunk-level hits, best first. For a section
+    that was split into chunks, mode "section" uses the whole section,
+    "neighbors" the matched chunks plus the chunk on either side, and
+    "chunk" only the matched chunks. `score` is the section's best distance.
+    """
+    index = agent_lexical_index(agent)
+    groups = {}
+    for h in hits:
+        groups.setdefault(h["meta"].get("parent_id", h["id"]), []).append(h)
+
+    expanded = []
+    for parent_id, group in groups.items():
+        best = group[0]
+        parent = index.parents.get(parent_id) if index else None
+        if parent is None:  # section stored whole (or collection built before chunking)
+            expanded.append(best)
+            continue
+        scores = [h["score"] for h in group if h["score"] is not None]
+        title = parent["meta"].get("title", "")
+        if mode == "section" or any(h["id"] == parent_id for h in group):
+            text, meta = parent["text"], parent["meta"]
+        else:
+            chunks = {h["meta"].get("chunk", 0) for h in group}
+            if mode == "neighbors":
+                chunks |= {c + d for c in chunks for d in (-1, 1)}
+            siblings = index.children.get(parent_id, [])
+            sentences = []
+            for c in sorted(chunks):
+                if 0 <= c < len(siblings):
+                    # Neighbouring chunks overlap by a sentence or so
+                    sentences += [x for x in hit_sentences(index.docs[siblings[c]]) if x not in sentences]
+            text = "\n".join([title] + sentences)
+            meta = {"title": title, "sentences": json.dumps(sentences, ensure_ascii=False)}
+        expanded.append(dict(best, id=parent_id, text=text, meta=meta, score=min(scores, default=None)))
+    return expanded
 
 
 def extract_relevant_sentences(hits, query_keywords, max_sentences_per_hit=3):
@@ -81,10 +470,703 @@ def extract_relevant_sentences(hits, query_keywords, max_sentences_per_hit=3):
     return extracted
 
 
+# ---------------- ANSWER FORMATTING ----------------
+STEP_RE = re.compile(r"(Step \d+:)")
+BULLET_RE = re.compile(r"(•)")
+SECTION_HEADER_RE = re.compile(r"^\d+(\.\d+)*\s*[\.:]")
+STEP_START_RE = re.compile(r"Step \d+:")
+WHITESPACE_RE = re.compile(r"\s+")
+STREAM_HOLD_CHARS = 40  # sentence style: hold a partial line this much past the title length
+
+
+class AnswerFormatter:
+    """
+    The bullet/sentence clean-up of model output, applied line by line so
+    it works the same on a complete answer and on a token stream. Bullet
+    style keeps step/bullet lines, drops title echoes, stops at the next
+    section header and de-duplicates. Sentence style joins the lines,
+    dropping any that repeat the section title.
+    """
+
+    def __init__(self, style, title, stream=False):
+        self.style = style
+        self.title = title.lower()
+        self.stream = stream
+        self._raw = ""
+        self._done_lines = 0
+        self._stopped = False
+        self._seen = set()
+        self._emitted = False
+        self._released = 0  # sentence style: chars of the current line already sent
+
+    def feed(self, delta):
+        """Add model output; returns the text that is now final."""
+        self._raw += delta
+        return self._bullet(final=False) if self.style == "bullet" else self._sentence(final=False)
+
+    def finish(self):
+        return self._bullet(final=True) if self.style == "bullet" else self._sentence(final=True)
+
+    def _emit(self, text):
+        if not self._emitted:
+            text = text.lstrip()
+        if text:
+            self._emitted = True
+        return text
+
+    def _bullet(self, final):
+        # Split on any "Step n:" or "•"; every line but the last is complete
+        text = BULLET_RE.sub(r"\n•", STEP_RE.sub(r"\n• \1", self._raw))
+        lines = text.split("\n")
+        ready = lines[self._done_lines:] if final else lines[self._done_lines:-1]
+        self._done_lines += len(ready)
+        out = []
+        for line in ready:
+            x = line.strip()
+            if self._stopped or not x or self.title in x.lower():
+                continue
+            # Stop at first line that looks like a new section header
+            if SECTION_HEADER_RE.match(x):
+                self._stopped = True
+                continue
+            # Only keep lines that look like bullets or steps
+            if not (x.startswith("•") or x.startswith("-") or STEP_START_RE.match(x)):
+                continue
+            if not x.startswith("•") and not x.startswith("-"):
+                x = "• " + x
+            # Deduplicate by the start of the line (first 30 chars, lowercased)
+            norm = WHITESPACE_RE.sub(" ", x[:30].lower()).strip()
+            if norm in self._seen or len(x) <= 10:
+                continue
+            self._seen.add(norm)
+            out.append(self._emit(("\n" if self._emitted else "") + x))
+        return "".join(out)
+
+    def _sentence(self, final):
+        out = []
+        while "\n" in self._raw:
+            line, self._raw = self._raw.split("\n", 1)
+            out.append(self._end_sentence_line(line))
+        if final:
+            out.append(self._end_sentence_line(self._raw))
+            self._raw = ""
+        elif self.stream:
+            line = self._raw
+            if self._released:
+                out.append(line[self._released:])
+                self._released = len(line)
+            elif len(line) > len(self.title) + STREAM_HOLD_CHARS and self.title not in line.lower():
+                # Long enough that it is clearly not a title echo: start streaming it
+                out.append(self._emit((" " if self._emitted else "") + line))
+                self._released = len(line)
+        return "".join(out)
+
+    def _end_sentence_line(self, line):
+        if self._released:
+            rest, self._released = line[self._released:], 0
+            return rest
+        if self.title in line.lower():
+            return ""
+        return self._emit((" " if self._emitted else "") + line)
+
+
+def format_answer(out, style, title):
+    fmt = AnswerFormatter(style, title)
+    return (fmt.feed(out.strip()) + fmt.finish()).strip()
+
+
+def section_fallback(target_section):
+    """The target section's text without its title, used when the model gives nothing usable."""
+    title = target_section["meta"].get("title", "").strip() if target_section else ""
+    section_text = target_section["text"] if target_section else ""
+    # Remove the title from the start if present
+    if section_text.startswith(title):
+        section_text = section_text[len(title):].strip()
+    return section_text.strip()
+
+
+# ---------------- EXTRACTIVE ANSWER ----------------
+ANSWER_MODE = os.getenv("ANSWER_MODE", "llm")  # "llm", "extractive", or "auto" (extractive when confident)
+ANSWER_MODES = ("llm", "extractive", "auto")
+EXTRACTIVE_SENTENCES = 4  # sentences kept when ranking by similarity
+EXTRACTIVE_MIN_SIMILARITY = 0.3  # cosine; with no sentence this close the question is unrelated
+EXTRACTIVE_MAX_STEPS = 8  # auto: longest step list answered without the LLM
+EXTRACTIVE_MAX_DISTANCE = 0.6  # auto: the top hit must be at least this close (cosine >= 0.7)
+SENTENCE_CACHE_SIZE = 20000  # sentence embeddings kept in memory for extractive ranking
+_sentence_vectors = {}
+_sentence_lock = threading.Lock()
+
+
+def _clean_sentence(sentence):
+    return WHITESPACE_RE.sub(" ", sentence).strip(" •-")
+
+
+def _section_lines(hit):
+    """The section's sentences as answer lines: bullets stripped, title and empty lines dropped."""
+    title = hit["meta"].get("title", "").strip().lower()
+    lines = [_clean_sentence(s) for s in hit_sentences(hit)]
+    return [x for x in lines if x and x.lower() != title]
+
+
+def step_list(hit):
+    """The section's "Step n:" lines if it is mostly a step list, else None."""
+    lines = _section_lines(hit)
+    steps = [x for x in lines if STEP_START_RE.match(x)]
+    return steps if len(steps) >= 2 and 2 * len(steps) >= len(lines) else None
+
+
+def sentence_embeddings(sentences):
+    """Embeddings of the sentences, encoding only those not seen before."""
+    with _sentence_lock:
+        missing = list(dict.fromkeys(x for x in sentences if x not in _sentence_vectors))
+    if missing:
+        vectors = embed_texts(missing)
+        with _sentence_lock:
+            while _sentence_vectors and len(_sentence_vectors) + len(missing) > SENTENCE_CACHE_SIZE:
+                _sentence_vectors.pop(next(iter(_sentence_vectors)))  # oldest first
+            _sentence_vectors.update(zip(missing, vectors))
+    with _sentence_lock:
+        return [_sentence_vectors.get(x) for x in sentences]
+
+
+def rank_sentences(query_embedding, sections):
+    """[(similarity, section rank, position, sentence)] over the sections' lines, best first."""
+    candidates = [(rank, pos, line) for rank, hit in enumerate(sections)
+                  for pos, line in enumerate(_section_lines(hit))]
+    if not candidates:
+        return []
+    vectors = sentence_embeddings([line for _, _, line in candidates])
+    sims = np.asarray(vectors, dtype=np.float32) @ np.asarray(query_embedding, dtype=np.float32)
+    return sorted(((float(sim), rank, pos, line) for sim, (rank, pos, line) in zip(sims, candidates)),
+                  key=lambda c: (-c[0], c[1], c[2]))
+
+
+def extractive_confident(ctx):
+    """
+    auto mode: the target is a short step list within EXTRACTIVE_MAX_DISTANCE
+    of the question. A section-number match has no distance, so it goes to the LLM.
+    """
+    target = ctx["target"]
+    steps = step_list(target)
+    if not steps or len(steps) > EXTRACTIVE_MAX_STEPS:
+        return False
+    return target["score"] is not None and target["score"] <= EXTRACTIVE_MAX_DISTANCE
+
+
+def extractive_answer(ctx, query_embedding=None):
+    """
+    An answer built from the retrieved text alone. A target section that
+    is a step list is answered with all of its steps; otherwise the lines
+    of the top sections are ranked by embedding similarity to the query
+    and the best ones kept, in document order; if none reaches
+    EXTRACTIVE_MIN_SIMILARITY the question gets UNRELATED_ANSWER. Returns
+    (answer, sources), with one source per section quoted.
+    """
+    target = ctx["target"]
+    steps = step_list(target)
+    if steps:
+        picked = [(target, steps)]
+    else:
+        if query_embedding is None:
+            query_embedding = embed_query(ctx["query"])
+        ranked = rank_sentences(query_embedding, ctx["sections"])
+        keep = [c for c in ranked[:EXTRACTIVE_SENTENCES] if c[0] >= EXTRACTIVE_MIN_SIMILARITY]
+        if ranked and not keep:
+            return UNRELATED_ANSWER, []
+        by_section = {}
+        for _, rank, pos, line in keep:
+            by_section.setdefault(rank, []).append((pos, line))
+        picked = [(ctx["sections"][rank], [line for _, line in sorted(by_section[rank])])
+                  for rank in sorted(by_section)]
+    if not picked:  # a title-only section
+        return section_fallback(target), ctx["sources"][:1]
+
+    blocks = []
+    for hit, lines in picked:
+        block = "\n".join(f"• {x}" for x in lines) if ctx["style"] == "bullet" else " ".join(lines)
+        if len(picked) > 1:
+            block = f"From {hit['meta'].get('title', 'Unknown Section').strip()}:\n{block}"
+        blocks.append(block)
+    sources = [{"section": hit["meta"].get("title", "Unknown Section"), "preview": hit["text"][:200],
+                "agent": hit.get("agent", ctx["agent"])} for hit, _ in picked]
+    return ("\n\n" if ctx["style"] != "bullet" else "\n").join(blocks), sources
+
+
+def _answer_without_llm(ctx, mode, query_embedding):
+    """Fill in ctx["answer"] from the retrieved text when `mode` calls for it."""
+    if "messages" not in ctx:
+        return
+    if mode == "extractive" or (mode == "auto" and extractive_confident(ctx)):
+        with tracing.span("extractive") as sp:
+            ctx["answer"], ctx["sources"] = extractive_answer(ctx, query_embedding)
+            sp["sections"] = len(ctx["sources"])
+        tracing.annotate(answer_mode="extractive")
+    else:
+        tracing.annotate(answer_mode="llm")
+
+
+def _cache_style(style, mode, top_k=TOP_K):
+    """
+    Answers from different modes and top_k values are cached apart; plain
+    LLM answers with the default top_k keep their old keys.
+    """
+    if mode not in ANSWER_MODES:
+        raise ValueError(f"Unknown answer mode: {mode}")
+    key = style if mode == "llm" else f"{style}/{mode}"
+    return key if top_k == TOP_K else f"{key}/k{top_k}"
+
+
 # ---------------- MAIN ANSWER ----------------
-def answer_question(query, agent, style="bullet", top_k=TOP_K):
-    hits = retrieve(query, agent=agent, top_k=top_k)
-    hits = sorted(hits, key=lambda h: h["score"])  # lower score = more relevant
+LLM_MODEL = "gpt-4o-mini"  # or "gpt-4o" if you have quota
+LLM_PARAMS = {"model": LLM_MODEL, "max_tokens": 400, "temperature": 0}
+LLM_CONCURRENCY = 8  # answer_questions: LLM calls in flight at once
+STREAM_OPTIONS = {"include_usage": True}  # token counts arrive in the last streamed chunk
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "300"))  # excerpt tokens per prompt (WordPiece, approximate)
+CONTEXT_SECTIONS = 3  # top hits whose sentences compete for the budget
+CONTEXT_TARGET_SHARE = 0.6  # most of the budget the target may take while related sections compete
+CONTEXT_EXPAND = os.getenv("CONTEXT_EXPAND", "neighbors")  # split sections: "chunk", "neighbors" or "section"
+MAX_DISTANCE = 1.0  # vector distance above which a hit is not relevant
+SYSTEM_PROMPT = (
+    "You are an accurate assistant for employees. "
+    "ONLY use the provided excerpts. "
+    "Do not invent extra steps. "
+    "Stop after completing the last relevant step."
+)
+UNRELATED_ANSWER = "Sorry, that question is unrelated to the manual and cannot be answered."
+llm_calls = llm_guard.SingleFlight()  # identical prompts in flight share one upstream call
+
+
+def _start_answer(query, agent, style, top_k, use_cache, mode=ANSWER_MODE):
+    """
+    Everything before the LLM call: cache lookups, retrieval and prompt
+    assembly. Returns a dict with either a final "answer" (cache hit,
+    unrelated question or extractive answer) or the "messages" to send
+    plus what is needed to format and cache the reply.
+    """
+    cache_style = _cache_style(style, mode, top_k)
+    with tracing.span("collection"):
+        version = agent_version(agent)
+    tracing.annotate(cache="miss" if use_cache else "off")
+    if use_cache:
+        with tracing.span("cache_lookup"):
+            cached = get_answer_cache().get(agent, cache_style, query, version)
+        if cached:
+            tracing.annotate(cache="hit")
+            return {"answer": cached[0], "sources": cached[1]}
+
+    # A section-number match skips embedding entirely
+    with tracing.span("exact_match") as sp:
+        exact = exact_section(query, agent)
+        sp["matched"] = exact is not None
+    query_embedding = None
+    if exact is None:
+        with tracing.span("embed", texts=1):
+            query_embedding = embed_query(query)
+        if use_cache:
+            with tracing.span("cache_similar"):
+                cached = get_answer_cache().get_similar(agent, cache_style, version, query_embedding)
+            if cached:
+                tracing.annotate(cache="near_hit")
+                return {"answer": cached[0], "sources": cached[1]}
+    elif use_cache:
+        get_answer_cache().note_miss()
+
+    ctx = _build_prompt(query, agent, style, top_k, query_embedding, hits=[exact] if exact else None)
+    ctx.update(agent=agent, style=style, cache_style=cache_style, query=query, version=version,
+               embedding=query_embedding, use_cache=use_cache)
+    _answer_without_llm(ctx, mode, query_embedding)
+    if "answer" in ctx and use_cache:
+        get_answer_cache().put(agent, cache_style, query, version, ctx["answer"], ctx["sources"], embedding=query_embedding)
+    return ctx
+
+
+def _finish_answer(ctx, out, cacheable):
+    if ctx["use_cache"] and cacheable:
+        get_answer_cache().put(ctx["agent"], ctx["cache_style"], ctx["query"], ctx["version"],
+                         out, ctx["sources"], embedding=ctx["embedding"])
+    return out, ctx["sources"]
+
+
+def answer_question(query, agent, style="bullet", top_k=TOP_K, use_cache=True, mode=ANSWER_MODE):
+    """
+    (answer, source_ids) for a question. mode="extractive" answers from
+    the retrieved sentences without calling the LLM; "auto" does so only
+    when the top hit is a short step list matched with confidence.
+    """
+    with tracing.trace("answer", agent=agent, style=style):
+        ctx = _start_answer(query, agent, style, top_k, use_cache, mode)
+        if "answer" in ctx:
+            return ctx["answer"], ctx["sources"]
+
+        cacheable = True
+        try:
+            out = _complete(ctx)
+        except Exception as e:
+            out = _llm_failed(ctx, e)
+            cacheable = False
+        return _finish_answer(ctx, out, cacheable)
+
+
+def _flight_key(messages, stream=False):
+    return json.dumps({"messages": messages, "stream": stream, **LLM_PARAMS}, sort_keys=True)
+
+
+def _create(messages, stats, **kwargs):
+    """chat.completions.create with llm_guard's retries, backoff and circuit breaker."""
+    client = get_llm_client()
+    return llm_guard.call_with_retry(
+        lambda timeout: client.chat.completions.create(messages=messages, timeout=timeout, **LLM_PARAMS, **kwargs),
+        stats=stats)
+
+
+def _complete(ctx):
+    """One blocking LLM call for a prepared prompt; raises if the API call fails."""
+    with tracing.span("llm", model=LLM_MODEL) as sp:
+        response, sp["coalesced"] = llm_calls.do(_flight_key(ctx["messages"]),
+                                                 lambda: _create(ctx["messages"], sp))
+        _note_usage(sp, response.usage)
+        sp["finish_reason"] = response.choices[0].finish_reason
+    with tracing.span("format"):
+        out = format_answer(response.choices[0].message.content.strip(), ctx["style"], ctx["title"])
+    # If the answer is empty, show the full source section text as the answer
+    return out or _fallback(ctx)
+
+
+def _fallback(ctx):
+    tracing.annotate(fallback=True)
+    return section_fallback(ctx["target"])
+
+
+def _llm_failed(ctx, e):
+    """The answer when the LLM call failed; straight to the section text while the circuit is open."""
+    tracing.annotate(llm_error=type(e).__name__)
+    if isinstance(e, llm_guard.CircuitOpen):
+        return _fallback(ctx)
+    return format_answer(f"⚠️ OpenAI API call failed: {e}", ctx["style"], ctx["title"]) or _fallback(ctx)
+
+
+def _note_usage(sp, usage):
+    """Token counts on the span; only the caller that made the upstream call records them."""
+    if usage is not None and not sp.get("coalesced"):
+        sp["prompt_tokens"] = usage.prompt_tokens
+        sp["completion_tokens"] = usage.completion_tokens
+
+
+def answer_question_stream(query, agent, style="bullet", top_k=TOP_K, use_cache=True, mode=ANSWER_MODE):
+    """
+    Streaming answer_question. Returns (chunks, source_ids): sources are known
+    as soon as retrieval is done, and chunks yields answer text as the model
+    produces it, with the same clean-up applied line by line.
+    """
+    tr = tracing.start_trace("answer_stream", agent=agent, style=style)
+    with tracing.activate(tr):
+        ctx = _start_answer(query, agent, style, top_k, use_cache, mode)
+    if "answer" in ctx:
+        tr.finish()
+        return iter([ctx["answer"]]), ctx["sources"]
+
+    def chunks():
+        fmt = AnswerFormatter(style, ctx["title"], stream=True)
+        parts = []
+        cacheable = True
+        try:
+            with tr.span("llm", model=LLM_MODEL, stream=True) as sp:
+                # Identical prompts streaming at the same time replay one upstream stream
+                events, sp["coalesced"] = llm_calls.stream(
+                    _flight_key(ctx["messages"], stream=True),
+                    lambda: _create(ctx["messages"], sp, stream=True, stream_options=STREAM_OPTIONS))
+                for event in events:
+                    _note_usage(sp, event.usage)
+                    piece = fmt.feed(event.choices[0].delta.content or "") if event.choices else ""
+                    if piece:
+                        sp.setdefault("first_chunk_ms", tr.elapsed_ms())
+                        parts.append(piece)
+                        yield piece
+        except Exception as e:
+            tr.attrs["llm_error"] = type(e).__name__
+            cacheable = False
+            if not parts:
+                fmt = AnswerFormatter(style, ctx["title"], stream=True)
+                if not isinstance(e, llm_guard.CircuitOpen):  # open circuit: section text below
+                    fmt.feed(f"⚠️ OpenAI API call failed: {e}")
+        piece = fmt.finish()
+        if not "".join(parts + [piece]).strip():
+            tr.attrs["fallback"] = True
+            piece = section_fallback(ctx["target"])
+        if piece:
+            parts.append(piece)
+            yield piece
+        _finish_answer(ctx, "".join(parts).strip(), cacheable)
+        tr.finish()
+
+    return chunks(), ctx["sources"]
+
+
+async def answer_question_async(query, agent, style="bullet", top_k=TOP_K, use_cache=True, mode=ANSWER_MODE):
+    """answer_question on the async OpenAI client; retrieval runs in a worker thread."""
+    with tracing.trace("answer", agent=agent, style=style, mode="async"):
+        ctx = await asyncio.to_thread(_start_answer, query, agent, style, top_k, use_cache, mode)
+        if "answer" in ctx:
+            return ctx["answer"], ctx["sources"]
+
+        client = get_async_llm_client()
+        cacheable = True
+        try:
+            with tracing.span("llm", model=LLM_MODEL) as sp:
+                response, sp["coalesced"] = await llm_calls.ado(
+                    _flight_key(ctx["messages"]),
+                    lambda: llm_guard.acall_with_retry(
+                        lambda timeout: client.chat.completions.create(
+                            messages=ctx["messages"], timeout=timeout, **LLM_PARAMS),
+                        stats=sp))
+                _note_usage(sp, response.usage)
+            with tracing.span("format"):
+                out = format_answer(response.choices[0].message.content.strip(), style, ctx["title"])
+            out = out or _fallback(ctx)
+        except Exception as e:
+            out = _llm_failed(ctx, e)
+            cacheable = False
+        return _finish_answer(ctx, out, cacheable)
+
+
+async def answer_question_astream(query, agent, style="bullet", top_k=TOP_K, use_cache=True, mode=ANSWER_MODE):
+    """
+    Async streaming answer. `chunks, sources = await answer_question_astream(...)`,
+    then `async for piece in chunks`.
+    """
+    tr = tracing.start_trace("answer_stream", agent=agent, style=style, mode="async")
+    with tracing.activate(tr):
+        ctx = await asyncio.to_thread(_start_answer, query, agent, style, top_k, use_cache, mode)
+    if "answer" in ctx:
+        tr.finish()
+
+        async def cached():
+            yield ctx["answer"]
+        return cached(), ctx["sources"]
+
+    async def chunks():
+        fmt = AnswerFormatter(style, ctx["title"], stream=True)
+        parts = []
+        cacheable = True
+        try:
+            with tr.span("llm", model=LLM_MODEL, stream=True) as sp:
+                client = get_async_llm_client()
+                # Identical prompts streaming at the same time replay one upstream stream
+                events, sp["coalesced"] = llm_calls.astream(
+                    _flight_key(ctx["messages"], stream=True),
+                    lambda: llm_guard.acall_with_retry(
+                        lambda timeout: client.chat.completions.create(
+                            messages=ctx["messages"], stream=True, stream_options=STREAM_OPTIONS,
+                            timeout=timeout, **LLM_PARAMS),
+                        stats=sp))
+                async for event in events:
+                    _note_usage(sp, event.usage)
+                    piece = fmt.feed(event.choices[0].delta.content or "") if event.choices else ""
+                    if piece:
+                        sp.setdefault("first_chunk_ms", tr.elapsed_ms())
+                        parts.append(piece)
+                        yield piece
+        except Exception as e:
+            tr.attrs["llm_error"] = type(e).__name__
+            cacheable = False
+            if not parts:
+                fmt = AnswerFormatter(style, ctx["title"], stream=True)
+                if not isinstance(e, llm_guard.CircuitOpen):  # open circuit: section text below
+                    fmt.feed(f"⚠️ OpenAI API call failed: {e}")
+        piece = fmt.finish()
+        if not "".join(parts + [piece]).strip():
+            tr.attrs["fallback"] = True
+            piece = section_fallback(ctx["target"])
+        if piece:
+            parts.append(piece)
+            yield piece
+        _finish_answer(ctx, "".join(parts).strip(), cacheable)
+        tr.finish()
+
+    return chunks(), ctx["sources"]
+
+
+def answer_questions(queries, agent, style="bullet", top_k=TOP_K, use_cache=True,
+                     max_concurrency=LLM_CONCURRENCY, mode=ANSWER_MODE):
+    """
+    Answer a batch of questions: one embedding pass and one Chroma query
+    for the whole list, identical questions answered once, and at most
+    `max_concurrency` LLM calls in flight. Returns
+    [{"query", "answer", "sources", "error"}] in input order; a failed
+    item has answer None and the error message (the section text instead
+    of None while the circuit breaker is open).
+    """
+    with tracing.trace("answer_batch", agent=agent, style=style, queries=len(queries)):
+        return _answer_batch(queries, agent, style, top_k, use_cache, max_concurrency, mode)
+
+
+def _answer_batch(queries, agent, style, top_k, use_cache, max_concurrency, mode):
+    results = [{"query": q, "answer": None, "sources": [], "error": None} for q in queries]
+    cache_style = _cache_style(style, mode, top_k)
+    version = agent_version(agent)
+
+    # Questions that normalize the same share cache entries, so answer them once
+    groups = {}
+    for i, q in enumerate(queries):
+        groups.setdefault(normalize_query(q), []).append(i)
+    first = {key: queries[idxs[0]] for key, idxs in groups.items()}
+
+    def settle(key, answer, sources, error=None):
+        for i in groups[key]:
+            results[i].update(answer=answer, sources=sources, error=error)
+
+    pending = []
+    for key, q in first.items():
+        cached = get_answer_cache().get(agent, cache_style, q, version) if use_cache else None
+        if cached:
+            settle(key, *cached)
+        else:
+            pending.append(key)
+
+    # Section-number matches skip embedding; the rest are embedded together
+    to_embed = [key for key in pending if exact_section(first[key], agent) is None]
+    embeddings = dict(zip(to_embed, embed_texts([first[key] for key in to_embed])))
+    if use_cache:
+        remaining = []
+        for key in pending:
+            if key in embeddings:
+                cached = get_answer_cache().get_similar(agent, cache_style, version, embeddings[key])
+                if cached:
+                    settle(key, *cached)
+                    continue
+            else:
+                get_answer_cache().note_miss()
+            remaining.append(key)
+        pending = remaining
+
+    hit_lists = retrieve_many([first[key] for key in pending], agent, top_k,
+                              [embeddings.get(key) for key in pending])
+    ctxs = {}
+    for key, hits in zip(pending, hit_lists):
+        ctx = _build_prompt(first[key], agent, style, top_k, embeddings.get(key), hits=hits)
+        ctx.update(agent=agent, style=style, cache_style=cache_style, query=first[key], version=version,
+                   embedding=embeddings.get(key), use_cache=use_cache)
+        _answer_without_llm(ctx, mode, embeddings.get(key))
+        if "answer" in ctx:  # unrelated question or extractive answer, no LLM call needed
+            settle(key, *_finish_answer(ctx, ctx["answer"], True))
+        else:
+            ctxs[key] = ctx
+    if not ctxs:
+        return results
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(ctxs)))) as pool:
+        # Each worker runs in a copy of this context so its llm spans join the batch trace
+        futures = {key: pool.submit(contextvars.copy_context().run, _complete, ctx)
+                   for key, ctx in ctxs.items()}
+        for key, fut in futures.items():
+            try:
+                settle(key, *_finish_answer(ctxs[key], fut.result(), True))
+            except llm_guard.CircuitOpen as e:
+                settle(key, section_fallback(ctxs[key]["target"]), ctxs[key]["sources"], f"CircuitOpen: {e}")
+            except Exception as e:
+                settle(key, None, ctxs[key]["sources"], f"{type(e).__name__}: {e}")
+    return results
+
+
+def _context_units(hit):
+    """
+    A section's sentences as packing units [(positions, sentences)]: its
+    "Step n:" lines together as one unit when it has a step list, so the
+    steps go in whole or not at all, and every other sentence on its own.
+    """
+    sentences = hit_sentences(hit)
+    steps = [i for i, x in enumerate(sentences) if STEP_START_RE.match(x.lstrip(" •-"))]
+    if len(steps) < 2:
+        steps = []
+    units = [(steps, [sentences[i] for i in steps])] if steps else []
+    units += [([i], [x]) for i, x in enumerate(sentences) if i not in steps]
+    return units
+
+
+def pack_context(query, agent, hits, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Pick the sentences for the prompt from the top hits within `budget`
+    tokens. Sentences (a step list counts as one) score by idf-weighted
+    overlap with the query plus a prior for their hit's rank, and are
+    taken greedily, best first. The target section (hits[0]) may use at
+    most CONTEXT_TARGET_SHARE of the budget while related sections want
+    some; whatever they leave goes back to it. Other sections only take
+    part if they share a query term. Returns ([(hit, sentences in
+    document order)], tokens used).
+    """
+    index = agent_lexical_index(agent)
+    idf = index.idf if index else {}
+    query_terms = set(lexical_index.tokenize(query))
+    query_weight = sum(idf.get(t, 1.0) for t in query_terms) or 1.0
+
+    candidates = []
+    for rank, hit in enumerate(hits[:CONTEXT_SECTIONS]):
+        scored = []
+        for positions, sentences in _context_units(hit):
+            shared = query_terms.intersection(t for x in sentences for t in lexical_index.tokenize(x))
+            scored.append((sum(idf.get(t, 1.0) for t in shared) / query_weight, positions, sentences))
+        if rank and not any(overlap for overlap, _, _ in scored):
+            continue  # a lower-ranked section must share at least one query term
+        prior = 2.0 if rank == 0 else 1.0 / (rank + 1)
+        candidates += [(overlap + prior, rank, positions, sentences, sum(count_tokens(x) for x in sentences))
+                       for overlap, positions, sentences in scored]
+    candidates.sort(key=lambda c: (-c[0], c[1], c[2][0]))
+
+    related = any(rank for _, rank, _, _, _ in candidates)
+    target_cap = int(budget * CONTEXT_TARGET_SHARE) if related else budget
+    chosen = {}
+    used = {"all": 0, "target": 0}
+
+    def take(candidate):
+        _, rank, positions, sentences, cost = candidate
+        chosen.setdefault(rank, []).extend(zip(positions, sentences))
+        used["all"] += cost
+        if rank == 0:
+            used["target"] += cost
+
+    left = []
+    for c in candidates:
+        cost = c[4]
+        if used["all"] + cost <= budget and (c[1] or used["target"] + cost <= target_cap):
+            take(c)
+        else:
+            left.append(c)
+    for c in left:  # budget the related sections did not use goes back to the target
+        if used["all"] + c[4] <= budget:
+            take(c)
+    if 0 not in chosen:
+        # Nothing of the target fits: keep its best sentence (or step list) anyway
+        best = next((c for c in candidates if c[1] == 0), None)
+        if best is not None:
+            take(best)
+    return [(hits[rank], [x for _, x in sorted(chosen[rank])]) for rank in sorted(chosen)], used["all"]
+
+
+def _build_prompt(query, agent, style, top_k, query_embedding, hits=None):
+    """
+    Retrieval plus prompt assembly. Returns {"answer", "sources"} for
+    unrelated questions, else {"messages", "target", "title", "sources"}.
+    """
+    if hits is None:
+        hits = retrieve(query, agent=agent, top_k=top_k, query_embedding=query_embedding)
+    if agent == AUTO_AGENT and hits:
+        # Answer as the agent whose manual holds the best match, from that manual only
+        agent = hits[0]["agent"]
+        hits = [h for h in hits if h["agent"] == agent]
+        tracing.annotate(routed_agent=agent)
+
+    with tracing.span("prompt", hits=len(hits)) as sp:
+        ctx = _assemble_prompt(query, agent, style, hits)
+        sp["unrelated"] = "messages" not in ctx
+    ctx["routed_agent"] = agent
+    if "messages" not in ctx:
+        tracing.annotate(unrelated=True)
+    return ctx
+
+
+def _assemble_prompt(query, agent, style, hits):
+    if not hits:  # also covers agent="auto", which is only routed once there is a hit
+        return {"answer": UNRELATED_ANSWER, "sources": []}
 
     # Deduplicate documents by text
     seen_texts = set()
@@ -95,43 +1177,24 @@ def answer_question(query, agent, style="bullet", top_k=TOP_K):
             unique_hits.append(h)
             seen_texts.add(text)
 
-    hits = unique_hits
-
-    # If no hits or the top hit is not relevant, return custom message
-    if not hits or hits[0]["score"] > 1.0:  # adjust threshold as needed
-        return "Sorry, that question is unrelated to the manual and cannot be answered.", []
-
-    # Find the most relevant section (e.g., "Latte")
-    target_section = None
-    for h in hits:
-        title = h["meta"].get("title", "").lower()
-        if "latte" in query.lower() and "latte" in title:
-            target_section = h
-            break
-    if not target_section:
-        target_section = hits[0] if hits else None
-
-    # Only extract sentences from the target section
-    extracted = []
-    if target_section:
-        sents = split_sentences(target_section["text"])
-        # Remove section title if present
-        title = target_section["meta"].get("title", "").strip()
-        sents = [s for s in sents if s.strip() and s.strip() != title]
-        for s in sents:
-            extracted.append((0, s))
+    hits = expand_hits(unique_hits, agent, CONTEXT_EXPAND)
 
-    if not extracted:
-        extracted = [(0, split_sentences(hits[0]["text"])[0])] if hits else []
+    # If no hits or even the closest vector hit is not relevant, return custom message;
+    # a section the question names by number is relevant without a distance
+    distances = [h["score"] for h in hits if h["score"] is not None]
+    named = bool(hits) and hits[0]["match"] == "section"
+    if not hits or (not named and min(distances, default=float("inf")) > MAX_DISTANCE):
+        return {"answer": UNRELATED_ANSWER, "sources": []}
 
-    pieces = []
-    seen = set()
-    for hit_idx, s in extracted:
-        if s not in seen:
-            pieces.append((hit_idx, s))
-            seen.add(s)
+    # retrieve() already ranks by fused relevance (or returns the exact section match)
+    target_section = hits[0]
+    title = target_section["meta"].get("title", "").strip()
+    related = [h for h in hits[1:] if h["score"] is None or h["score"] <= MAX_DISTANCE]
+    packed, used = pack_context(query, agent, [target_section] + related)
+    if not packed:  # a title-only section: no excerpts, but still the source
+        packed = [(target_section, [])]
+    tracing.annotate(context_tokens=used, context_sections=len(packed))
 
-    title = target_section["meta"].get("title", "").strip() if target_section else ""
     if style == "bullet":
         style_instr = (
             "Write the answer as Markdown bullet points. "
@@ -139,10 +1202,16 @@ def answer_question(query, agent, style="bullet", top_k=TOP_K):
             "Do not repeat or truncate items. "
             "Do not invent extra steps."
         )
-        context_text = "\n".join(f"• {s}" for _, s in pieces if s.strip() and s.strip() != title)
+        blocks = ["\n".join(f"• {s}" for s in sentences) for _, sentences in packed]
     else:
         style_instr = "Write the answer in 2-3 short paragraphs. Keep exact numbers and steps."
-        context_text = " ".join(s for _, s in pieces if s.strip() and s.strip() != title)
+        blocks = [" ".join(sentences) for _, sentences in packed]
+    if len(packed) == 1:
+        context_text = blocks[0]
+    else:
+        # Name each section so the model can tell where an excerpt comes from
+        context_text = "\n".join(f"From {hit['meta'].get('title', 'Unknown Section').strip()}:\n{block}"
+                                  for (hit, _), block in zip(packed, blocks))
 
     prompt = f"""You are an accurate assistant {agent.upper()}, an assistant for employees.
 ONLY use the excerpts below to answer the question.
@@ -156,86 +1225,27 @@ Excerpts:
 Answer format: {style_instr}
 """
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",   # or "gpt-4o" if you have quota
-            messages=[
-                {
-                "role": "system",
-                "content": (
-                    "You are an accurate assistant for employees. "
-                    "ONLY use the provided excerpts. "
-                    "Do not invent extra steps. "
-                    "Stop after completing the last relevant step."
-                )
-            },
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=400,
-            temperature=0
-        )
-        out = response.choices[0].message.content.strip()
-    except Exception as e:
-        out = f"⚠️ OpenAI API call failed: {e}"
-
-
-    # Try to split steps if model outputs in a single line
-    if style == "bullet":
-        # Split on any "Step n:" or "•"
-        out = re.sub(r"(Step \d+:)", r"\n• \1", out)
-        out = re.sub(r"(•)", r"\n•", out)
-        lines = [line.strip() for line in out.split("\n") if line.strip()]
-        title = target_section["meta"].get("title", "").strip() if target_section else ""
-        lines = [line for line in lines if title.lower() not in line.lower()]
-        # Stop at first line that looks like a new section header (starts with number and dot)
-        section_header_pattern = re.compile(r"^\d+(\.\d+)*\s*[\.:]")
-        filtered = []
-        for x in lines:
-            if section_header_pattern.match(x):
-                break
-            # Only keep lines that look like bullets or steps
-            if x.startswith("•") or x.startswith("-") or re.match(r"Step \d+:", x):
-                filtered.append(x)
-        # Add bullet if missing
-        for i, line in enumerate(filtered):
-            if not line.startswith("•") and not line.startswith("-"):
-                filtered[i] = "• " + line
-        # Improved deduplication: match by the start of the line (first 30 chars, lowercased)
-        seen = set()
-        deduped = []
-        for x in filtered:
-            norm = re.sub(r'\s+', ' ', x[:30].lower()).strip()
-            if norm not in seen and len(x) > 10:
-                deduped.append(x)
-                seen.add(norm)
-        out = "\n".join(deduped)
-    elif style == "sentence":
-        title = target_section["meta"].get("title", "").strip() if target_section else ""
-        out_lines = [line for line in out.split("\n") if title.lower() not in line.lower()]
-        out = " ".join(out_lines).strip()
-
-    # Collect source section titles
-    source_ids = []
-    title = target_section["meta"].get("title", "Unknown Section") if target_section else "Unknown Section"
-    preview = target_section["text"][:200] if target_section else ""
-    source_ids.append({"section": title, "preview": preview})
-
-    # If the answer is empty, show the full source section text as the answer
-    if not out.strip():
-        # Use the entire target section text, skipping the title if present
-        title = target_section["meta"].get("title", "").strip() if target_section else ""
-        section_text = target_section["text"] if target_section else ""
-        # Remove the title from the start if present
-        if section_text.startswith(title):
-            section_text = section_text[len(title):].strip()
-        out = section_text.strip()
-
-    return out.strip(), source_ids
+    # Collect source section titles, one per section in the context
+    source_ids = [{
+        "section": hit["meta"].get("title", "Unknown Section"),
+        "preview": hit["text"][:200],
+        "agent": hit.get("agent", agent),
+    } for hit, _ in packed]
+    return {
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        "target": target_section,
+        "title": title,
+        "sources": source_ids,
+        "sections": ([target_section] + related)[:CONTEXT_SECTIONS],
+    }
 
 
 # ---------------- INTERACTIVE ----------------
 if __name__ == "__main__":
-    agent_choice = input("Choose agent (arai/jai/kai): ").strip().lower()
+    agent_choice = input("Choose agent (arai/jai/kai/auto, Enter for auto): ").strip().lower() or AUTO_AGENT
     q = input("Enter your question: ")
     style_choice = input("Answer style? (bullet/sentence): ").strip().lower()
 
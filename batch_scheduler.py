@@ -0,0 +1,166 @@
+# batch_scheduler.py
+"""
+Solve many branch schedules in parallel.
+
+    python batch_scheduler.py availability_dir/ --out schedules/
+    python batch_scheduler.py branches.csv --out schedules/ --mode cpsat --timeout 120
+
+The source is either a directory of per-branch availability CSVs (the
+branch name is the file stem) or a manifest: a CSV with `branch,path`
+columns or a JSON object mapping branch -> path.
+"""
+import argparse
+import json
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from scheduler import CPSAT_TIME_LIMIT, solve_schedule
+
+# ---------------- CONFIG ----------------
+JOB_TIMEOUT = 120  # seconds per branch
+SOLVER_WORKERS = 1  # CP-SAT threads per branch; the pool already runs one branch per core
+SUMMARY_FILE = "summary.csv"
+# ----------------------------------------
+
+
+def discover_jobs(source):
+    """Branch name -> availability CSV path, from a directory or a manifest file."""
+    source = Path(source)
+    if source.is_dir():
+        return {p.stem: str(p) for p in sorted(source.glob("*.csv"))}
+    if source.suffix.lower() == ".json":
+        with open(source, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    elif source.suffix.lower() == ".csv":
+        manifest = pd.read_csv(source)
+        entries = dict(zip(manifest["branch"].astype(str), manifest["path"]))
+    else:
+        raise ValueError(f"Unsupported manifest format: {source}")
+    # Relative paths in a manifest are relative to the manifest itself
+    return {str(b): str((source.parent / p) if not Path(p).is_absolute() else Path(p))
+            for b, p in entries.items()}
+
+
+def _on_timeout(signum, frame):
+    raise TimeoutError("job timed out")
+
+
+def _summary_row(branch, **values):
+    """A summary row with every column present, so failed branches keep the report's shape."""
+    row = {"branch": branch, "status": "ok", "employees": 0, "shifts": 0, "filled": 0,
+           "unfilled": 0, "coverage": 0.0, "unfilled_shifts": "", "solver_status": "",
+           "seconds": 0.0, "output": "", "error": ""}
+    row.update(values)
+    return row
+
+
+def _solve_branch(branch, path, out_dir, mode, time_limit, seed, timeout, solver_workers=SOLVER_WORKERS):
+    """Runs in a worker process. Returns one summary row."""
+    start = time.perf_counter()
+    row = _summary_row(branch)
+    # Hard per-job limit where the platform supports SIGALRM (not on Windows);
+    # setitimer takes fractional seconds, alarm() would turn 0.5 into "no limit"
+    use_alarm = timeout and hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, float(timeout))
+    try:
+        avail_df = pd.read_csv(path, encoding="utf-8-sig")
+        schedule = solve_schedule(avail_df, seed=seed, mode=mode, time_limit=time_limit,
+                                  workers=solver_workers)
+        out_path = os.path.join(out_dir, f"{branch}_schedule.csv")
+        schedule.to_csv(out_path, index=True)
+
+        filled = schedule.to_numpy().any(axis=0)
+        row.update(
+            employees=len(schedule.index),
+            shifts=len(schedule.columns),
+            filled=int(filled.sum()),
+            unfilled=int((~filled).sum()),
+            coverage=round(float(filled.mean()) if len(filled) else 1.0, 4),
+            unfilled_shifts=";".join(schedule.columns[~filled]),
+            solver_status=schedule.attrs["solver"]["status"],
+            output=out_path,
+        )
+    except TimeoutError:
+        row.update(status="timeout", error=f"exceeded {timeout}s")
+    except Exception as e:
+        row.update(status="error", error=f"{type(e).__name__}: {e}")
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    row["seconds"] = round(time.perf_counter() - start, 3)
+    return row
+
+
+def solve_branches(jobs, out_dir, workers=None, timeout=JOB_TIMEOUT, mode="greedy",
+                   time_limit=None, seed=None, solver_workers=SOLVER_WORKERS):
+    """
+    Solve {branch: availability_csv} across a process pool, writing
+    <branch>_schedule.csv files and summary.csv into out_dir. Each branch
+    runs CP-SAT with `solver_workers` threads, so workers x solver_workers
+    should not exceed the cores. Returns the summary as a DataFrame, one
+    row per branch.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if time_limit is None:
+        # Leave the worker time to write its CSV before the hard timeout
+        time_limit = min(CPSAT_TIME_LIMIT, timeout * 0.8) if timeout else CPSAT_TIME_LIMIT
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {
+            pool.submit(_solve_branch, branch, path, out_dir, mode, time_limit, seed, timeout,
+                        solver_workers): branch
+            for branch, path in jobs.items()
+        }
+        for fut in as_completed(futures):
+            try:
+                row = fut.result()
+            except Exception as e:  # worker crashed before it could report
+                row = _summary_row(futures[fut], status="error", error=f"{type(e).__name__}: {e}")
+            rows.append(row)
+            mark = "✅" if row["status"] == "ok" else "⚠️"
+            print(f"{mark} {row['branch']}: {row['status']}"
+                  + (f", {row['filled']}/{row['shifts']} shifts filled" if row["status"] == "ok" else f" ({row['error']})"))
+
+    summary = pd.DataFrame(rows).sort_values("branch").reset_index(drop=True)
+    summary.to_csv(os.path.join(out_dir, SUMMARY_FILE), index=False)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve schedules for many branches in parallel.")
+    parser.add_argument("source", help="directory of availability CSVs, or a .csv/.json manifest")
+    parser.add_argument("--out", default="schedules", help="output directory")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--timeout", type=float, default=JOB_TIMEOUT, help="seconds per branch")
+    parser.add_argument("--mode", choices=["greedy", "cpsat"], default="greedy")
+    parser.add_argument("--time-limit", type=float, default=None, help="CP-SAT time limit per branch")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--solver-workers", type=int, default=SOLVER_WORKERS,
+                        help="CP-SAT threads per branch (default: 1, one branch per core)")
+    args = parser.parse_args()
+
+    jobs = discover_jobs(args.source)
+    if not jobs:
+        print(f"❌ No availability files found in {args.source}")
+        return 1
+    print(f"📅 Scheduling {len(jobs)} branches ({args.mode})")
+    start = time.perf_counter()
+    summary = solve_branches(jobs, args.out, workers=args.workers, timeout=args.timeout,
+                             mode=args.mode, time_limit=args.time_limit, seed=args.seed,
+                             solver_workers=args.solver_workers)
+    ok = summary[summary["status"] == "ok"]
+    print(f"\n📊 {len(ok)}/{len(summary)} branches solved in {time.perf_counter() - start:.1f}s, "
+          f"{int(ok['unfilled'].sum())} shifts unfilled. Summary: {os.path.join(args.out, SUMMARY_FILE)}")
+    return 0 if len(ok) == len(summary) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
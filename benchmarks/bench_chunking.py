@@ -0,0 +1,112 @@
+# bench_chunking.py
+"""
+Index size and prompt size with child chunks versus one document per
+section.
+
+    python benchmarks/bench_chunking.py [--chunk-tokens N] [--expand MODE] [extra_manual.pdf ...]
+
+The bundled manuals (plus any extra manuals given, which only count
+towards the index size) are ingested twice into temp dirs: once with
+chunk_tokens=0, the one-doc-per-section layout, and once chunked. For
+each layout it reports the stored rows and bytes on disk, and over
+golden_questions.json the recall@1 of retrieval and the tokens of the
+prompt sent to the LLM.
+
+The embedding model must be available locally (or downloadable).
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("RAG_TRACE_FILE", "")
+
+from bench_suite import GOLDEN_FILE, MANUALS, section_number
+
+
+def collection_names(extra):
+    names = {f"{agent}_collection": str(ROOT / path) for agent, path in MANUALS.items()}
+    for path in extra:
+        names[re.sub(r"[^a-z0-9]+", "_", Path(path).stem.lower()).strip("_") + "_collection"] = path
+    return names
+
+
+def build(persist_dir, manuals, chunk_tokens):
+    import data_ingest
+    docs_by_collection = {name: list(data_ingest.iter_sections(data_ingest.iter_manual_lines(path)))
+                          for name, path in manuals.items()}
+    data_ingest.build_all(docs_by_collection, persist_dir=persist_dir, incremental=False,
+                          chunk_tokens=chunk_tokens)
+
+
+def disk_bytes(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def stored_rows(persist_dir, manuals):
+    import collection_alias
+    import compact_index
+    return sum(len(compact_index.load_index(persist_dir, collection_alias.resolve(name, persist_dir)))
+               for name in manuals)
+
+
+def measure_prompts(golden):
+    import arai_rag
+    from text_utils import count_tokens
+
+    tokens = []
+    top1 = []
+    for agent, items in golden.items():
+        for item in items:
+            hits = arai_rag.retrieve(item["query"], agent)
+            top1.append(bool(hits) and section_number(hits[0]["meta"].get("title")) == item["section"])
+            ctx = arai_rag._build_prompt(item["query"], agent, "bullet", arai_rag.TOP_K, None, hits=hits)
+            if "messages" in ctx:
+                tokens.append(sum(count_tokens(m["content"]) for m in ctx["messages"]))
+    tokens.sort()
+    return {
+        "recall@1": sum(top1) / len(top1),
+        "prompt_tokens_mean": statistics.mean(tokens),
+        "prompt_tokens_p95": tokens[min(len(tokens) - 1, int(round(0.95 * (len(tokens) - 1))))],
+        "prompt_tokens_max": tokens[-1],
+    }
+
+
+def main():
+    import data_ingest
+    parser = argparse.ArgumentParser(description="Compare chunked and one-doc-per-section indexes.")
+    parser.add_argument("extra", nargs="*", help="more manuals to ingest (index size only)")
+    parser.add_argument("--chunk-tokens", type=int, default=data_ingest.CHUNK_TOKENS or 128)
+    parser.add_argument("--expand", default="neighbors", choices=["chunk", "neighbors", "section"])
+    args = parser.parse_args()
+
+    import arai_rag
+    arai_rag.CONTEXT_EXPAND = args.expand
+    manuals = collection_names(args.extra)
+    with open(GOLDEN_FILE, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+
+    results = {}
+    for label, chunk_tokens in (("per section", 0), (f"chunks ≤{args.chunk_tokens}", args.chunk_tokens)):
+        with tempfile.TemporaryDirectory() as persist_dir:
+            print(f"📦 Building '{label}' layout")
+            build(persist_dir, manuals, chunk_tokens)
+            arai_rag.PERSIST_DIR = persist_dir
+            stats = {"rows": stored_rows(persist_dir, manuals), "bytes": disk_bytes(persist_dir)}
+            stats.update(measure_prompts(golden))
+            results[label] = stats
+
+    print(f"\n{'layout':<16}{'rows':>7}{'size KB':>10}{'recall@1':>10}{'prompt mean':>13}{'p95':>7}{'max':>7}")
+    for label, r in results.items():
+        print(f"{label:<16}{r['rows']:>7}{r['bytes'] / 1024:>10.0f}{r['recall@1']:>10.3f}"
+              f"{r['prompt_tokens_mean']:>13.1f}{r['prompt_tokens_p95']:>7}{r['prompt_tokens_max']:>7}")
+
+
+if __name__ == "__main__":
+    main()
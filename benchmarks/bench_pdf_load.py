@@ -0,0 +1,71 @@
+# bench_pdf_load.py
+"""
+Compare the original single-core PDF loader with the parallel, streaming
+page pipeline in data_ingest on the manuals bundled with the repo.
+
+    python benchmarks/bench_pdf_load.py [--workers N] [--window N] [pdf ...]
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from PyPDF2 import PdfReader
+import data_ingest
+
+
+def legacy_load_pdf(path):
+    """The loader as it was before the page pipeline (one core, text += ...)."""
+    reader = PdfReader(path)
+    text = ""
+    for page in reader.pages:
+        text += (page.extract_text() or "") + "\n"
+    return text
+
+
+def legacy_sections(path):
+    return data_ingest.split_by_sections(legacy_load_pdf(path))
+
+
+def streaming_sections(path, workers, window):
+    lines = (line for page in data_ingest.iter_pdf_pages(path, workers=workers, window=window)
+             for line in page.split("\n"))
+    return list(data_ingest.iter_sections(lines))
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--workers", type=int, default=data_ingest.PDF_WORKERS)
+    parser.add_argument("--window", type=int, default=data_ingest.PDF_WINDOW)
+    args = parser.parse_args()
+
+    pdfs = args.pdfs or sorted(str(p) for p in ROOT.glob("*.pdf"))
+    print(f"{'file':<24}{'pages':>7}{'legacy s':>11}{'stream s':>11}{'speedup':>9}"
+          f"{'legacy MB':>11}{'stream MB':>11}{'sections':>10}")
+    for path in pdfs:
+        pages = len(PdfReader(path).pages)
+        old, t_old, m_old = measure(legacy_sections, path)
+        new, t_new, m_new = measure(streaming_sections, path, args.workers, args.window)
+        same = "" if [d["content"] for d in old] == [d["content"] for d in new] else "  (differs!)"
+        print(f"{Path(path).name[:23]:<24}{pages:>7}{t_old:>11.2f}{t_new:>11.2f}{t_old / t_new:>8.1f}x"
+              f"{m_old / 1e6:>11.1f}{m_new / 1e6:>11.1f}{len(new):>10}{same}")
+    print("\nMemory is the parent process peak (tracemalloc); worker processes are not included.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# bench_scheduler.py
+"""
+Time scheduler.solve_schedule on synthetic rosters and check that it makes
+the same assignments as the original per-cell pandas loop.
+
+    python benchmarks/bench_scheduler.py [--sizes 4x14,200x56,5000x400] [--legacy-max 300]
+    python benchmarks/bench_scheduler.py --mode cpsat --time-limit 10 --sizes 50x56,500x200
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import scheduler
+
+
+def synthetic_availability(n_employees, n_shifts, density=0.5, seed=0):
+    """Random availability frame in the same layout as schedule.csv."""
+    rng = np.random.default_rng(seed)
+    days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+    shifts = [f"{days[i % 7]}_{i // 7:03d}" for i in range(n_shifts)]
+    df = pd.DataFrame((rng.random((n_employees, n_shifts)) < density).astype(int), columns=shifts)
+    df.insert(0, "MaxHoursPerWeek", rng.integers(8, 41, n_employees))
+    df.insert(0, "Employee", [f"E{i:05d}" for i in range(n_employees)])
+    return df
+
+
+def legacy_solve_schedule(avail_df):
+    """solve_schedule as it was before the NumPy engine."""
+    employees = avail_df['Employee'].tolist()
+    shifts = avail_df.columns[2:].tolist()
+    max_hours = dict(zip(employees, avail_df['MaxHoursPerWeek']))
+    schedule = pd.DataFrame(0, index=employees, columns=shifts)
+    random.shuffle(employees)
+    for s in shifts:
+        candidates = [e for e in employees
+                      if avail_df.loc[avail_df['Employee'] == e, s].values[0] == 1
+                      and schedule.loc[e].sum() < max_hours[e]]
+        if candidates:
+            chosen = min(candidates, key=lambda e: schedule.loc[e].sum())
+            schedule.loc[chosen, s] = 1
+    return schedule
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="4x14,50x14,200x56,1000x200,5000x400",
+                        help="comma-separated EMPLOYEESxSHIFTS")
+    parser.add_argument("--legacy-max", type=int, default=200,
+                        help="only run the legacy loop up to this many employees")
+    parser.add_argument("--mode", choices=["greedy", "cpsat"], default="greedy")
+    parser.add_argument("--time-limit", type=float, default=scheduler.CPSAT_TIME_LIMIT)
+    parser.add_argument("--density", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.mode == "cpsat":
+        return bench_cpsat(args)
+
+    print(f"{'size':>12}{'numpy s':>10}{'legacy s':>10}{'speedup':>9}{'filled':>10}  same")
+    for size in args.sizes.split(","):
+        n_emp, n_shifts = (int(x) for x in size.split("x"))
+        df = synthetic_availability(n_emp, n_shifts, density=args.density)
+        random.seed(42)
+        new, t_new = timed(scheduler.solve_schedule, df)
+        filled = int(new.to_numpy().sum())
+        if n_emp <= args.legacy_max:
+            random.seed(42)
+            old, t_old = timed(legacy_solve_schedule, df)
+            same = "yes" if old.equals(new) else "NO"
+            print(f"{size:>12}{t_new:>10.4f}{t_old:>10.2f}{t_old / t_new:>8.0f}x{filled:>10}  {same}")
+        else:
+            print(f"{size:>12}{t_new:>10.4f}{'-':>10}{'-':>9}{filled:>10}  -")
+
+
+def bench_cpsat(args):
+    """Greedy vs CP-SAT coverage, with the solver's time, objective and gap."""
+    print(f"{'size':>12}{'greedy':>8}{'cpsat':>8}{'status':>10}{'solve s':>9}{'objective':>12}{'gap':>8}")
+    for size in args.sizes.split(","):
+        n_emp, n_shifts = (int(x) for x in size.split("x"))
+        df = synthetic_availability(n_emp, n_shifts, density=args.density)
+        greedy = scheduler.solve_schedule(df, seed=42).attrs["solver"]
+        st = scheduler.solve_schedule(df, seed=42, mode="cpsat", time_limit=args.time_limit).attrs["solver"]
+        objective = "-" if st["objective"] is None else f"{st['objective']:.0f}"
+        gap = "-" if st["gap"] is None else f"{st['gap']:.2%}"
+        print(f"{size:>12}{greedy['covered']:>8}{st['covered']:>8}{st['status']:>10}"
+              f"{st['solve_time']:>9.2f}{objective:>12}{gap:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# bench_startup.py
+"""
+Cold-start and per-query handle overhead of the RAG stack.
+
+    python benchmarks/bench_startup.py [--cwd DIR] [--runs N] [--queries N]
+
+Each cold-start figure is measured in a fresh interpreter: importing
+arai_rag, and (if streamlit is installed) the first full script run of
+app.py through streamlit's AppTest harness. The handle figures time how
+long it takes to get a collection handle for a query, comparing the
+handle arai_rag uses with a brand-new PersistentClient per call.
+Run it from (or point --cwd at) a directory with a built ./chroma_db.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import arai_rag
+print(time.perf_counter() - start)
+"""
+
+APP_SNIPPET = """
+import time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+AppTest.from_file({app!r}, default_timeout=120).run()
+print(time.perf_counter() - start)
+"""
+
+
+def fresh_process(snippet, cwd):
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    env.setdefault("OPENAI_API_KEY", "bench")
+    out = subprocess.run([sys.executable, "-c", snippet], cwd=cwd, env=env,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def median_ms(values):
+    return statistics.median(values) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure RAG cold start and handle overhead.")
+    parser.add_argument("--cwd", default=str(ROOT), help="directory containing ./chroma_db")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per cold-start figure")
+    parser.add_argument("--queries", type=int, default=200, help="handle lookups to time")
+    args = parser.parse_args()
+
+    imports = [fresh_process(IMPORT_SNIPPET, args.cwd) for _ in range(args.runs)]
+    print(f"import arai_rag:        {median_ms(imports):8.1f} ms (median of {args.runs})")
+
+    try:
+        import streamlit  # noqa: F401
+    except ImportError:
+        print("app.py first run:       skipped (streamlit not installed)")
+    else:
+        snippet = APP_SNIPPET.format(app=str(ROOT / "app.py"))
+        runs = [fresh_process(snippet, args.cwd) for _ in range(args.runs)]
+        print(f"app.py first run:       {median_ms(runs):8.1f} ms (median of {args.runs})")
+
+    os.chdir(args.cwd)
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    import chromadb
+    import arai_rag
+
+    for agent in arai_rag.COLLECTION_MAP:
+        times = []
+        for _ in range(args.queries):
+            start = time.perf_counter()
+            arai_rag.agent_collection(agent)
+            times.append(time.perf_counter() - start)
+        print(f"agent_collection({agent!r}): {median_ms(times):8.3f} ms per query")
+
+    name = arai_rag.COLLECTION_MAP["arai"]
+    times = []
+    for _ in range(min(args.queries, 50)):
+        start = time.perf_counter()
+        chromadb.PersistentClient(path=arai_rag.PERSIST_DIR).get_collection(
+            name=arai_rag.collection_alias.resolve(name, arai_rag.PERSIST_DIR))
+        times.append(time.perf_counter() - start)
+    print(f"new PersistentClient + get_collection: {median_ms(times):8.3f} ms per query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+# bench_suite.py
+"""
+Offline benchmark and regression suite.
+
+    python benchmarks/bench_suite.py                       # run, compare with baseline.json
+    python benchmarks/bench_suite.py --update-baseline     # run and store as the new baseline
+    python benchmarks/bench_suite.py --only scheduler --threshold 0.5
+
+Three groups of metrics:
+  retrieval  recall@1/3/5 and MRR of arai_rag.retrieve on golden_questions.json,
+             over collections built from the bundled manuals in a temp dir
+  answer     end-to-end answer_question latency against the local fake LLM
+             (fake_openai.py), so no network or API key is needed, and in
+             mode="extractive" (no LLM call)
+  scheduler  solve_schedule time and coverage on synthetic rosters, 4 to 5,000 employees
+
+Results go to a JSON file (--out). With a baseline present, a time that
+grows by more than --threshold (relative, above a small noise floor) or a
+quality metric that drops by more than --quality-tolerance is a
+regression, and the exit status is 1. With --ci (or $CI set) a missing
+baseline is a failure too.
+
+baseline.json is committed and holds only machine-independent metrics
+(coverage, recall@k, MRR); --update-baseline merges this run's groups
+into it and keeps timings only with --with-times, which makes sense for
+a baseline kept on one machine.
+
+The embedding model must be available locally (or downloadable) for the
+retrieval and answer groups.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("RAG_TRACE_FILE", "")  # keep benchmark runs out of the trace log
+
+# ---------------- CONFIG ----------------
+GOLDEN_FILE = HERE / "golden_questions.json"
+RESULTS_FILE = HERE / "results.json"
+BASELINE_FILE = HERE / "baseline.json"
+MANUALS = {
+    "arai": "manual_chat.pdf",
+    "jai": "career_manual.txt",
+    "kai": "knowledge_manual.txt",
+}
+RECALL_AT = (1, 3, 5)
+ANSWER_REPEATS = 3
+SCHEDULER_SIZES = "4x14,50x56,500x200,2000x400,5000x400"
+SCHEDULER_REPEATS = 3
+THRESHOLD = 0.25  # allowed relative slowdown
+QUALITY_TOLERANCE = 0.0  # allowed absolute drop in recall/MRR/coverage
+NOISE_FLOOR_MS = 2.0  # time changes smaller than this never count
+# ----------------------------------------
+
+GROUPS = ("retrieval", "answer", "scheduler")
+
+
+def section_number(title):
+    import lexical_index
+    m = lexical_index.SECTION_NUMBER_RE.match(title or "")
+    return m.group(1) if m else None
+
+
+def build_collections(persist_dir):
+    """Ingest the bundled manuals into persist_dir."""
+    import data_ingest
+    docs_by_collection = {
+        f"{agent}_collection": list(data_ingest.iter_sections(data_ingest.iter_manual_lines(str(ROOT / path))))
+        for agent, path in MANUALS.items()
+    }
+    data_ingest.build_all(docs_by_collection, persist_dir=persist_dir, incremental=False)
+
+
+def bench_retrieval(golden):
+    import arai_rag
+    ranks = []
+    times = []
+    for agent, items in golden.items():
+        for item in items:
+            start = time.perf_counter()
+            hits = arai_rag.retrieve(item["query"], agent, top_k=max(RECALL_AT))
+            times.append((time.perf_counter() - start) * 1000)
+            found = [section_number(h["meta"].get("title")) for h in hits]
+            ranks.append(found.index(item["section"]) + 1 if item["section"] in found else None)
+            if ranks[-1] != 1:
+                print(f"   ↳ {agent}: {item['query']!r} expected {item['section']}, got {found[:3]}")
+
+    metrics = {f"retrieval.recall@{k}": sum(1 for r in ranks if r and r <= k) / len(ranks) for k in RECALL_AT}
+    metrics["retrieval.mrr"] = sum(1 / r for r in ranks if r) / len(ranks)
+    metrics["retrieval.p50_ms"] = statistics.median(times)
+    return metrics
+
+
+def bench_answer(golden):
+    import arai_rag
+    from openai import OpenAI
+    from fake_openai import FakeOpenAIServer
+
+    times = []
+    with FakeOpenAIServer() as server:
+        arai_rag._llm_client = OpenAI(base_url=server.base_url, api_key="fake")
+        for _ in range(ANSWER_REPEATS):
+            for agent, items in golden.items():
+                for item in items:
+                    start = time.perf_counter()
+                    arai_rag.answer_question(item["query"], agent, use_cache=False)
+                    times.append((time.perf_counter() - start) * 1000)
+        arai_rag._llm_client = None
+    times.sort()
+
+    extractive = []
+    for _ in range(ANSWER_REPEATS):
+        for agent, items in golden.items():
+            for item in items:
+                start = time.perf_counter()
+                arai_rag.answer_question(item["query"], agent, use_cache=False, mode="extractive")
+                extractive.append((time.perf_counter() - start) * 1000)
+    return {
+        "answer.p50_ms": statistics.median(times),
+        "answer.p95_ms": times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))],
+        "answer.extractive_p50_ms": statistics.median(extractive),
+    }
+
+
+def bench_scheduler(sizes):
+    import scheduler
+    from bench_scheduler import synthetic_availability
+
+    metrics = {}
+    for size in sizes.split(","):
+        n_emp, n_shifts = (int(x) for x in size.lower().split("x"))
+        avail_df = synthetic_availability(n_emp, n_shifts, seed=0)
+        times = []
+        for _ in range(SCHEDULER_REPEATS):
+            start = time.perf_counter()
+            schedule = scheduler.solve_schedule(avail_df, seed=0)
+            times.append((time.perf_counter() - start) * 1000)
+        metrics[f"scheduler.{size}.p50_ms"] = statistics.median(times)
+        metrics[f"scheduler.{size}.coverage"] = float(schedule.to_numpy().any(axis=0).mean())
+    return metrics
+
+
+def compare(metrics, baseline, threshold, quality_tolerance):
+    """Lines describing each regression against the baseline metrics."""
+    regressions = []
+    for name, base in sorted(baseline.items()):
+        if name not in metrics:
+            continue
+        value = metrics[name]
+        if name.endswith("_ms"):
+            if value - base > NOISE_FLOOR_MS and value > base * (1 + threshold):
+                regressions.append(f"{name}: {base:.2f} → {value:.2f} ms (+{(value / base - 1) * 100:.0f}%)")
+        elif base - value > quality_tolerance + 1e-9:
+            regressions.append(f"{name}: {base:.4f} → {value:.4f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and check for regressions.")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"comma-separated subset of {GROUPS}")
+    parser.add_argument("--out", default=str(RESULTS_FILE))
+    parser.add_argument("--baseline", default=str(BASELINE_FILE))
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--with-times", action="store_true",
+                        help="with --update-baseline: also store the (machine-dependent) timings")
+    parser.add_argument("--ci", action="store_true", default=bool(os.getenv("CI")),
+                        help="fail when there is no baseline to compare with (default when $CI is set)")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--quality-tolerance", type=float, default=QUALITY_TOLERANCE)
+    parser.add_argument("--scheduler-sizes", default=SCHEDULER_SIZES, help="comma-separated EMPLOYEESxSHIFTS")
+    args = parser.parse_args()
+
+    groups = [g.strip() for g in args.only.split(",") if g.strip()]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown group(s): {', '.join(sorted(unknown))}")
+
+    metrics = {}
+    with tempfile.TemporaryDirectory() as persist_dir:
+        if "retrieval" in groups or "answer" in groups:
+            with open(GOLDEN_FILE, "r", encoding="utf-8") as f:
+                golden = json.load(f)
+            import arai_rag
+            arai_rag.PERSIST_DIR = persist_dir
+            build_collections(persist_dir)
+            if "retrieval" in groups:
+                print("🔎 Retrieval")
+                metrics.update(bench_retrieval(golden))
+            if "answer" in groups:
+                print("💬 End-to-end answer latency (fake LLM)")
+                metrics.update(bench_answer(golden))
+        if "scheduler" in groups:
+            print("📅 Scheduler")
+            metrics.update(bench_scheduler(args.scheduler_sizes))
+
+    for name, value in metrics.items():
+        print(f"   {name:<34} {value:10.4f}")
+
+    result = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "metrics": metrics,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n💾 Results written to {args.out}")
+
+    if args.update_baseline:
+        stored = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                stored = json.load(f)["metrics"]
+        stored.update((k, v) for k, v in metrics.items() if args.with_times or not k.endswith("_ms"))
+        baseline = dict(result, metrics=dict(sorted(stored.items())))
+        tmp = f"{args.baseline}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        os.replace(tmp, args.baseline)
+        print(f"📌 Baseline updated: {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        if args.ci:
+            print(f"❌ No baseline at {args.baseline}; the regression gate cannot run.")
+            return 1
+        print(f"ℹ️ No baseline at {args.baseline}; run with --update-baseline to create one.")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["metrics"]
+    regressions = compare(metrics, baseline, args.threshold, args.quality_tolerance)
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) against {args.baseline}:")
+        for line in regressions:
+            print(f"   {line}")
+        return 1
+    print(f"✅ No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,66 @@
+# collection_alias.py
+import json
+import os
+import threading
+
+# ---------------- CONFIG ----------------
+ALIAS_FILE = "collection_aliases.json"
+# ----------------------------------------
+
+_lock = threading.Lock()
+_cache = {}  # persist_dir -> (mtime, aliases)
+
+
+def _alias_path(persist_dir):
+    return os.path.join(persist_dir, ALIAS_FILE)
+
+
+def load_aliases(persist_dir):
+    """Logical collection name -> physical Chroma collection name."""
+    path = _alias_path(persist_dir)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    with _lock:
+        cached = _cache.get(persist_dir)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, "r", encoding="utf-8") as f:
+            aliases = json.load(f)
+        _cache[persist_dir] = (mtime, aliases)
+        return aliases
+
+
+def logical_name(physical):
+    """The logical name of a versioned physical collection: "kai_collection__v17" -> "kai_collection"."""
+    base, sep, version = physical.rpartition("__v")
+    return base if sep and version.isdigit() else physical
+
+
+def evict_generations(cache, persist_dir, physical_name):
+    """
+    Drop cache entries keyed (persist_dir, physical) for other generations
+    of the same logical collection, once a newer one is being loaded.
+    Callers still holding an old entry keep it until they finish.
+    """
+    logical = logical_name(physical_name)
+    for key in [k for k in cache if k[0] == persist_dir and k[1] != physical_name
+                and logical_name(k[1]) == logical]:
+        del cache[key]
+
+
+def resolve(name, persist_dir):
+    """Physical collection behind a logical name; collections built before aliases resolve to themselves."""
+    return load_aliases(persist_dir).get(name, name)
+
+
+def set_alias(name, physical, persist_dir):
+    """Point a logical name at a physical collection. The file is swapped atomically."""
+    aliases = dict(load_aliases(persist_dir))
+    aliases[name] = physical
+    path = _alias_path(persist_dir)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(aliases, f, indent=2)
+    os.replace(tmp, path)
@@ -0,0 +1,164 @@
+# compact_index.py
+"""
+Compact, memory-mapped copy of a collection's section embeddings for
+exact in-process search without Chroma.
+
+Per physical collection, inside the Chroma persist dir:
+
+    compact/<physical>.npy        vectors, int8 (per-row scale) or float16
+    compact/<physical>.scale.npy  per-row scales (int8 only)
+    compact/<physical>.json       ids, documents, metadatas, dtype, version
+
+The .npy files are opened with mmap_mode="r", so every process serving
+the same collection shares one copy in the OS page cache.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+import collection_alias
+
+# ---------------- CONFIG ----------------
+INDEX_DIR = "compact"
+DTYPE = os.getenv("COMPACT_INDEX_DTYPE", "int8")  # "int8" or "float16"
+CHUNK_ROWS = 4096  # rows dequantized at a time, bounds the per-query scratch memory
+# ----------------------------------------
+
+
+def _paths(persist_dir, physical_name):
+    base = os.path.join(persist_dir, INDEX_DIR, physical_name)
+    return f"{base}.npy", f"{base}.scale.npy", f"{base}.json"
+
+
+def _save_npy(path, array):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def quantize(vectors, dtype=DTYPE):
+    """(stored matrix, per-row scales or None) for float32 vectors."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype != "int8":
+        raise ValueError(f"Unsupported compact index dtype: {dtype}")
+    scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0, np.float32)
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def save_index(persist_dir, physical_name, ids, documents, metadatas, embeddings,
+               version=None, dtype=DTYPE):
+    vec_path, scale_path, meta_path = _paths(persist_dir, physical_name)
+    os.makedirs(os.path.dirname(vec_path), exist_ok=True)
+    matrix, scales = quantize(embeddings, dtype)
+    _save_npy(vec_path, matrix)
+    if scales is not None:
+        _save_npy(scale_path, scales)
+    tmp = f"{meta_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"dtype": dtype, "version": version, "ids": list(ids),
+                   "documents": list(documents), "metadatas": list(metadatas)}, f)
+    os.replace(tmp, meta_path)  # written last: the index counts as present once this exists
+
+
+def has_index(persist_dir, physical_name):
+    return os.path.exists(_paths(persist_dir, physical_name)[2])
+
+
+def remove_index(persist_dir, physical_name):
+    for path in _paths(persist_dir, physical_name):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class CompactIndex:
+    """Exact top-k over the memory-mapped vectors; distances match Chroma's squared L2."""
+
+    def __init__(self, vectors, scales, ids, documents, metadatas, version=None):
+        self.vectors = vectors
+        self.scales = scales
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.version = version
+        self.section_rows = {}  # section id -> its rows: the section itself or its chunks
+        for row, (doc_id, meta) in enumerate(zip(ids, metadatas)):
+            self.section_rows.setdefault((meta or {}).get("parent_id", doc_id), []).append(row)
+
+    @classmethod
+    def load(cls, persist_dir, physical_name):
+        vec_path, scale_path, meta_path = _paths(persist_dir, physical_name)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(vec_path, mmap_mode="r")
+        scales = np.load(scale_path) if meta["dtype"] == "int8" else None
+        return cls(vectors, scales, meta["ids"], meta["documents"], meta["metadatas"], meta.get("version"))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def similarities(self, queries):
+        """Cosine similarity of every section to each query, shape (n_sections, n_queries)."""
+        q = np.asarray(queries, dtype=np.float32).T
+        out = np.empty((len(self.ids), q.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.ids), CHUNK_ROWS):
+            rows = slice(start, start + CHUNK_ROWS)
+            out[rows] = np.asarray(self.vectors[rows], dtype=np.float32) @ q
+        if self.scales is not None:
+            out *= self.scales[:, None]
+        return out
+
+    def section_distance(self, query_embedding, section_id):
+        """Distance from the query to the section's closest row, or None if it is not stored."""
+        rows = self.section_rows.get(section_id)
+        if not rows:
+            return None
+        sims = np.asarray(self.vectors[rows], dtype=np.float32) @ np.asarray(query_embedding, dtype=np.float32)
+        if self.scales is not None:
+            sims *= self.scales[rows]
+        return float(2.0 - 2.0 * sims.max())
+
+    def query(self, query_embeddings, n_results):
+        """Same shape as chromadb's Collection.query result (ids/documents/metadatas/distances)."""
+        res = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        k = min(n_results, len(self.ids))
+        if k == 0:
+            for key in res:
+                res[key] = [[] for _ in query_embeddings]
+            return res
+        sims = self.similarities(query_embeddings)
+        for col in range(sims.shape[1]):
+            scores = sims[:, col]
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            top = top[np.argsort(-scores[top], kind="stable")]
+            res["ids"].append([self.ids[i] for i in top])
+            res["documents"].append([self.documents[i] for i in top])
+            res["metadatas"].append([self.metadatas[i] for i in top])
+            # Normalized embeddings: squared L2 = 2 - 2cos, the distance Chroma reports
+            res["distances"].append([float(2.0 - 2.0 * scores[i]) for i in top])
+        return res
+
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def load_index(persist_dir, physical_name):
+    """Cached per physical collection; None when no compact index was built for it."""
+    key = (persist_dir, physical_name)
+    with _lock:
+        if key not in _loaded:
+            # A rebuild moved the alias on: drop older generations so their mmaps can be unmapped
+            collection_alias.evict_generations(_loaded, persist_dir, physical_name)
+            try:
+                _loaded[key] = CompactIndex.load(persist_dir, physical_name)
+            except OSError:
+                _loaded[key] = None
+        return _loaded[key]
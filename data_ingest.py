@@ -1,22 +1,73 @@
+import hashlib
+import json
+import os
 import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from PyPDF2 import PdfReader
-from sentence_transformers import SentenceTransformer
 from chromadb.config import Settings
 import chromadb
+import collection_alias
+import compact_index
+import lexical_index
+from text_utils import count_tokens, section_sentences
+from embeddings import EMB_MODEL_NAME, EMBED_BATCH_SIZE, embed_texts
 
 PERSIST_DIR = "./chroma_db"
-EMB_MODEL_NAME = "all-MiniLM-L6-v2"
+ADD_BATCH_SIZE = 1000
+PDF_WORKERS = os.cpu_count() or 1
+PDF_WINDOW = 32  # max pages extracted but not yet consumed
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "128"))  # child chunk size; 0 keeps one doc per section
+CHUNK_OVERLAP = 1  # sentences repeated at the start of the next chunk
+SECTION_TITLE_PATTERN = r"^(\d+(\.\d+)*)(\s+[A-Za-z].*)$"
+# Matched one line at a time, so the gap after the number must stay on the line
+# ([ \t]+); the old whole-text split used \s+, which could also span a newline
+SECTION_HEADER_PATTERN = r"^\d+(\.\d+)*[ \t]+[A-Za-z]"
 
+_worker_reader = None
+
+
+
+def _init_pdf_worker(path):
+    global _worker_reader
+    _worker_reader = PdfReader(path)
+
+
+def _extract_page(page_no):
+    return _worker_reader.pages[page_no].extract_text() or ""
+
+
+def iter_pdf_pages(path, workers=PDF_WORKERS, window=PDF_WINDOW):
+    """
+    Yield the text of each PDF page in order. Pages are extracted over a
+    process pool with at most `window` pages in flight, so memory stays
+    bounded no matter how large the document is.
+    """
+    reader = PdfReader(path)
+    n_pages = len(reader.pages)
+    if workers <= 1 or n_pages <= 1:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+    del reader  # each worker opens its own reader
+
+    with ProcessPoolExecutor(max_workers=min(workers, n_pages),
+                             initializer=_init_pdf_worker, initargs=(path,)) as pool:
+        in_flight = deque()
+        next_page = 0
+        while in_flight or next_page < n_pages:
+            while next_page < n_pages and len(in_flight) < window:
+                in_flight.append(pool.submit(_extract_page, next_page))
+                next_page += 1
+            yield in_flight.popleft().result()
 
 
 def load_pdf(path):
     """Load text from a PDF file."""
-    reader = PdfReader(path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
-    return text
+    return "".join(page + "\n" for page in iter_pdf_pages(path))
 
 def load_txt(path):
     """Load text from a TXT file."""
@@ -32,49 +83,272 @@ def load_manual(path):
     else:
         raise ValueError(f"Unsupported file format: {path}")
 
+def iter_manual_lines(path):
+    """Stream a manual line by line without building the whole document."""
+    if path.lower().endswith(".pdf"):
+        for page in iter_pdf_pages(path):
+            yield from page.split("\n")
+    elif path.lower().endswith(".txt"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield line.rstrip("\n")
+    else:
+        raise ValueError(f"Unsupported file format: {path}")
+
+def _make_section(lines):
+    sec = "\n".join(lines).strip()
+    if not sec:
+        return None
+    first = sec.splitlines()[0]
+    matches = re.match(SECTION_TITLE_PATTERN, first)
+    if matches:
+        section_num = matches.group(1)
+        title = matches.group(3).strip()
+        structured_line = f"{section_num} {title}"
+    else:
+        structured_line = first
+    # Precomputed once here so answering a question is a lookup, not a re-split
+    return {"title": structured_line, "content": sec,
+            "sentences": section_sentences(structured_line, sec)}
+
+def iter_sections(lines):
+    """
+    Group a stream of lines into numbered sections (e.g. 3.3.1 Latte,
+    2.4 Closing Checklist), yielding each one as soon as the next header
+    appears.
+    """
+    header = re.compile(SECTION_HEADER_PATTERN)
+    current = []
+    for line in lines:
+        if header.match(line) and current:
+            section = _make_section(current)
+            if section:
+                yield section
+            current = []
+        current.append(line)
+    section = _make_section(current)
+    if section:
+        yield section
+
 def split_by_sections(text):
     """
     Split manual by numbered sections (e.g., 3.3.1 Latte, 2.4 Closing Checklist).
-    Each section becomes one doc.
-    """
-    pattern = r"^(\d+(\.\d+)*)(\s+[A-Za-z].*)$"
-    sections = re.split(r"(?=^\d+(\.\d+)*\s+[A-Za-z].*$)", text, flags=re.MULTILINE)
-    grouped = []
-    for sec in sections:
-        sec = sec.strip()
-        if not sec:
+    Each section becomes one doc with its title, content and title-stripped
+    sentence/step list.
+    """
+    return list(iter_sections(text.split("\n")))
+
+
+def section_id(title, seen=None):
+    """
+    Stable ID from the section number and title, e.g. '3.3.1-latte'.
+    Repeated titles get a '#2', '#3', ... suffix in document order.
+    """
+    slug = re.sub(r"[^a-z0-9.]+", "-", title.lower()).strip("-") or "untitled"
+    if seen is None:
+        return slug
+    seen[slug] = seen.get(slug, 0) + 1
+    return slug if seen[slug] == 1 else f"{slug}#{seen[slug]}"
+
+
+def chunk_section(section, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    """
+    Split a section's sentences into child chunks of about `max_tokens`,
+    each starting with the last `overlap` sentences of the one before.
+    A section that already fits (or max_tokens=0) is a single chunk.
+    Returns one sentence list per chunk.
+    """
+    sentences = section["sentences"]
+    if not max_tokens or len(sentences) < 2 or count_tokens(section["content"]) <= max_tokens:
+        return [sentences]
+    chunks = []
+    current, used = [], 0
+    for s in sentences:
+        cost = count_tokens(s)
+        if current and used + cost > max_tokens:
+            chunks.append(current)
+            current = current[-overlap:] if overlap else []
+            used = sum(count_tokens(x) for x in current)
+        current.append(s)
+        used += cost
+    chunks.append(current)
+    return chunks
+
+
+def content_hash(doc):
+    return hashlib.sha1(f"{doc['title']}\n{doc['content']}".encode("utf-8")).hexdigest()
+
+
+def _add_in_batches(collection, ids, metadatas, documents, embeddings):
+    for i in range(0, len(ids), ADD_BATCH_SIZE):
+        batch = slice(i, i + ADD_BATCH_SIZE)
+        collection.add(ids=ids[batch], metadatas=metadatas[batch],
+                       documents=documents[batch], embeddings=embeddings[batch])
+
+
+def plan_vector_db(docs, collection_name, persist_dir=PERSIST_DIR, incremental=True,
+                   chunk_tokens=CHUNK_TOKENS):
+    """
+    Diff docs against the live collection. Sections are split into child
+    chunks (see chunk_section), which are what gets embedded; a section
+    that fits in one chunk keeps its section ID. The plan lists which
+    chunks need embedding (`to_embed`) and which can reuse stored vectors.
+    """
+    client = chromadb.PersistentClient(path=persist_dir)
+    current_name = collection_alias.resolve(collection_name, persist_dir)
+
+    seen = {}
+    new_docs = {}
+    parents = {}  # split sections only: section ID -> the whole section
+    for d in docs:
+        sid = section_id(d["title"], seen)
+        section = {"title": d["title"], "content": d["content"],
+                   "sentences": d.get("sentences") or section_sentences(d["title"], d["content"])}
+        chunks = chunk_section(section, chunk_tokens)
+        if len(chunks) == 1:
+            new_docs[sid] = dict(section, parent_id=sid, chunk=0, content_hash=content_hash(section))
             continue
-        lines = sec.splitlines()
-        if lines:
-            matches = re.match(pattern, lines[0])
-            if matches:
-                section_num = matches.group(1)
-                title = matches.group(3).strip()
-                structured_line = f"{section_num} {title}"
-            else:
-                structured_line = lines[0]
-        else:
-            structured_line = "Untitled Section"
-        grouped.append({"title": structured_line, "content": sec})
-    return grouped
-
-
-def build_vector_db(docs, collection_name, persist_dir=PERSIST_DIR):
-    client = chromadb.PersistentClient(path=persist_dir)    
-    # --- ADD THIS LINE ---
-    try:
-        client.delete_collection(name=collection_name)
-    except:
-        pass  # Collection might not exist yet, which is fine
-        
-    collection = client.get_or_create_collection(name=collection_name)
-
-    texts = [d["content"] for d in docs]
-    ids = [f"{collection_name}_section_{i}" for i in range(len(texts))]
-    metadatas = [{"title": d["title"]} for d in docs]
-
-    collection.add(documents=texts, metadatas=metadatas, ids=ids)
-    print(f"✅ Persisted {len(texts)} sections into Chroma (collection='{collection_name}')")
+        parents[sid] = section
+        for n, sentences in enumerate(chunks):
+            # The title goes into every chunk so its embedding knows which section it is from
+            chunk = {"title": d["title"], "content": "\n".join([d["title"]] + sentences),
+                     "sentences": sentences, "parent_id": sid, "chunk": n}
+            new_docs[f"{sid}::{n}"] = dict(chunk, content_hash=content_hash(chunk))
+
+    old = {"ids": [], "metadatas": [], "embeddings": []}
+    if incremental:
+        try:
+            old = client.get_collection(name=current_name).get(include=["metadatas", "embeddings"])
+        except Exception:
+            pass  # Nothing built yet, everything counts as added
+    old_hashes = {i: (m or {}).get("content_hash") for i, m in zip(old["ids"], old["metadatas"])}
+    old_embeddings = dict(zip(old["ids"], old["embeddings"] if old["embeddings"] is not None else []))
+
+    unchanged = [i for i in new_docs if old_hashes.get(i) == new_docs[i]["content_hash"]]
+    changed = [i for i in new_docs if i in old_hashes and i not in unchanged]
+    added = [i for i in new_docs if i not in old_hashes]
+    removed = [i for i in old_hashes if i not in new_docs]
+    # Collections built before sentences, parent links or the compact index were
+    # stored need rewriting even if no text changed
+    stale = bool(old["ids"]) and (any("sentences" not in (m or {}) or "parent_id" not in (m or {})
+                                      for m in old["metadatas"])
+                                  or not compact_index.has_index(persist_dir, current_name))
+    return {
+        "collection_name": collection_name,
+        "current_name": current_name,
+        "persist_dir": persist_dir,
+        "incremental": incremental,
+        "docs": new_docs,
+        "parents": parents,
+        "reused": {i: list(old_embeddings[i]) for i in unchanged},
+        "to_embed": added + changed,
+        "stale_metadata": stale,
+        "report": {"added": len(added), "changed": len(changed),
+                   "removed": len(removed), "unchanged": len(unchanged)},
+    }
+
+
+def apply_vector_db(plan, embeddings):
+    """
+    Build the collection into a fresh versioned copy and swap the alias to it,
+    so readers never see a half-built collection. `embeddings` lines up with
+    plan["to_embed"]. Returns counts of added/changed/removed/unchanged.
+    """
+    collection_name = plan["collection_name"]
+    current_name = plan["current_name"]
+    persist_dir = plan["persist_dir"]
+    report = plan["report"]
+    new_docs = plan["docs"]
+    parents = plan.get("parents", {})
+
+    if plan["incremental"] and not (report["added"] or report["changed"] or report["removed"]
+                                    or plan["stale_metadata"]):
+        print(f"✅ '{collection_name}' is up to date ({report['unchanged']} chunks unchanged)")
+        return report
+
+    client = chromadb.PersistentClient(path=persist_dir)
+    version = str(time.time_ns())
+    physical_name = f"{collection_name}__v{version}"
+    # A fresh version lets arai_rag's answer cache drop entries built on the old collection
+    collection = client.create_collection(name=physical_name, metadata={"version": version})
+
+    vectors = dict(plan["reused"])
+    vectors.update(zip(plan["to_embed"], embeddings))
+    ids = list(new_docs)
+    # Chroma metadata must be scalar, so the sentence list is stored as JSON
+    sentences = {i: json.dumps(new_docs[i]["sentences"], ensure_ascii=False) for i in ids}
+    metadatas = [{"title": new_docs[i]["title"], "content_hash": new_docs[i]["content_hash"],
+                  "sentences": sentences[i], "parent_id": new_docs[i]["parent_id"],
+                  "chunk": new_docs[i]["chunk"]} for i in ids]
+    documents = [new_docs[i]["content"] for i in ids]
+    _add_in_batches(collection, ids, metadatas, documents, [vectors[i] for i in ids])
+    compact_index.save_index(persist_dir, physical_name, ids, documents, metadatas,
+                             [vectors[i] for i in ids], version=version)
+    lexical_index.save_index(
+        lexical_index.BM25Index.build(
+            [{"id": i, "text": new_docs[i]["content"],
+              "meta": {"title": new_docs[i]["title"], "sentences": sentences[i],
+                       "parent_id": new_docs[i]["parent_id"], "chunk": new_docs[i]["chunk"]}} for i in ids],
+            parents=[{"id": sid, "text": p["content"],
+                      "meta": {"title": p["title"], "sentences": json.dumps(p["sentences"], ensure_ascii=False)}}
+                     for sid, p in parents.items()],
+        ),
+        persist_dir, physical_name,
+    )
+
+    collection_alias.set_alias(collection_name, physical_name, persist_dir)
+
+    # Keep the previous generation for queries already in flight, drop anything older
+    for c in client.list_collections():
+        name = c if isinstance(c, str) else c.name
+        if name.startswith(f"{collection_name}__v") and name not in (physical_name, current_name):
+            client.delete_collection(name=name)
+            lexical_index.remove_index(persist_dir, name)
+            compact_index.remove_index(persist_dir, name)
+    if current_name == collection_name:
+        try:
+            client.delete_collection(name=collection_name)  # pre-alias layout
+        except Exception:
+            pass
+
+    n_sections = len({d["parent_id"] for d in new_docs.values()})
+    print(f"✅ Persisted {n_sections} sections as {len(new_docs)} chunks into Chroma (collection='{collection_name}' → '{physical_name}'): "
+          f"{report['added']} added, {report['changed']} changed, "
+          f"{report['removed']} removed, {report['unchanged']} unchanged")
+    return report
+
+
+def build_vector_db(docs, collection_name, persist_dir=PERSIST_DIR, incremental=True,
+                    batch_size=EMBED_BATCH_SIZE, chunk_tokens=CHUNK_TOKENS):
+    """
+    Incrementally (re)build one collection. Only chunks whose content
+    hash changed are re-embedded; unchanged ones keep their stored vectors.
+    """
+    plan = plan_vector_db(docs, collection_name, persist_dir, incremental, chunk_tokens)
+    texts = [plan["docs"][i]["content"] for i in plan["to_embed"]]
+    return apply_vector_db(plan, embed_texts(texts, batch_size=batch_size))
+
+
+def build_all(docs_by_collection, persist_dir=PERSIST_DIR, incremental=True,
+              batch_size=EMBED_BATCH_SIZE, chunk_tokens=CHUNK_TOKENS):
+    """
+    Rebuild several collections with a single embedding pass: the chunks
+    that need embedding are pooled across collections and encoded in
+    batches by the shared model before any collection is written.
+    """
+    plans = [plan_vector_db(docs, name, persist_dir, incremental, chunk_tokens)
+             for name, docs in docs_by_collection.items()]
+    texts = [p["docs"][i]["content"] for p in plans for i in p["to_embed"]]
+    print(f"🧮 Embedding {len(texts)} chunks (batch size {batch_size})")
+    vectors = embed_texts(texts, batch_size=batch_size)
+
+    reports = {}
+    offset = 0
+    for p in plans:
+        n = len(p["to_embed"])
+        reports[p["collection_name"]] = apply_vector_db(p, vectors[offset:offset + n])
+        offset += n
+    return reports
 
 if __name__ == "__main__":
     manuals = {
@@ -82,11 +356,11 @@ if __name__ == "__main__":
         "jai": "career_manual.txt",
         "kai": "knowledge_manual.txt"
     }
+    docs_by_collection = {}
     for name, filepath in manuals.items():
         if not Path(filepath).exists():
             print(f"⚠️ Skipping {filepath} (file not found)")
             continue
-        print(f"\n📖 Ingesting {filepath} into collection '{name}_collection'")
-        text = load_manual(filepath)
-        docs = split_by_sections(text)
-        build_vector_db(docs, collection_name=f"{name}_collection", persist_dir=PERSIST_DIR)
+        print(f"\n📖 Reading {filepath} for collection '{name}_collection'")
+        docs_by_collection[f"{name}_collection"] = list(iter_sections(iter_manual_lines(filepath)))
+    build_all(docs_by_collection, persist_dir=PERSIST_DIR, incremental="--full" not in sys.argv)
@@ -0,0 +1,70 @@
+# embeddings.py
+import os
+import threading
+
+# ---------------- CONFIG ----------------
+EMB_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_DEVICE = os.getenv("EMBED_DEVICE") or None  # e.g. "cpu", "cuda"
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0")) or None  # torch intra-op threads
+# ----------------------------------------
+
+_model = None
+_lock = threading.Lock()
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+
+def get_model():
+    """The process-wide SentenceTransformer, loaded on first use."""
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                if EMBED_THREADS:
+                    import torch
+                    torch.set_num_threads(EMBED_THREADS)
+                _model = SentenceTransformer(EMB_MODEL_NAME, device=EMBED_DEVICE)
+    return _model
+
+
+def get_tokenizer():
+    """
+    The embedding model's WordPiece tokenizer, loaded on its own (the
+    model is not loaded for it); the model's copy if the model is already
+    up. None if it cannot be loaded.
+    """
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        with _tokenizer_lock:
+            if not _tokenizer_loaded:
+                if _model is not None:
+                    _tokenizer = getattr(_model, "tokenizer", None)
+                else:
+                    try:
+                        from transformers import AutoTokenizer
+                        _tokenizer = AutoTokenizer.from_pretrained(f"sentence-transformers/{EMB_MODEL_NAME}")
+                    except (OSError, ValueError):
+                        _tokenizer = None
+                _tokenizer_loaded = True
+    return _tokenizer
+
+
+def embed_texts(texts, batch_size=EMBED_BATCH_SIZE):
+    """Normalized embeddings as plain lists, ready to hand to Chroma."""
+    if not texts:
+        return []
+    vectors = get_model().encode(
+        list(texts),
+        batch_size=batch_size,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+    return vectors.tolist()
+
+
+def embed_query(query):
+    return embed_texts([query])[0]
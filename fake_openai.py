@@ -0,0 +1,163 @@
+# fake_openai.py
+"""
+A local OpenAI-compatible chat completions server for offline testing.
+
+    python fake_openai.py --port 8765 --latency 0.2 --token-delay 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake streamlit run app.py
+
+It answers deterministically by echoing the "Excerpts:" block of the prompt
+back as the answer, one word per streamed chunk. Latency before the first
+byte, per-token delay and an error rate can be injected.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EXCERPTS_RE = re.compile(r"Excerpts:\s*\n(.*?)\n\s*Answer format:", re.S)
+
+
+def fake_reply(messages):
+    """Echo the prompt's excerpts, or a fixed sentence if there are none."""
+    prompt = messages[-1]["content"] if messages else ""
+    m = EXCERPTS_RE.search(prompt)
+    return m.group(1).strip() if m else "This is a fake answer."
+
+
+class FakeOpenAIServer:
+    """
+    Run the fake server in a background thread:
+
+        with FakeOpenAIServer(latency=0.1) as server:
+            client = OpenAI(base_url=server.base_url, api_key="fake")
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_delay=0.0,
+                 error_rate=0.0, error_status=500, reply=fake_reply, seed=None):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reply = reply
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _should_fail(self):
+        with self._lock:
+            self.requests += 1
+            return self._rng.random() < self.error_rate
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._json(404, {"error": {"message": "not found"}})
+                length = int(self.headers.get("Content-Length", 0))
+                req = json.loads(self.rfile.read(length) or b"{}")
+                time.sleep(server.latency)
+                if server._should_fail():
+                    return self._json(server.error_status, {"error": {"message": "injected failure"}})
+
+                text = server.reply(req.get("messages", []))
+                words = re.findall(r"\S+\s*", text)
+                words = words[:req.get("max_tokens") or len(words)]
+                completion_id = f"chatcmpl-fake-{server.requests}"
+                model = req.get("model", "fake-model")
+                usage = {"prompt_tokens": sum(len(m.get("content", "").split()) for m in req.get("messages", [])),
+                         "completion_tokens": len(words)}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+                if not req.get("stream"):
+                    return self._json(200, {
+                        "id": completion_id, "object": "chat.completion", "created": int(time.time()),
+                        "model": model, "usage": usage,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": "".join(words)}}],
+                    })
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                for i, word in enumerate(words + [None]):
+                    delta = {"content": word} if word is not None else {}
+                    if i == 0:
+                        delta["role"] = "assistant"
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk",
+                             "created": int(time.time()), "model": model,
+                             "choices": [{"index": 0, "delta": delta,
+                                          "finish_reason": None if word is not None else "stop"}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if word is not None:
+                        time.sleep(server.token_delay)
+                if (req.get("stream_options") or {}).get("include_usage"):
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk",
+                             "created": int(time.time()), "model": model, "choices": [], "usage": usage}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake OpenAI chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first byte")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    args = parser.parse_args()
+    server = FakeOpenAIServer(args.host, args.port, latency=args.latency,
+                              token_delay=args.token_delay, error_rate=args.error_rate)
+    print(f"🧪 Fake OpenAI server on {server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
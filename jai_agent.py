@@ -1,11 +1,15 @@
 # jai.py
 import pandas as pd
 import json
+import os
+import threading
+import time
 
 # ---------------- CONFIG ----------------
 PERFORMANCE_FILE = "mock_performance.csv"
 CAREER_PATH_FILE = "career_path.json"
 NUDGE_FILE = "nudge_library.json"
+RELOAD_CHECK_INTERVAL = 2.0  # seconds between file mtime checks
 
 
 # ---------------- HELPERS ----------------
@@ -17,16 +21,72 @@ def load_csv(path):
     return pd.read_csv(path, quotechar='"', skip_blank_lines=True)
 
 
+def index_employees(df):
+    """employee_id -> row dict; the first row wins for duplicated IDs."""
+    index = {}
+    for row in df.to_dict("records"):
+        index.setdefault(row["employee_id"], row)
+    return index
+
+
+class EmployeeRepository:
+    """
+    Performance, career-path and nudge data loaded once and served from
+    memory. A source is reloaded only when its file mtime changes, and the
+    mtimes are checked at most every `check_interval` seconds, so lookups
+    normally touch no files at all.
+    """
+
+    def __init__(self, performance_file=PERFORMANCE_FILE, career_path_file=CAREER_PATH_FILE,
+                 nudge_file=NUDGE_FILE, check_interval=RELOAD_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._sources = {
+            "employees": {"path": performance_file, "load": lambda p: index_employees(load_csv(p))},
+            "career_paths": {"path": career_path_file, "load": load_json},
+            "nudges": {"path": nudge_file, "load": load_json},
+        }
+        for src in self._sources.values():
+            src.update(mtime=None, data=None)
+        self._last_check = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            for src in self._sources.values():
+                mtime = os.stat(src["path"]).st_mtime_ns
+                if mtime != src["mtime"]:
+                    src["data"] = src["load"](src["path"])
+                    src["mtime"] = mtime
+            self._last_check = now
+
+    def _get(self, name):
+        self._refresh()
+        return self._sources[name]["data"]
+
+    def employee(self, employee_id):
+        """Row dict for an employee, or None."""
+        return self._get("employees").get(employee_id)
+
+    def career_paths(self):
+        return self._get("career_paths")
+
+    def nudges(self):
+        return self._get("nudges")
+
+
+repository = EmployeeRepository()
+
+
 # ---------------- FEATURES ----------------
 def get_growth_path(employee_id):
-    df = load_csv(PERFORMANCE_FILE)
-    data = load_json(CAREER_PATH_FILE)
-
-    row = df[df["employee_id"] == employee_id]
+    data = repository.career_paths()
+    row = repository.employee(employee_id)
 
-    if row.empty:
+    if row is None:
         return f"❌ Employee ID {employee_id} not found."
-    row = row.iloc[0]
     current_role = row["role"]
 
     if current_role not in data:
@@ -44,16 +104,14 @@ Skills Required: {", ".join(skills)}
 
 
 def get_weekly_nudge(employee_id):
-    df = load_csv(PERFORMANCE_FILE)
-    career_data = load_json(CAREER_PATH_FILE)
-    nudge_data = load_json(NUDGE_FILE)
+    career_data = repository.career_paths()
+    nudge_data = repository.nudges()
 
-    row = df[df["employee_id"] == employee_id]
+    row = repository.employee(employee_id)
 
-    if row.empty:
+    if row is None:
         return f"❌ Employee ID {employee_id} not found."
 
-    row = row.iloc[0]
     current_role = row["role"]
     skills = str(row.get("skills_unlocked", "") or "").strip()
     unlocked = skills.split(";") if skills else []
@@ -86,12 +144,10 @@ Tip: {tip}
 
 
 def get_skill_tree(employee_id):
-    df = load_csv(PERFORMANCE_FILE)
-    row = df[df["employee_id"] == employee_id]
+    row = repository.employee(employee_id)
 
-    if row.empty:
+    if row is None:
         return f"❌ Employee ID {employee_id} not found."
-    row = row.iloc[0]
     skills = row["skills_unlocked"]
     if pd.isna(skills) or str(skills).strip().lower() in ["", "nan"]:
         return f"❌ No skills unlocked yet."
@@ -2,11 +2,13 @@
 import pandas as pd
 import json
 from datetime import datetime
+from kai_store import GLOBAL_SCOPE, KaiStore
 
 # ---------------- CONFIG ----------------
 IDEAS_FILE = "ideas.csv"
 CHALLENGES_FILE = "challenges.json"
 KUDOS_FILE = "kudos.csv"
+DB_FILE = "kai.sqlite3"
 
 
 # ---------------- HELPERS ----------------
@@ -14,41 +16,24 @@ def load_json(path):
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def load_csv(path):
-    return pd.read_csv(path)
+def now_str():
+    return pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
 
-def save_csv(df, path):
-    df.to_csv(path, index=False)
+
+# Ideas and kudos live in SQLite; the CSVs are imported once and can be re-exported
+store = KaiStore(DB_FILE, IDEAS_FILE, KUDOS_FILE)
 
 
 # ---------------- FEATURES ----------------
 def submit_idea(idea_text, employee, branch):
-    try:
-        df = load_csv(IDEAS_FILE)
-    except FileNotFoundError:
-        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-
-    new_row = pd.DataFrame([{
-        "idea_id": len(df) + 1,
-        "idea_text": idea_text,
-        "submitted_by": employee,
-        "branch_id": branch,
-        "upvotes": 1,
-        "timestamp": pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
-    }])
-
-    df = pd.concat([df, new_row], ignore_index=True)
-    save_csv(df, IDEAS_FILE)
+    store.add_idea(idea_text, employee, branch, now_str())
     return f"💡 Idea submitted: '{idea_text}' by {employee} (branch {branch})"
 
 
 
 def upvote_idea(idea_id):
-    df = load_csv(IDEAS_FILE)
-    if idea_id not in df["idea_id"].values:
+    if not store.upvote(idea_id):
         return f"❌ Idea {idea_id} not found"
-    df.loc[df["idea_id"] == idea_id, "upvotes"] += 1
-    save_csv(df, IDEAS_FILE)
     return f"👍 Upvoted idea {idea_id}"
 
 
@@ -63,30 +48,17 @@ Prize: {ch['prize']}
 """
 
 
-def post_kudos(from_emp, to_emp, message):
-    path = "kudos.csv"
-    df = load_csv(path)
-    new_row = {
-        "kudos_id": len(df) + 1,
-        "from_employee": from_emp,
-        "to_employee": to_emp,
-        "message": message,
-        "timestamp": pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    # Instead of df.append(new_row, ignore_index=True)
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    save_csv(df, path)
+def post_kudos(from_emp, to_emp, message, branch=None):
+    store.add_kudos(from_emp, to_emp, message, now_str(), branch=branch)
     return f"✅ Kudos posted from {from_emp} to {to_emp}!"
 
 
 
-def manager_summary():
-    ideas = load_csv(IDEAS_FILE).sort_values(by="upvotes", ascending=False).head(5)
-    kudos = load_csv(KUDOS_FILE).tail(5)
-    ch = load_json(CHALLENGES_FILE)["current_challenge"]
-
+def _format_summary(top_ideas, recent_kudos, ch, heading="📊 Manager Summary"):
+    ideas = pd.DataFrame(top_ideas, columns=["idea_id", "idea_text", "upvotes"])
+    kudos = pd.DataFrame(recent_kudos, columns=["from_employee", "to_employee", "message"])
     return f"""
-📊 Manager Summary
+{heading}
 - Top Ideas:
 {ideas[['idea_id','idea_text','upvotes']].to_string(index=False)}
 
@@ -98,6 +70,29 @@ def manager_summary():
 """
 
 
+def manager_summary(branch_id=None):
+    """Top ideas and recent kudos, for the whole company or one branch."""
+    ch = load_json(CHALLENGES_FILE)["current_challenge"]
+    heading = "📊 Manager Summary" if branch_id is None else f"📊 Manager Summary ({branch_id})"
+    return _format_summary(store.top_ideas(5, branch=branch_id),
+                           store.recent_kudos(5, branch=branch_id), ch, heading)
+
+
+def branch_summaries():
+    """{branch_id: summary} for every branch, from two queries in total."""
+    ch = load_json(CHALLENGES_FILE)["current_challenge"]
+    ideas = store.all_top_ideas(5)
+    kudos = store.all_recent_kudos(5)
+    branches = sorted((set(ideas) | set(kudos)) - {GLOBAL_SCOPE})
+    return {b: _format_summary(ideas.get(b, []), kudos.get(b, []), ch, f"📊 Manager Summary ({b})")
+            for b in branches}
+
+
+def export_csv():
+    store.export_csv(IDEAS_FILE, KUDOS_FILE)
+    return f"📤 Exported ideas to {IDEAS_FILE} and kudos to {KUDOS_FILE}"
+
+
 # ---------------- MENU ----------------
 def run_kai():
     print("🤝 Welcome to KAI - The Team & Community Agent")
@@ -107,6 +102,8 @@ def run_kai():
     print("3. Upvote Idea")
     print("4. Post Kudos")
     print("5. Manager Summary")
+    print("6. Export CSV")
+    print("7. Branch Summaries")
 
     choice = input("Enter number: ").strip()
 
@@ -124,9 +121,16 @@ def run_kai():
         f = input("From Employee: ")
         t = input("To Employee: ")
         msg = input("Message: ")
-        print(post_kudos(f, t, msg))
+        branch = input("Branch ID (optional): ").strip() or None
+        print(post_kudos(f, t, msg, branch))
     elif choice == "5":
-        print(manager_summary())
+        branch = input("Branch ID (blank for all): ").strip() or None
+        print(manager_summary(branch))
+    elif choice == "6":
+        print(export_csv())
+    elif choice == "7":
+        for summary in branch_summaries().values():
+            print(summary)
     else:
         print("❌ Invalid choice.")
 
@@ -0,0 +1,281 @@
+# kai_store.py
+import csv
+import os
+import sqlite3
+import threading
+
+# ---------------- CONFIG ----------------
+DB_FILE = "kai.sqlite3"
+IDEAS_FILE = "ideas.csv"
+KUDOS_FILE = "kudos.csv"
+BUSY_TIMEOUT = 30  # seconds to wait for another writer
+SUMMARY_SIZE = 5  # ideas/kudos kept per scope in the maintained aggregates
+GLOBAL_SCOPE = "*"
+# ----------------------------------------
+
+IDEA_COLUMNS = ["idea_id", "idea_text", "submitted_by", "branch_id", "upvotes", "timestamp"]
+KUDOS_COLUMNS = ["kudos_id", "from_employee", "to_employee", "message", "timestamp"]
+KUDOS_EXPORT_COLUMNS = KUDOS_COLUMNS + ["branch_id"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS ideas (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    idea_id INTEGER NOT NULL UNIQUE,
+    idea_text TEXT,
+    submitted_by TEXT,
+    branch_id TEXT,
+    upvotes INTEGER NOT NULL DEFAULT 0,
+    timestamp TEXT
+);
+CREATE TABLE IF NOT EXISTS kudos (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    kudos_id INTEGER NOT NULL UNIQUE,
+    from_employee TEXT,
+    to_employee TEXT,
+    message TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_ideas_upvotes ON ideas(upvotes DESC, seq);
+-- Maintained aggregates: top ideas and a ring of recent kudos per scope (branch or '*')
+CREATE TABLE IF NOT EXISTS top_ideas (
+    scope TEXT NOT NULL,
+    idea_seq INTEGER NOT NULL,
+    upvotes INTEGER NOT NULL,
+    PRIMARY KEY (scope, idea_seq)
+);
+CREATE TABLE IF NOT EXISTS recent_kudos (
+    scope TEXT NOT NULL,
+    kudos_seq INTEGER NOT NULL,
+    PRIMARY KEY (scope, kudos_seq)
+);
+"""
+
+
+class KaiStore:
+    """
+    Ideas and kudos in an embedded SQLite database (WAL mode). Every write
+    is a single short transaction, so inserts and upvotes are O(1)-ish and
+    concurrent Streamlit sessions cannot overwrite each other. The legacy
+    CSVs are imported once on first use and can be exported again at any time.
+    """
+
+    def __init__(self, path=DB_FILE, ideas_csv=IDEAS_FILE, kudos_csv=KUDOS_FILE):
+        self.path = path
+        self.ideas_csv = ideas_csv
+        self.kudos_csv = kudos_csv
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    # ---------- connection & schema ----------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: we issue BEGIN IMMEDIATE ourselves for writes
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self._init_schema(conn)
+                    self._initialized = True
+        return conn
+
+    def _init_schema(self, conn):
+        conn.executescript(SCHEMA)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            kudos_columns = [r[1] for r in conn.execute("PRAGMA table_info(kudos)")]
+            if "branch_id" not in kudos_columns:
+                conn.execute("ALTER TABLE kudos ADD COLUMN branch_id TEXT")
+            done = conn.execute("SELECT value FROM meta WHERE key = 'csv_imported'").fetchone()
+            if not done:
+                self._import_csv(conn)
+                conn.execute("INSERT INTO meta VALUES ('csv_imported', '1')")
+            # Ideas used to be stored with str(branch), so "no branch" became the text 'None'
+            fixed = conn.execute("UPDATE ideas SET branch_id = NULL WHERE branch_id IN ('None', '')").rowcount
+            built = conn.execute("SELECT value FROM meta WHERE key = 'aggregates_size'").fetchone()
+            if fixed or not built or int(built[0]) != SUMMARY_SIZE:
+                self._rebuild_aggregates(conn)
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('aggregates_size', ?)", (str(SUMMARY_SIZE),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _import_csv(self, conn):
+        """One-off import of the legacy CSV files, keeping their IDs and order."""
+        for path, table, columns in ((self.ideas_csv, "ideas", IDEA_COLUMNS),
+                                     (self.kudos_csv, "kudos", KUDOS_EXPORT_COLUMNS)):
+            if not path or not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                rows = [[r.get(c) for c in columns] for r in csv.DictReader(f)]
+            conn.executemany(
+                f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})",
+                rows,
+            )
+
+    def _rebuild_aggregates(self, conn):
+        """Full recompute; only needed once for existing data or after SUMMARY_SIZE changes."""
+        conn.execute("DELETE FROM top_ideas")
+        conn.execute("DELETE FROM recent_kudos")
+        for idea in conn.execute("SELECT seq, branch_id, upvotes FROM ideas ORDER BY seq").fetchall():
+            for scope in self._scopes(idea["branch_id"]):
+                self._offer_idea(conn, scope, idea["seq"], idea["upvotes"])
+        for kudos in conn.execute("SELECT seq, branch_id FROM kudos ORDER BY seq").fetchall():
+            for scope in self._scopes(kudos["branch_id"]):
+                self._push_kudos(conn, scope, kudos["seq"])
+
+    @staticmethod
+    def _branch(branch):
+        """Stored branch_id: NULL for no branch (None, '' or the text 'None')."""
+        return None if branch in (None, "", "None") else str(branch)
+
+    @classmethod
+    def _scopes(cls, branch):
+        branch = cls._branch(branch)
+        return [GLOBAL_SCOPE] if branch is None else [GLOBAL_SCOPE, branch]
+
+    @staticmethod
+    def _offer_idea(conn, scope, idea_seq, upvotes):
+        """
+        Keep the SUMMARY_SIZE best ideas per scope (most upvotes, then oldest).
+        Upvotes only ever go up, so an idea outside the top can only enter by
+        beating the current weakest one: each update is O(SUMMARY_SIZE).
+        """
+        if conn.execute("UPDATE top_ideas SET upvotes = ? WHERE scope = ? AND idea_seq = ?",
+                        (upvotes, scope, idea_seq)).rowcount:
+            return
+        rows = conn.execute(
+            "SELECT idea_seq, upvotes FROM top_ideas WHERE scope = ? ORDER BY upvotes ASC, idea_seq DESC",
+            (scope,)
+        ).fetchall()
+        if len(rows) >= SUMMARY_SIZE:
+            weakest = rows[0]
+            if (upvotes, -idea_seq) <= (weakest["upvotes"], -weakest["idea_seq"]):
+                return
+            conn.execute("DELETE FROM top_ideas WHERE scope = ? AND idea_seq = ?", (scope, weakest["idea_seq"]))
+        conn.execute("INSERT INTO top_ideas VALUES (?, ?, ?)", (scope, idea_seq, upvotes))
+
+    @staticmethod
+    def _push_kudos(conn, scope, kudos_seq):
+        """Bounded ring of the latest SUMMARY_SIZE kudos per scope."""
+        conn.execute("INSERT INTO recent_kudos VALUES (?, ?)", (scope, kudos_seq))
+        conn.execute(
+            "DELETE FROM recent_kudos WHERE scope = ? AND kudos_seq NOT IN "
+            "(SELECT kudos_seq FROM recent_kudos WHERE scope = ? ORDER BY kudos_seq DESC LIMIT ?)",
+            (scope, scope, SUMMARY_SIZE)
+        )
+
+    def _write(self, fn):
+        """Run fn(conn) inside one immediate (write-locked) transaction."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ---------- writes ----------
+    def add_idea(self, idea_text, employee, branch, timestamp):
+        def insert(conn):
+            # Next ID after the highest one, including the legacy 1001-style IDs
+            idea_id = conn.execute("SELECT COALESCE(MAX(idea_id), 0) + 1 FROM ideas").fetchone()[0]
+            seq = conn.execute(
+                "INSERT INTO ideas (idea_id, idea_text, submitted_by, branch_id, upvotes, timestamp) "
+                "VALUES (?, ?, ?, ?, 1, ?)",
+                (idea_id, idea_text, employee, self._branch(branch), timestamp),
+            ).lastrowid
+            for scope in self._scopes(branch):
+                self._offer_idea(conn, scope, seq, 1)
+            return idea_id
+        return self._write(insert)
+
+    def upvote(self, idea_id):
+        """Atomic increment. Returns False if the idea does not exist."""
+        def bump(conn):
+            if not conn.execute("UPDATE ideas SET upvotes = upvotes + 1 WHERE idea_id = ?", (idea_id,)).rowcount:
+                return False
+            idea = conn.execute("SELECT seq, branch_id, upvotes FROM ideas WHERE idea_id = ?", (idea_id,)).fetchone()
+            for scope in self._scopes(idea["branch_id"]):
+                self._offer_idea(conn, scope, idea["seq"], idea["upvotes"])
+            return True
+        return self._write(bump)
+
+    def add_kudos(self, from_emp, to_emp, message, timestamp, branch=None):
+        def insert(conn):
+            kudos_id = conn.execute("SELECT COALESCE(MAX(kudos_id), 0) + 1 FROM kudos").fetchone()[0]
+            seq = conn.execute(
+                "INSERT INTO kudos (kudos_id, from_employee, to_employee, message, timestamp, branch_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (kudos_id, from_emp, to_emp, message, timestamp, self._branch(branch)),
+            ).lastrowid
+            for scope in self._scopes(branch):
+                self._push_kudos(conn, scope, seq)
+            return kudos_id
+        return self._write(insert)
+
+    # ---------- reads ----------
+    # Both read from the maintained aggregates, so cost does not grow with history
+    def top_ideas(self, n=SUMMARY_SIZE, branch=None):
+        """Most upvoted ideas, globally or for one branch."""
+        return self.all_top_ideas(n, branch=GLOBAL_SCOPE if branch is None else branch).get(
+            GLOBAL_SCOPE if branch is None else str(branch), [])
+
+    def recent_kudos(self, n=SUMMARY_SIZE, branch=None):
+        """Last n kudos, oldest first (like DataFrame.tail), globally or for one branch."""
+        return self.all_recent_kudos(n, branch=GLOBAL_SCOPE if branch is None else branch).get(
+            GLOBAL_SCOPE if branch is None else str(branch), [])
+
+    def all_top_ideas(self, n=SUMMARY_SIZE, branch=None):
+        """{scope: [idea, ...]} for every branch plus '*' (or just `branch`)."""
+        if n > SUMMARY_SIZE:
+            raise ValueError(f"Only the top {SUMMARY_SIZE} ideas are maintained per scope")
+        where, params = ("WHERE t.scope = ? ", (str(branch),)) if branch is not None else ("", ())
+        rows = self._conn().execute(
+            f"SELECT t.scope, {', '.join('i.' + c for c in IDEA_COLUMNS)} "
+            f"FROM top_ideas t JOIN ideas i ON i.seq = t.idea_seq {where}"
+            "ORDER BY t.scope, i.upvotes DESC, i.seq", params
+        ).fetchall()
+        result = {}
+        for r in rows:
+            ideas = result.setdefault(r["scope"], [])
+            if len(ideas) < n:
+                ideas.append({c: r[c] for c in IDEA_COLUMNS})
+        return result
+
+    def all_recent_kudos(self, n=SUMMARY_SIZE, branch=None):
+        """{scope: [kudos, ...]} oldest first, for every branch plus '*' (or just `branch`)."""
+        if n > SUMMARY_SIZE:
+            raise ValueError(f"Only the last {SUMMARY_SIZE} kudos are kept per scope")
+        where, params = ("WHERE r.scope = ? ", (str(branch),)) if branch is not None else ("", ())
+        rows = self._conn().execute(
+            f"SELECT r.scope, {', '.join('k.' + c for c in KUDOS_EXPORT_COLUMNS)} "
+            f"FROM recent_kudos r JOIN kudos k ON k.seq = r.kudos_seq {where}"
+            "ORDER BY r.scope, k.seq", params
+        ).fetchall()
+        result = {}
+        for r in rows:
+            result.setdefault(r["scope"], []).append({c: r[c] for c in KUDOS_EXPORT_COLUMNS})
+        return {scope: kudos[-n:] if n else [] for scope, kudos in result.items()}
+
+    def export_csv(self, ideas_path=None, kudos_path=None):
+        """Write both tables back out in the legacy CSV layout."""
+        conn = self._conn()
+        for path, table, columns in ((ideas_path or self.ideas_csv, "ideas", IDEA_COLUMNS),
+                                     (kudos_path or self.kudos_csv, "kudos", KUDOS_EXPORT_COLUMNS)):
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                writer.writerows(conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY seq"))
+            os.replace(tmp, path)
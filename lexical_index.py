@@ -0,0 +1,184 @@
+# lexical_index.py
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import collection_alias
+
+# ---------------- CONFIG ----------------
+INDEX_DIR = "lexical"  # inside the Chroma persist dir, one file per physical collection
+BM25_K1 = 1.5
+BM25_B = 0.75
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+    "from", "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "should",
+    "the", "to", "we", "what", "when", "where", "which", "who", "why", "with", "you",
+}
+# ----------------------------------------
+
+TOKEN_RE = re.compile(r"\d+(?:\.\d+)+|[a-z0-9]+")
+SECTION_NUMBER_RE = re.compile(r"^\s*(\d+(?:\.\d+)*)\b")
+# A number only names a section when the query says so ("section 3.3.1", "§2.2")
+# or is nothing but the number; "3.0" or "2.50" inside a question is not a reference
+SECTION_REF_RE = re.compile(r"(?:\bsection|\bsec\.?|§)\s*(\d+(?:\.\d+)*)\b")
+BARE_SECTION_RE = re.compile(r"^\s*(\d+(?:\.\d+)*)\.?\s*[?!]?\s*$")
+
+
+def tokenize(text):
+    """Lowercase word tokens; dotted section numbers like 3.3.1 stay whole."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def title_core(title):
+    """Title tokens without the section number or parenthetical, e.g. ['closing', 'checklist']."""
+    title = SECTION_NUMBER_RE.sub("", title)
+    title = re.sub(r"\(.*?\)", " ", title)
+    return tokenize(title)
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the same chunks as a Chroma collection, plus lookup
+    tables for exact section-number and title matches and the whole
+    sections that were split into several chunks.
+    """
+
+    def __init__(self, docs, doc_len, postings, k1=BM25_K1, b=BM25_B, parents=None):
+        self.docs = docs  # [{"id", "text", "meta"}]
+        self.parents = parents or {}  # split sections: parent_id -> {"id", "text", "meta"}
+        self.doc_len = doc_len
+        self.postings = postings  # term -> [[doc_idx, tf], ...]
+        self.k1 = k1
+        self.b = b
+        self.avg_len = (sum(doc_len) / len(doc_len)) if doc_len else 0.0
+        n = len(docs)
+        self.idf = {t: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for t, p in postings.items()}
+        self.by_number = {}
+        self.by_title = {}
+        self.children = {}  # parent_id -> doc indexes in chunk order
+        for i, d in enumerate(docs):
+            self.children.setdefault(d["meta"].get("parent_id", d["id"]), []).append(i)
+            title = d["meta"].get("title", "")
+            m = SECTION_NUMBER_RE.match(title)
+            if m:
+                self.by_number.setdefault(m.group(1), i)
+            core = tuple(title_core(title))
+            if core:
+                self.by_title.setdefault(core, i)
+
+    @classmethod
+    def build(cls, docs, parents=None, **kwargs):
+        doc_len = []
+        postings = {}
+        for i, d in enumerate(docs):
+            tokens = tokenize(d["text"])
+            doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append([i, tf])
+        return cls(docs, doc_len, postings, parents={p["id"]: p for p in parents or []}, **kwargs)
+
+    def search(self, query, top_k):
+        """[(doc_idx, bm25_score)] best first."""
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[i] / (self.avg_len or 1.0))
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda x: -x[1])[:top_k]
+
+    def parent(self, doc):
+        """The whole section a chunk was cut from; the doc itself if its section was not split."""
+        return self.parents.get(doc["meta"].get("parent_id"), doc)
+
+    def exact_match(self, query):
+        """
+        (doc index, "number" or "title") for a query that names a section,
+        else None. A number counts when the query is just the number or
+        says "section 3.3.1". A title counts when it has two or more words
+        and appears in the query ("closing checklist"), or when it is the
+        whole query ("latte", "3.3.1 Latte"). The longest matching title
+        wins; an ambiguous tie is not an exact match.
+        """
+        q = query.lower()
+        bare = BARE_SECTION_RE.match(q)
+        for number in ([bare.group(1)] if bare else SECTION_REF_RE.findall(q)):
+            if number in self.by_number:
+                return self.by_number[number], "number"
+
+        tokens = tokenize(query)
+        whole = tuple(title_core(query))
+        best, best_len, tie = None, 0, False
+        for core, i in self.by_title.items():
+            n = len(core)
+            if n < best_len:
+                continue
+            if core != whole and (n < 2 or not any(tuple(tokens[j:j + n]) == core
+                                                   for j in range(len(tokens) - n + 1))):
+                continue
+            tie = n == best_len
+            if n > best_len:
+                best, best_len = i, n
+        return None if tie or best is None else (best, "title")
+
+    def to_dict(self):
+        return {"k1": self.k1, "b": self.b, "docs": self.docs, "parents": self.parents,
+                "doc_len": self.doc_len, "postings": self.postings}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["docs"], data["doc_len"], data["postings"], k1=data["k1"], b=data["b"],
+                   parents=data.get("parents"))
+
+
+def index_path(persist_dir, physical_name):
+    return os.path.join(persist_dir, INDEX_DIR, f"{physical_name}.json")
+
+
+def save_index(index, persist_dir, physical_name):
+    path = index_path(persist_dir, physical_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index.to_dict(), f)
+    os.replace(tmp, path)
+
+
+def remove_index(persist_dir, physical_name):
+    try:
+        os.remove(index_path(persist_dir, physical_name))
+    except OSError:
+        pass
+
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def load_index(persist_dir, physical_name):
+    """Cached per physical collection; None for collections built before the lexical index."""
+    key = (persist_dir, physical_name)
+    with _lock:
+        if key not in _loaded:
+            # A rebuild moved the alias on: forget older generations of this collection
+            collection_alias.evict_generations(_loaded, persist_dir, physical_name)
+            try:
+                with open(index_path(persist_dir, physical_name), "r", encoding="utf-8") as f:
+                    _loaded[key] = BM25Index.from_dict(json.load(f))
+            except OSError:
+                _loaded[key] = None
+        return _loaded[key]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several best-first lists of ids into one; returns [(id, rrf_score)]."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda x: -x[1])
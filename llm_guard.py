@@ -0,0 +1,343 @@
+# llm_guard.py
+"""
+Guards around the upstream LLM call.
+
+  SingleFlight    identical requests in flight at the same time share one
+                  upstream call (streams: later callers replay the events),
+                  across threads or within one event loop
+  call_with_retry jittered exponential backoff on transient errors, with a
+                  per-attempt timeout and a total deadline
+  CircuitBreaker  after BREAKER_FAILURES transient failures in a row, calls
+                  fail fast with CircuitOpen for BREAKER_COOLDOWN seconds,
+                  then one trial call decides whether to close again
+
+    result = call_with_retry(lambda timeout: client.chat.completions.create(..., timeout=timeout))
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+# ---------------- CONFIG ----------------
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "15"))  # seconds per attempt
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "30"))  # seconds for all attempts together
+RETRY_BASE = 0.25  # first backoff ceiling in seconds, doubled per attempt
+RETRY_MAX = 4.0
+RETRY_ATTEMPTS = 4
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 30.0
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# ----------------------------------------
+
+
+class CircuitOpen(RuntimeError):
+    """The upstream is marked unhealthy; the call was not attempted."""
+
+
+def is_retryable(exc):
+    """Connection problems, timeouts, rate limits and 5xx; not bad requests or auth errors."""
+    import openai
+    if isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError, TimeoutError, ConnectionError)):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code in RETRY_STATUS
+
+
+def is_definite(exc):
+    """The upstream answered with an error that retrying will not change (e.g. 400, 401, 404)."""
+    import openai
+    return isinstance(exc, openai.APIStatusError) and not is_retryable(exc)
+
+
+def backoff_delay(attempt, base=RETRY_BASE, cap=RETRY_MAX):
+    """Full jitter: uniform over [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"  # closed -> open -> half_open -> closed/open
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go upstream now; in half_open only one trial at a time."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._trial = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._consecutive = 0
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self.state == "half_open" or self._consecutive >= self.failures:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+    def release_trial(self):
+        """A half-open trial that ended without a verdict (a local error) frees the slot."""
+        with self._lock:
+            self._trial = False
+
+
+breaker = CircuitBreaker()
+
+
+def _attempts(deadline, breaker):
+    """Yield (attempt, per-attempt timeout) while the deadline and breaker allow."""
+    start = time.monotonic()
+    for attempt in range(RETRY_ATTEMPTS):
+        remaining = deadline - (time.monotonic() - start)
+        if remaining <= 0:
+            return
+        if not breaker.allow():
+            raise CircuitOpen("LLM upstream unavailable (circuit open)")
+        yield attempt, min(LLM_TIMEOUT, remaining)
+
+
+def _failed(exc, attempt, deadline_at, breaker):
+    """Record a failed attempt; the backoff to sleep before retrying, or None to give up."""
+    if not is_retryable(exc):
+        if is_definite(exc):
+            breaker.record_success()  # it answered, so it is up: the failure streak ends here
+        else:
+            breaker.release_trial()  # a local error says nothing about the upstream
+        return None
+    breaker.record_failure()
+    delay = backoff_delay(attempt)
+    if attempt + 1 >= RETRY_ATTEMPTS or time.monotonic() + delay >= deadline_at:
+        return None
+    return delay
+
+
+def call_with_retry(fn, deadline=LLM_DEADLINE, breaker=breaker, stats=None):
+    """
+    fn(timeout) with retries on transient errors. Raises CircuitOpen while
+    the breaker is open, else the last error once attempts or the deadline
+    run out. `stats`, if given, gets the number of attempts made.
+    """
+    deadline_at = time.monotonic() + deadline
+    for attempt, timeout in _attempts(deadline, breaker):
+        if stats is not None:
+            stats["attempts"] = attempt + 1
+        try:
+            result = fn(timeout)
+        except Exception as e:
+            delay = _failed(e, attempt, deadline_at, breaker)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+    raise TimeoutError(f"LLM call gave up after {deadline:.0f}s")
+
+
+async def acall_with_retry(fn, deadline=LLM_DEADLINE, breaker=breaker, stats=None):
+    """call_with_retry for a coroutine function fn(timeout)."""
+    deadline_at = time.monotonic() + deadline
+    for attempt, timeout in _attempts(deadline, breaker):
+        if stats is not None:
+            stats["attempts"] = attempt + 1
+        try:
+            result = await fn(timeout)
+        except Exception as e:
+            delay = _failed(e, attempt, deadline_at, breaker)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+    raise TimeoutError(f"LLM call gave up after {deadline:.0f}s")
+
+
+class _Flight:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.items = []  # stream events so far
+        self.result = None
+        self.error = None
+        self.done = False
+
+
+class _AsyncFlight:
+    def __init__(self):
+        self.items = []
+        self.error = None
+        self.done = False
+        self.changed = asyncio.Event()  # replaced after every change; waiters hold the old one
+
+
+class SingleFlight:
+    """
+    In-flight de-duplication keyed on the request. The first caller (the
+    leader) makes the call; callers arriving while it runs wait for and
+    share its outcome, error included. Nothing is kept once it finishes.
+    """
+
+    def __init__(self, wait_timeout=LLM_DEADLINE + LLM_TIMEOUT):
+        self.wait_timeout = wait_timeout
+        self._flights = {}
+        self._tasks = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def _land(self, key, flight, error=None):
+        with self._lock:
+            self._flights.pop(key, None)
+        with flight.cond:
+            flight.error = error
+            flight.done = True
+            flight.cond.notify_all()
+
+    def _wait(self, flight, ready):
+        with flight.cond:
+            if not flight.cond.wait_for(ready, timeout=self.wait_timeout):
+                raise TimeoutError("timed out waiting for a shared LLM call")
+
+    def do(self, key, fn):
+        """(fn() or the in-flight result for `key`, whether it was shared)."""
+        flight, leader = self._join(key)
+        if not leader:
+            self._wait(flight, lambda: flight.done)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = fn()
+        except Exception as e:
+            self._land(key, flight, e)
+            raise
+        self._land(key, flight)
+        return flight.result, False
+
+    def stream(self, key, open_stream):
+        """
+        (iterator of events, whether it was shared). The leader iterates
+        open_stream(); other callers replay the same events as they arrive.
+        """
+        flight, leader = self._join(key)
+        if leader:
+            return self._lead(key, flight, open_stream), False
+        return self._follow(flight), True
+
+    def _lead(self, key, flight, open_stream):
+        error = RuntimeError("shared LLM stream was abandoned")
+        try:
+            for event in open_stream():
+                with flight.cond:
+                    flight.items.append(event)
+                    flight.cond.notify_all()
+                yield event
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._land(key, flight, error)
+
+    def _follow(self, flight):
+        seen = 0
+        while True:
+            self._wait(flight, lambda: flight.done or len(flight.items) > seen)
+            with flight.cond:
+                batch = flight.items[seen:]
+                finished = flight.done and seen + len(batch) == len(flight.items)
+            yield from batch
+            seen += len(batch)
+            if finished:
+                if flight.error is not None:
+                    raise flight.error
+                return
+
+    async def ado(self, key, make_coro):
+        """do() for coroutines, shared within one event loop."""
+        loop_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._tasks.get(loop_key)
+            shared = task is not None
+            if not shared:
+                task = self._tasks[loop_key] = asyncio.ensure_future(make_coro())
+                task.add_done_callback(lambda _: self._forget(self._tasks, loop_key))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, table, loop_key):
+        with self._lock:
+            table.pop(loop_key, None)
+
+    def astream(self, key, open_stream):
+        """
+        stream() for async streams, shared within one event loop.
+        open_stream() is a coroutine returning an async iterator of events.
+        Returns (async iterator of events, whether it was shared).
+        """
+        loop_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            flight = self._streams.get(loop_key)
+            if flight is not None:
+                return self._afollow(flight), True
+            flight = self._streams[loop_key] = _AsyncFlight()
+        return self._alead(loop_key, flight, open_stream), False
+
+    @staticmethod
+    def _notify(flight):
+        flight.changed.set()
+        flight.changed = asyncio.Event()
+
+    async def _alead(self, loop_key, flight, open_stream):
+        error = RuntimeError("shared LLM stream was abandoned")
+        try:
+            async for event in await open_stream():
+                flight.items.append(event)
+                self._notify(flight)
+                yield event
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._forget(self._streams, loop_key)
+            flight.error = error
+            flight.done = True
+            self._notify(flight)
+
+    async def _afollow(self, flight):
+        seen = 0
+        while True:
+            while seen < len(flight.items):
+                seen += 1
+                yield flight.items[seen - 1]
+            if flight.done:
+                if flight.error is not None:
+                    raise flight.error
+                return
+            try:
+                await asyncio.wait_for(flight.changed.wait(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError("timed out waiting for a shared LLM stream") from None
@@ -0,0 +1,105 @@
+# schedule_state.py
+"""
+Compact per-session schedule for the Oai tab.
+
+The solved schedule is held once as an int8 matrix with employee and
+shift index maps, instead of full DataFrame copies for the current and
+the original version. Edits go into a journal of swaps that supports
+undo/redo; reset undoes and truncates it. Only the slice on screen is
+turned into a DataFrame.
+
+Unlike scheduler.swap_shift (which only exchanges two 1s and so never
+changes anything), a swap here hands a shift from the employee who has
+it to the one who doesn't.
+
+    state = ScheduleState.from_frame(solve_schedule(avail_df))
+    state.swap("Alice", "Bob", "Mon_AM")
+    state.undo(); state.redo(); state.reset()
+    view = state.to_frame(rows=slice(0, 50))
+"""
+import numpy as np
+import pandas as pd
+
+
+class ScheduleState:
+    def __init__(self, matrix, employees, shifts):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.int8)
+        self.employees = list(employees)
+        self.shifts = list(shifts)
+        self.emp_index = {e: i for i, e in enumerate(self.employees)}
+        self.shift_index = {s: j for j, s in enumerate(self.shifts)}
+        self.journal = []  # [(emp1_row, emp2_row, shift_col)] in the order applied
+        self.cursor = 0  # journal[:cursor] is applied, journal[cursor:] can be redone
+        self.revision = 0  # bumped on every change, so callers can tell a cached export is stale
+
+    @classmethod
+    def from_frame(cls, schedule):
+        return cls(schedule.to_numpy(), schedule.index, schedule.columns)
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+    @property
+    def can_undo(self):
+        return self.cursor > 0
+
+    @property
+    def can_redo(self):
+        return self.cursor < len(self.journal)
+
+    def _apply(self, entry):
+        # Swapping two cells is its own inverse, so undo and redo both apply the entry
+        r1, r2, c = entry
+        self.matrix[r1, c], self.matrix[r2, c] = self.matrix[r2, c], self.matrix[r1, c]
+        self.revision += 1
+
+    def swap(self, emp1, emp2, shift):
+        """
+        Move `shift` between two employees: allowed when exactly one of
+        them has it assigned (1). Returns True if swapped, False otherwise
+        (including unknown names). A new swap drops anything that could
+        have been redone.
+        """
+        r1, r2, c = self.emp_index.get(emp1), self.emp_index.get(emp2), self.shift_index.get(shift)
+        if r1 is None or r2 is None or c is None or self.matrix[r1, c] == self.matrix[r2, c]:
+            return False
+        del self.journal[self.cursor:]
+        self.journal.append((r1, r2, c))
+        self._apply(self.journal[-1])
+        self.cursor += 1
+        return True
+
+    def undo(self):
+        if not self.can_undo:
+            return False
+        self.cursor -= 1
+        self._apply(self.journal[self.cursor])
+        return True
+
+    def redo(self):
+        if not self.can_redo:
+            return False
+        self._apply(self.journal[self.cursor])
+        self.cursor += 1
+        return True
+
+    def reset(self):
+        """Back to the solved schedule: undo every applied swap and truncate the journal."""
+        while self.undo():
+            pass
+        self.journal.clear()
+
+    def to_frame(self, rows=None, cols=None):
+        """The schedule (or a slice of it, e.g. rows=slice(0, 50)) as a DataFrame."""
+        rows = slice(None) if rows is None else rows
+        cols = slice(None) if cols is None else cols
+        return pd.DataFrame(self.matrix[rows, cols].astype(np.int64),
+                            index=self.employees[rows], columns=self.shifts[cols])
+
+    def to_csv(self, chunk_rows=1000):
+        """The whole schedule as CSV bytes, built a block of rows at a time."""
+        parts = [self.to_frame(rows=slice(0, 0)).to_csv(index=True)]
+        for start in range(0, len(self.employees), chunk_rows):
+            parts.append(self.to_frame(rows=slice(start, start + chunk_rows)).to_csv(index=True, header=False))
+        return "".join(parts).encode("utf-8")
@@ -1,31 +1,277 @@
 #scheduler.py
+import numpy as np
 import pandas as pd
 import random
+import time
 
-def solve_schedule(avail_df):
+CPSAT_TIME_LIMIT = 10.0  # seconds
+CPSAT_WORKERS = 8
+
+def availability_matrix(avail_df):
+    """
+    Split an availability frame into (employees, shifts, avail, max_hours):
+    avail is an int8 employees x shifts matrix, max_hours a float array.
+    """
     employees = avail_df['Employee'].tolist()
     shifts = avail_df.columns[2:].tolist()  # skip Employee & MaxHoursPerWeek
-    max_hours = dict(zip(employees, avail_df['MaxHoursPerWeek']))
+    avail = (avail_df[shifts].to_numpy() == 1).astype(np.int8)
+    max_hours = pd.to_numeric(avail_df['MaxHoursPerWeek'], errors='coerce').to_numpy(dtype=float)
+    return employees, shifts, avail, max_hours
+
+
+def greedy_assign(avail, max_hours, order):
+    """
+    Greedy pass over shifts in column order. Each shift goes to the available
+    employee under their cap with the fewest hours so far; ties go to whoever
+    comes first in `order`. Returns an int8 assignment matrix.
+    """
+    n_emp, n_shifts = avail.shape
+    by_shift = np.ascontiguousarray(avail[order].T)  # shifts x employees, in tie-break order
+    cap = max_hours[order]
+    hours = np.zeros(n_emp, dtype=np.int64)
+    never = np.iinfo(np.int64).max
+    picks = np.full(n_shifts, -1, dtype=np.int64)
+
+    for s in range(n_shifts):
+        eligible = (by_shift[s] == 1) & (hours < cap)
+        if not eligible.any():
+            continue
+        chosen = int(np.argmin(np.where(eligible, hours, never)))
+        picks[s] = chosen
+        hours[chosen] += 1
+
+    assigned = np.zeros((n_emp, n_shifts), dtype=np.int8)
+    filled = picks >= 0
+    assigned[np.asarray(order)[picks[filled]], np.nonzero(filled)[0]] = 1
+    return assigned
 
-    # Initialize schedule
-    schedule = pd.DataFrame(0, index=employees, columns=shifts)
+
+def cpsat_assign(avail, max_hours, hint=None, time_limit=CPSAT_TIME_LIMIT, workers=CPSAT_WORKERS):
+    """
+    CP-SAT model over the available cells: at most one employee per shift,
+    at most MaxHoursPerWeek shifts per employee. Maximises coverage first,
+    then minimises the heaviest load. `hint` (e.g. the greedy assignment)
+    warm-starts the search. Returns (assigned or None, stats).
+    """
+    from ortools.sat.python import cp_model
+
+    n_emp, n_shifts = avail.shape
+    caps = np.nan_to_num(max_hours, nan=0.0).clip(0, n_shifts).astype(int)
+    model = cp_model.CpModel()
+    cells = {}
+    for e, s in zip(*np.nonzero(avail)):
+        if caps[e] > 0:
+            cells[e, s] = model.NewBoolVar(f"x_{e}_{s}")
+
+    by_shift = [[] for _ in range(n_shifts)]
+    by_emp = [[] for _ in range(n_emp)]
+    for (e, s), var in cells.items():
+        by_shift[s].append(var)
+        by_emp[e].append(var)
+    for vars_ in by_shift:
+        if len(vars_) > 1:
+            model.AddAtMostOne(vars_)
+    max_load = model.NewIntVar(0, n_shifts, "max_load")
+    for e, vars_ in enumerate(by_emp):
+        if vars_:
+            load = sum(vars_)
+            model.Add(load <= int(caps[e]))
+            model.Add(load <= max_load)
+
+    covered = sum(cells.values())
+    # Any extra covered shift outweighs the whole balancing term
+    model.Maximize((n_shifts + 1) * covered - max_load)
+
+    if hint is not None:
+        for (e, s), var in cells.items():
+            model.AddHint(var, int(hint[e, s]))
+        model.AddHint(max_load, int(hint.sum(axis=1).max()) if n_emp else 0)
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = float(time_limit)
+    solver.parameters.num_workers = int(workers)
+    status = solver.Solve(model)
+
+    stats = {
+        "status": solver.StatusName(status),
+        "solve_time": solver.WallTime(),
+        "objective": None,
+        "best_bound": None,
+        "gap": None,
+    }
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return None, stats
+
+    objective = solver.ObjectiveValue()
+    bound = solver.BestObjectiveBound()
+    stats.update(objective=objective, best_bound=bound,
+                 gap=abs(bound - objective) / max(1.0, abs(objective)))
+    assigned = np.zeros((n_emp, n_shifts), dtype=np.int8)
+    for (e, s), var in cells.items():
+        if solver.BooleanValue(var):
+            assigned[e, s] = 1
+    return assigned, stats
+
+
+def solve_schedule(avail_df, seed=None, mode="greedy", time_limit=CPSAT_TIME_LIMIT, workers=CPSAT_WORKERS):
+    """
+    Assign each shift to at most one available employee within their
+    MaxHoursPerWeek. mode="greedy" is the fast fewest-hours pass;
+    mode="cpsat" solves for maximum coverage with OR-Tools, warm-started
+    from the greedy result, and falls back to it if no better solution is
+    found within `time_limit` seconds. Solver stats land in `schedule.attrs["solver"]`.
+    """
+    if mode not in ("greedy", "cpsat"):
+        raise ValueError(f"Unknown scheduling mode: {mode}")
+    employees, shifts, avail, max_hours = availability_matrix(avail_df)
 
     # Shuffle employees to reduce bias
-    random.shuffle(employees)
-
-    # Assign shifts
-    for s in shifts:
-        # Find available employees who haven't reached max_hours
-        candidates = [e for e in employees 
-                      if avail_df.loc[avail_df['Employee']==e, s].values[0] == 1
-                      and schedule.loc[e].sum() < max_hours[e]]
-        if candidates:
-            # Pick the one with fewest assigned hours so far
-            chosen = min(candidates, key=lambda e: schedule.loc[e].sum())
-            schedule.loc[chosen, s] = 1
+    rng = random.Random(seed) if seed is not None else random
+    order = list(range(len(employees)))
+    rng.shuffle(order)
 
+    start = time.perf_counter()
+    assigned = greedy_assign(avail, max_hours, order)
+    stats = {"mode": "greedy", "status": "GREEDY", "solve_time": time.perf_counter() - start,
+             "objective": None, "best_bound": None, "gap": None, "fallback": False}
+
+    if mode == "cpsat":
+        solved, cp_stats = cpsat_assign(avail, max_hours, hint=assigned,
+                                        time_limit=time_limit, workers=workers)
+        stats.update(cp_stats, mode="cpsat")
+        if solved is not None and solved.sum() >= assigned.sum():
+            assigned = solved
+        else:
+            stats["fallback"] = True
+
+    stats["covered"] = int(assigned.any(axis=0).sum())
+    stats["shifts"] = len(shifts)
+    schedule = pd.DataFrame(assigned.astype(np.int64), index=employees, columns=shifts)
+    schedule.attrs["solver"] = stats
     return schedule
 
+def _max_shifts(hours):
+    """A MaxHoursPerWeek value as a shift cap; blank or non-numeric means none, as in availability_matrix."""
+    hours = pd.to_numeric(hours, errors='coerce')
+    return 0 if pd.isna(hours) else max(0, int(hours))
+
+
+def _fill_shift(available, rows, caps, load):
+    """
+    Schedule row of the available employee under their cap with the
+    fewest shifts, or None. available/rows/caps follow the roster order;
+    rows is -1 for employees who cannot be picked.
+    """
+    available = available & (rows >= 0)
+    if not available.any():
+        return None
+    candidates = rows[available]
+    hours = load[candidates]
+    eligible = hours < caps[available]
+    if not eligible.any():
+        return None
+    return int(candidates[np.argmin(np.where(eligible, hours, np.iinfo(np.int64).max))])
+
+
+def repair_schedule(schedule, avail_df, availability=None, max_hours=None, removed=None):
+    """
+    Patch a schedule after a small change instead of re-solving it.
+
+    availability: {(employee, shift): 0 or 1} cells that changed
+    max_hours:    {employee: new MaxHoursPerWeek}
+    removed:      employees who left the roster
+
+    Only the affected shifts are reassigned; everyone else keeps their
+    shifts. The whole delta is checked first (KeyError for an unknown
+    employee or shift, nothing changed); changes for removed employees
+    are dropped. schedule and avail_df are updated in place. Returns a
+    list of {"shift", "removed", "assigned"} changes; "assigned" is None
+    when nobody could take the shift.
+    """
+    availability = dict(availability or {})
+    max_hours = dict(max_hours or {})
+    removed = list(dict.fromkeys(removed or []))
+
+    # Locate every employee and shift the delta names with one vectorised lookup
+    roster = pd.Index(avail_df['Employee'])
+    named = list(dict.fromkeys([*removed, *max_hours, *(e for e, _ in availability)]))
+    emp_rows, roster_rows = schedule.index.get_indexer(named), roster.get_indexer(named)
+    for emp, i, r in zip(named, emp_rows, roster_rows):
+        if i < 0 or r < 0:
+            raise KeyError(f"Unknown employee: {emp}")
+    emp_pos = dict(zip(named, emp_rows))
+    avail_rows = dict(zip(named, avail_df.index[roster_rows]))
+    named_shifts = list(dict.fromkeys(s for _, s in availability))
+    for shift, j in zip(named_shifts, schedule.columns.get_indexer(named_shifts)):
+        if j < 0:
+            raise KeyError(f"Unknown shift: {shift}")
+    shift_pos = schedule.columns.get_loc
+    gone = set(removed)
+    max_hours = {e: h for e, h in max_hours.items() if e not in gone}
+    availability = {k: v for k, v in availability.items() if k[0] not in gone}
+
+    assigned = schedule.to_numpy()
+    load = assigned.sum(axis=1)  # shifts per employee, in schedule order
+    staffed = assigned.sum(axis=0)  # employees per shift
+    changes = {}
+    to_fill = []
+
+    def held(emp):
+        return schedule.columns[schedule.iloc[emp_pos[emp]].to_numpy() == 1]
+
+    def unassign(emp, shift):
+        i, j = emp_pos[emp], shift_pos(shift)
+        schedule.iat[i, j] = 0
+        load[i] -= 1
+        staffed[j] -= 1
+        changes.setdefault(shift, {"shift": shift, "removed": emp, "assigned": None})
+        to_fill.append(shift)
+
+    for emp in removed:
+        for shift in held(emp):
+            unassign(emp, shift)
+
+    for emp, hours in max_hours.items():
+        avail_df.at[avail_rows[emp], 'MaxHoursPerWeek'] = hours
+        cap = _max_shifts(hours)
+        shifts = held(emp)
+        # Over the new cap: give up the latest shifts first
+        for shift in shifts[::-1][:max(0, len(shifts) - cap)]:
+            unassign(emp, shift)
+        if len(shifts) < cap:
+            # Room for more: pick up open shifts this employee can work
+            can_work = avail_df.loc[avail_rows[emp], schedule.columns].to_numpy() == 1
+            to_fill.extend(schedule.columns[can_work & (staffed == 0)])
+
+    for (emp, shift), value in availability.items():
+        avail_df.at[avail_rows[emp], shift] = int(value)
+        if not value and schedule.iat[emp_pos[emp], shift_pos(shift)] == 1:
+            unassign(emp, shift)
+        elif value and staffed[shift_pos(shift)] == 0:
+            to_fill.append(shift)
+
+    to_fill = [s for s in dict.fromkeys(to_fill) if staffed[shift_pos(s)] == 0]
+    if to_fill:
+        rows = schedule.index.get_indexer(roster)  # schedule row of each roster row
+        rows[roster.get_indexer(removed)] = -1
+        caps = pd.to_numeric(avail_df['MaxHoursPerWeek'], errors='coerce').to_numpy(dtype=float)
+        for shift in to_fill:
+            chosen = _fill_shift(avail_df[shift].to_numpy() == 1, rows, caps, load)
+            if chosen is None:
+                continue
+            j = shift_pos(shift)
+            schedule.iat[chosen, j] = 1
+            load[chosen] += 1
+            staffed[j] += 1
+            changes.setdefault(shift, {"shift": shift, "removed": None, "assigned": None})
+            changes[shift]["assigned"] = schedule.index[chosen]
+
+    if removed:
+        schedule.drop(index=removed, inplace=True)
+        avail_df.drop(index=[avail_rows[e] for e in removed], inplace=True)
+    return [c for c in changes.values() if c["removed"] != c["assigned"]]
+
+
 def swap_shift(schedule, emp1, emp2, shift):
     """
     Swap shifts between two employees only if both have the shift assigned (1).
@@ -0,0 +1,60 @@
+import sqlite3
+
+from answer_cache import AnswerCache, normalize_query
+
+import arai_rag
+
+
+def make(tmp_path, **kwargs):
+    return AnswerCache(path=str(tmp_path / "cache.sqlite3"), **kwargs)
+
+
+def rows(tmp_path):
+    with sqlite3.connect(tmp_path / "cache.sqlite3") as conn:
+        return conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+
+def test_normalize_query():
+    assert normalize_query("  How do I   CLOSE?! ") == "how do i close"
+
+
+def test_exact_and_near_hits(tmp_path):
+    cache = make(tmp_path)
+    cache.put("arai", "bullet", "How do I close?", "v1", "• Lock up", [{"section": "2.3"}], embedding=[1.0, 0.0])
+    assert cache.get("arai", "bullet", "how do i close", "v1") == ("• Lock up", [{"section": "2.3"}])
+    assert cache.get_similar("arai", "bullet", "v1", [0.99, 0.05])[0] == "• Lock up"
+    assert cache.get_similar("arai", "bullet", "v1", [0.0, 1.0]) is None
+    assert cache.get("arai", "paragraph", "how do i close", "v1") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["near_hits"] == 1
+
+
+def test_new_version_drops_old_entries(tmp_path):
+    cache = make(tmp_path)
+    cache.put("arai", "bullet", "q", "v1", "old", [])
+    assert cache.get("arai", "bullet", "q", "v2") is None
+    assert rows(tmp_path) == 0
+
+
+def test_expired_entries_are_misses_and_reads_do_not_delete(tmp_path):
+    cache = make(tmp_path, ttl=-1)  # everything is already expired
+    cache.put("arai", "bullet", "q", "v1", "answer", [], embedding=[1.0, 0.0])
+    assert cache.get("arai", "bullet", "q", "v1") is None
+    assert cache.get_similar("arai", "bullet", "v1", [1.0, 0.0]) is None
+    assert rows(tmp_path) == 1  # only put() deletes
+    cache.put("arai", "bullet", "other", "v1", "answer", [])
+    assert rows(tmp_path) == 1
+
+
+def test_lru_keeps_max_entries(tmp_path):
+    cache = make(tmp_path, max_entries=2)
+    for q in ("a", "b", "c"):
+        cache.put("arai", "bullet", q, "v1", q, [])
+    assert cache.get("arai", "bullet", "a", "v1") is None
+    assert cache.get("arai", "bullet", "c", "v1") == ("c", [])
+
+
+def test_top_k_is_part_of_the_key():
+    assert arai_rag._cache_style("bullet", "llm") == "bullet"
+    assert arai_rag._cache_style("bullet", "llm", arai_rag.TOP_K) == "bullet"
+    assert arai_rag._cache_style("bullet", "llm", 1) == "bullet/k1"
+    assert arai_rag._cache_style("bullet", "extractive", 1) == "bullet/extractive/k1"
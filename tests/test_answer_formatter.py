@@ -0,0 +1,33 @@
+import pytest
+
+from arai_rag import AnswerFormatter, format_answer
+
+TITLE = "3.3.1 Latte"
+OUTPUTS = [
+    "3.3.1 Latte\nStep 1: Pull a double shot into the cup. Step 2: Steam the milk to 65C.\n"
+    "• Pour the milk over the shot slowly.\n3.3.2 Cappuccino\nStep 1: Not this one.",
+    "Here is how:\n• Pull a double shot into the cup.\n• Pull a double shot into the cup again.\n- Serve hot.",
+    "The latte needs a double shot and milk steamed to 65C.\nLatte notes\n"
+    "Pour slowly so the foam stays on top, then serve it straight away to the guest.",
+    "",
+]
+
+
+def _streamed(out, style, size):
+    fmt = AnswerFormatter(style, TITLE, stream=True)
+    parts = [fmt.feed(out[i:i + size]) for i in range(0, len(out), size)]
+    return ("".join(parts) + fmt.finish()).strip()
+
+
+@pytest.mark.parametrize("style", ["bullet", "sentence"])
+@pytest.mark.parametrize("size", [1, 3, 17, 10_000])
+@pytest.mark.parametrize("out", OUTPUTS)
+def test_stream_matches_batch(out, style, size):
+    assert _streamed(out, style, size) == format_answer(out, style, TITLE)
+
+
+def test_bullet_style_keeps_steps_and_stops_at_next_section():
+    answer = format_answer(OUTPUTS[0], "bullet", TITLE)
+    assert answer.splitlines() == ["• Step 1: Pull a double shot into the cup.",
+                                   "• Step 2: Steam the milk to 65C.",
+                                   "• Pour the milk over the shot slowly."]
@@ -0,0 +1,63 @@
+import json
+
+import arai_rag
+
+
+def _hit(agent, title, score):
+    return {"id": f"{agent}:{title}", "text": title, "score": score, "match": "vector", "agent": agent,
+            "meta": {"title": title, "sentences": json.dumps([title])}}
+
+
+def test_no_hits_is_unrelated_before_routing():
+    assert arai_rag._assemble_prompt("q", "auto", "bullet", []) == {"answer": arai_rag.UNRELATED_ANSWER,
+                                                                    "sources": []}
+
+
+def test_missing_collection_is_skipped(monkeypatch):
+    def vector_query(agent, embeddings, top_k):
+        if agent == "kai":
+            raise ValueError("Collection kai_collection does not exist.")
+        return {"agent": agent}
+
+    monkeypatch.setattr(arai_rag, "vector_query", vector_query)
+    monkeypatch.setattr(arai_rag, "_fuse_hits", lambda q, agent, res, row, top_k: [
+        _hit(agent, "Close", 0.4 if agent == "jai" else 0.8)])
+    merged = arai_rag._fan_out(["q"], [0], [[0.0]], 5)
+    assert [h["agent"] for h in merged[0]] == ["jai", "arai"]
+
+
+def test_version_marks_missing_collections(monkeypatch):
+    def agent_version(agent, real=arai_rag.agent_version):
+        if agent == "kai":
+            raise ValueError("Collection kai_collection does not exist.")
+        return real(agent) if agent == "auto" else "7"
+
+    monkeypatch.setattr(arai_rag, "agent_version", agent_version)
+    assert arai_rag.agent_version("auto") == "arai:7|jai:7|kai:missing"
+
+
+def test_merge_orders_agents_by_closest_hit():
+    merged = arai_rag.merge_agent_hits({"arai": [_hit("arai", "A", 0.9)],
+                                        "jai": [_hit("jai", "B", None), _hit("jai", "C", 0.3)],
+                                        "kai": []})
+    assert [h["agent"] for h in merged] == ["jai", "jai", "arai"]
+
+
+def test_collection_handles_follow_the_alias(monkeypatch):
+    opened = []
+
+    class Client:
+        def get_collection(self, name):
+            opened.append(name)
+            return name
+
+    physical = {"arai_collection": "arai_collection__v1"}
+    monkeypatch.setattr(arai_rag, "_collections", {})
+    monkeypatch.setattr(arai_rag, "get_chroma_client", lambda: Client())
+    monkeypatch.setattr(arai_rag.collection_alias, "resolve", lambda name, persist_dir: physical[name])
+    assert arai_rag.get_collection("arai_collection") == "arai_collection__v1"
+    arai_rag.get_collection("arai_collection")
+    physical["arai_collection"] = "arai_collection__v2"
+    assert arai_rag.get_collection("arai_collection") == "arai_collection__v2"
+    assert opened == ["arai_collection__v1", "arai_collection__v2"]
+    assert arai_rag._collections == {"arai_collection": ("arai_collection__v2", "arai_collection__v2")}
@@ -0,0 +1,41 @@
+import pandas as pd
+
+import batch_scheduler
+
+
+def write_roster(path, n_emp=6, n_shifts=4):
+    df = pd.DataFrame([[1] * n_shifts for _ in range(n_emp)], columns=[f"S{j}" for j in range(n_shifts)])
+    df.insert(0, "MaxHoursPerWeek", 2)
+    df.insert(0, "Employee", [f"E{i}" for i in range(n_emp)])
+    df.to_csv(path, index=False)
+
+
+def test_summary_keeps_its_shape_for_failed_branches(tmp_path):
+    write_roster(tmp_path / "north.csv")
+    (tmp_path / "broken.csv").write_text("nope\n1\n")
+    summary = batch_scheduler.solve_branches(
+        {"north": str(tmp_path / "north.csv"), "broken": str(tmp_path / "broken.csv")},
+        str(tmp_path / "out"), workers=1, timeout=30)
+    assert list(summary.columns) == list(batch_scheduler._summary_row("x"))
+    rows = summary.set_index("branch")
+    assert rows.loc["north", "status"] == "ok" and rows.loc["north", "filled"] == 4
+    assert rows.loc["broken", "status"] == "error" and rows.loc["broken", "filled"] == 0
+    assert (tmp_path / "out" / "north_schedule.csv").exists()
+
+
+def test_crashed_worker_row_has_every_column():
+    row = batch_scheduler._summary_row("west", status="error", error="BrokenProcessPool: died")
+    assert row["coverage"] == 0.0 and row["unfilled_shifts"] == "" and row["status"] == "error"
+
+
+def test_sub_second_timeout_fires(tmp_path, monkeypatch):
+    def slow(*args, **kwargs):
+        import time
+        time.sleep(5)
+
+    monkeypatch.setattr(batch_scheduler, "solve_schedule", slow)
+    write_roster(tmp_path / "north.csv")
+    row = batch_scheduler._solve_branch("north", str(tmp_path / "north.csv"), str(tmp_path), "greedy",
+                                        None, None, 0.2)
+    assert row["status"] == "timeout"
+    assert row["seconds"] < 2
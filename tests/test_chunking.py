@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+import arai_rag
+import data_ingest
+import lexical_index
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(data_ingest, "count_tokens", lambda text: len(text.split()))
+
+
+def section(sentences, title="3.3 Recipes"):
+    return {"title": title, "sentences": sentences, "content": "\n".join([title] + sentences)}
+
+
+SENTENCES = [f"Sentence number {n} here." for n in range(10)]  # 4 words each
+
+
+def test_short_section_is_one_chunk():
+    assert data_ingest.chunk_section(section(SENTENCES[:2]), max_tokens=50) == [SENTENCES[:2]]
+    assert data_ingest.chunk_section(section(SENTENCES), max_tokens=0) == [SENTENCES]
+
+
+def test_chunks_overlap_and_cover_every_sentence():
+    chunks = data_ingest.chunk_section(section(SENTENCES), max_tokens=12, overlap=1)
+    assert len(chunks) > 1
+    assert all(sum(len(s.split()) for s in c) <= 12 for c in chunks)
+    for before, after in zip(chunks, chunks[1:]):
+        assert after[0] == before[-1]
+    assert list(dict.fromkeys(s for c in chunks for s in c)) == SENTENCES
+
+
+def chunked_index(n_chunks=4):
+    chunks = [SENTENCES[2 * n:2 * n + 2] for n in range(n_chunks)]
+    docs = [{"id": f"s3::{n}", "text": "\n".join(["3.3 Recipes"] + c),
+             "meta": {"title": "3.3 Recipes", "parent_id": "s3", "chunk": n, "sentences": json.dumps(c)}}
+            for n, c in enumerate(chunks)]
+    docs.append({"id": "s4", "text": "4.1 Greeting\nSay hello.",
+                 "meta": {"title": "4.1 Greeting", "parent_id": "s4", "chunk": 0,
+                          "sentences": json.dumps(["Say hello."])}})
+    whole = sum(chunks, [])
+    parent = {"id": "s3", "text": "\n".join(["3.3 Recipes"] + whole),
+              "meta": {"title": "3.3 Recipes", "sentences": json.dumps(whole)}}
+    return lexical_index.BM25Index.build(docs, parents=[parent])
+
+
+def hit(index, doc_id, score):
+    doc = next(d for d in index.docs if d["id"] == doc_id)
+    return dict(doc, score=score, match="vector", agent="arai")
+
+
+@pytest.mark.parametrize("mode, expected", [
+    ("chunk", SENTENCES[2:4]),
+    ("neighbors", SENTENCES[0:6]),
+    ("section", SENTENCES[:8]),
+])
+def test_expand_hits_links_chunks_to_their_parent(monkeypatch, mode, expected):
+    index = chunked_index()
+    monkeypatch.setattr(arai_rag, "agent_lexical_index", lambda agent: index)
+    expanded = arai_rag.expand_hits([hit(index, "s3::1", 0.4), hit(index, "s4", 0.6)], "arai", mode)
+    assert [h["id"] for h in expanded] == ["s3", "s4"]
+    assert json.loads(expanded[0]["meta"]["sentences"]) == expected
+    assert expanded[0]["score"] == 0.4
+
+
+def test_chunks_of_one_section_merge_with_its_best_distance(monkeypatch):
+    index = chunked_index()
+    monkeypatch.setattr(arai_rag, "agent_lexical_index", lambda agent: index)
+    expanded = arai_rag.expand_hits([hit(index, "s3::3", 0.5), hit(index, "s3::0", 0.3)], "arai", "chunk")
+    assert len(expanded) == 1
+    assert expanded[0]["score"] == 0.3
+    assert json.loads(expanded[0]["meta"]["sentences"]) == SENTENCES[0:2] + SENTENCES[6:8]
+
+
+def test_top_k_counts_sections_not_chunks(monkeypatch):
+    index = chunked_index()
+    monkeypatch.setattr(arai_rag, "agent_lexical_index", lambda agent: index)
+    ids = ["s3::0", "s3::1", "s3::2", "s3::3", "s4"]
+    res = {"ids": [ids], "documents": [[hit(index, i, 0)["text"] for i in ids]],
+           "metadatas": [[hit(index, i, 0)["meta"] for i in ids]], "distances": [[0.1, 0.2, 0.3, 0.4, 0.5]]}
+    fused = arai_rag._fuse_hits("unrelated words", "arai", res, 0, top_k=2)
+    assert {h["meta"]["parent_id"] for h in fused} == {"s3", "s4"}
+    assert arai_rag.fetch_k("arai", 2) == 2 * arai_rag.CHUNK_FETCH_FACTOR
@@ -0,0 +1,13 @@
+import collection_alias
+
+
+def test_logical_name():
+    assert collection_alias.logical_name("kai_collection__v1700000000") == "kai_collection"
+    assert collection_alias.logical_name("kai_collection") == "kai_collection"
+    assert collection_alias.logical_name("odd__vname") == "odd__vname"
+
+
+def test_evict_generations_keeps_other_collections_and_dirs():
+    cache = {("a", "x__v1"): 1, ("a", "x__v2"): 2, ("a", "y__v1"): 3, ("b", "x__v1"): 4}
+    collection_alias.evict_generations(cache, "a", "x__v3")
+    assert set(cache) == {("a", "y__v1"), ("b", "x__v1")}
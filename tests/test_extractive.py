@@ -0,0 +1,117 @@
+import hashlib
+import json
+import re
+
+import numpy as np
+import pytest
+
+import arai_rag
+from answer_cache import AnswerCache
+
+STEPS = ["Step 1: Pull a double shot into the cup.", "Step 2: Steam the milk to 65C.",
+         "Step 3: Pour the milk over the espresso."]
+
+
+def _hit(title, sentences, score=0.2, match="vector"):
+    return {"id": title, "text": "\n".join([title] + sentences), "score": score, "match": match,
+            "agent": "arai", "meta": {"title": title, "sentences": json.dumps(sentences)}}
+
+
+def encode(texts):
+    """Bag-of-words vectors: texts sharing words are similar."""
+    out = np.zeros((len(texts), 64), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for word in re.findall(r"[a-z]+", text.lower()):
+            out[i, int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1
+        out[i] /= np.linalg.norm(out[i]) or 1.0
+    return out.tolist()
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    monkeypatch.setattr(arai_rag, "embed_texts", encode)
+    monkeypatch.setattr(arai_rag, "embed_query", lambda q: encode([q])[0])
+    monkeypatch.setattr(arai_rag, "_sentence_vectors", {})
+    monkeypatch.setattr(arai_rag, "agent_lexical_index", lambda agent: None)
+    monkeypatch.setattr(arai_rag, "count_tokens", lambda text: len(text.split()))
+
+
+def ctx_for(query, hits, style="bullet"):
+    return {"query": query, "agent": "arai", "style": style, "target": hits[0], "sections": hits,
+            "sources": [{"section": h["meta"]["title"], "preview": h["text"][:200]} for h in hits]}
+
+
+def test_step_list():
+    assert arai_rag.step_list(_hit("3.3.1 Latte", STEPS)) == STEPS
+    assert arai_rag.step_list(_hit("3.3.1 Latte", STEPS + ["Serve with a smile."])) == STEPS
+    assert arai_rag.step_list(_hit("3.3.1 Latte", STEPS[:1] + ["Use whole milk.", "Serve hot."])) is None
+    assert arai_rag.step_list(_hit("4.1 Greeting", ["Smile.", "Say hello."])) is None
+
+
+def test_rank_sentences_best_first_with_section_and_position():
+    latte = _hit("3.3.1 Latte", ["Steam the milk to 65C.", "Use a 12 oz cup."])
+    hygiene = _hit("6.1 Hygiene", ["Wash your hands often."])
+    ranked = arai_rag.rank_sentences(encode(["steam the milk"])[0], [latte, hygiene])
+    assert [(rank, pos) for _, rank, pos, _ in ranked][0] == (0, 0)
+    assert ranked[0][3] == "Steam the milk to 65C."
+    assert [c[0] for c in ranked] == sorted((c[0] for c in ranked), reverse=True)
+    assert arai_rag.rank_sentences(encode(["x"])[0], [_hit("Title only", [])]) == []
+
+
+def test_extractive_confident_needs_a_real_distance():
+    assert arai_rag.extractive_confident(ctx_for("latte", [_hit("3.3.1 Latte", STEPS, score=0.2)]))
+    assert not arai_rag.extractive_confident(ctx_for("latte", [_hit("3.3.1 Latte", STEPS, score=0.9)]))
+    # A section named by number has no distance and goes to the LLM
+    assert not arai_rag.extractive_confident(ctx_for("3.3.1", [_hit("3.3.1 Latte", STEPS, None, "section")]))
+    long_list = [f"Step {n}: do thing {n}." for n in range(1, arai_rag.EXTRACTIVE_MAX_STEPS + 2)]
+    assert not arai_rag.extractive_confident(ctx_for("latte", [_hit("3.3.1 Latte", long_list)]))
+
+
+def test_extractive_answer_quotes_every_step():
+    answer, sources = arai_rag.extractive_answer(ctx_for("how to make a latte", [_hit("3.3.1 Latte", STEPS)]))
+    assert answer == "\n".join(f"• {s}" for s in STEPS)
+    assert [s["section"] for s in sources] == ["3.3.1 Latte"]
+
+
+def test_extractive_answer_keeps_document_order():
+    lines = ["Use cold whole milk.", "Purge the steam wand first.", "Steam the milk to 65C."]
+    answer, _ = arai_rag.extractive_answer(ctx_for("steam wand milk", [_hit("3.2 Milk", lines)]))
+    kept = [x[2:] for x in answer.splitlines()]
+    assert kept and kept == [x for x in lines if x in kept]
+
+
+def test_extractive_answer_with_nothing_similar_is_unrelated():
+    hit = _hit("6.1 Hygiene", ["Wash your hands often.", "Tie back long hair."])
+    answer, sources = arai_rag.extractive_answer(ctx_for("quarterly tax filing deadline", [hit]))
+    assert answer == arai_rag.UNRELATED_ANSWER
+    assert sources == []
+
+
+def test_cache_style():
+    assert arai_rag._cache_style("bullet", "llm") == "bullet"
+    assert arai_rag._cache_style("bullet", "extractive") == "bullet/extractive"
+    assert arai_rag._cache_style("paragraph", "auto") == "paragraph/auto"
+    with pytest.raises(ValueError):
+        arai_rag._cache_style("bullet", "verbatim")
+
+
+def test_modes_are_cached_apart(monkeypatch, tmp_path):
+    cache = AnswerCache(path=str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(arai_rag, "_answer_cache", cache)
+    monkeypatch.setattr(arai_rag, "agent_version", lambda agent: "v1")
+    monkeypatch.setattr(arai_rag, "exact_section", lambda *args: None)
+    monkeypatch.setattr(arai_rag, "retrieve", lambda *args, **kwargs: [_hit("3.3.1 Latte", STEPS)])
+    llm = []
+    monkeypatch.setattr(arai_rag, "_complete", lambda ctx: llm.append(ctx) or "• from the LLM")
+
+    query = "how do I make a latte"
+    extractive, _ = arai_rag.answer_question(query, "arai", mode="extractive")
+    assert extractive.startswith("• Step 1") and not llm
+    assert cache.get("arai", "bullet/extractive", query, "v1")[0] == extractive
+    assert cache.get("arai", "bullet", query, "v1") is None
+
+    assert arai_rag.answer_question(query, "arai", mode="llm")[0] == "• from the LLM"
+    assert len(llm) == 1
+    assert arai_rag.answer_question(query, "arai", mode="extractive")[0] == extractive
+    assert arai_rag.answer_question(query, "arai", mode="llm")[0] == "• from the LLM"
+    assert len(llm) == 1
@@ -0,0 +1,77 @@
+import csv
+import sqlite3
+
+import kai_store
+from kai_store import GLOBAL_SCOPE, KaiStore
+
+
+def _store(tmp_path, ideas=None, kudos=None):
+    return KaiStore(str(tmp_path / "kai.sqlite3"),
+                    str(ideas or tmp_path / "ideas.csv"), str(kudos or tmp_path / "kudos.csv"))
+
+
+def _write_csv(path, columns, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def test_add_idea_without_branch_stores_null(tmp_path):
+    store = _store(tmp_path)
+    store.add_idea("Oat milk", "Alice", None, "t1")
+    store.add_idea("Loyalty card", "Bob", "None", "t2")
+    store.add_idea("Night shift", "Cara", 7, "t3")
+    branches = [r[0] for r in sqlite3.connect(store.path).execute("SELECT branch_id FROM ideas ORDER BY seq")]
+    assert branches == [None, None, "7"]
+    assert [i["idea_text"] for i in store.top_ideas(branch=7)] == ["Night shift"]
+    assert set(store.all_top_ideas()) == {GLOBAL_SCOPE, "7"}
+
+
+def test_top_ideas_follow_upvotes(tmp_path):
+    store = _store(tmp_path)
+    ids = [store.add_idea(f"idea {i}", "Alice", "1", f"t{i}") for i in range(kai_store.SUMMARY_SIZE + 2)]
+    for _ in range(3):
+        store.upvote(ids[-1])
+    store.upvote(ids[-2])
+    top = store.top_ideas(3, branch="1")
+    assert [i["idea_id"] for i in top] == [ids[-1], ids[-2], ids[0]]
+    assert top[0]["upvotes"] == 4
+    assert not store.upvote(9999)
+
+
+def test_recent_kudos_keep_the_latest_per_branch(tmp_path):
+    store = _store(tmp_path)
+    for i in range(kai_store.SUMMARY_SIZE + 3):
+        store.add_kudos("Alice", "Bob", f"thanks {i}", f"t{i}", branch="1" if i % 2 else None)
+    everyone = store.recent_kudos()
+    assert [k["message"] for k in everyone] == [f"thanks {i}" for i in range(3, kai_store.SUMMARY_SIZE + 3)]
+    assert [k["message"] for k in store.recent_kudos(2, branch="1")] == ["thanks 5", "thanks 7"]
+
+
+def test_legacy_csv_import_and_none_branch_migration(tmp_path):
+    ideas_csv, kudos_csv = tmp_path / "ideas.csv", tmp_path / "kudos.csv"
+    _write_csv(ideas_csv, kai_store.IDEA_COLUMNS,
+               [[1001, "Cold brew", "Alice", "3", 5, "t1"], [1002, "Tip jar", "Bob", "None", 2, "t2"]])
+    _write_csv(kudos_csv, kai_store.KUDOS_COLUMNS, [[1, "Alice", "Bob", "great shift", "t1"]])
+    store = _store(tmp_path, ideas_csv, kudos_csv)
+    assert store.add_idea("Playlist", "Cara", "3", "t3") == 1003
+    assert store.all_top_ideas().keys() == {GLOBAL_SCOPE, "3"}
+    assert [i["idea_id"] for i in store.top_ideas()] == [1001, 1002, 1003]
+    assert store.top_ideas()[1]["branch_id"] is None
+    assert store.recent_kudos()[0]["branch_id"] is None
+
+    # Reopening does not import the CSVs again
+    assert len(_store(tmp_path, ideas_csv, kudos_csv).top_ideas()) == 3
+
+
+def test_export_round_trips(tmp_path):
+    store = _store(tmp_path)
+    store.add_idea("Oat milk", "Alice", "2", "t1")
+    store.add_kudos("Alice", "Bob", "thanks", "t1")
+    out_ideas, out_kudos = tmp_path / "out_ideas.csv", tmp_path / "out_kudos.csv"
+    store.export_csv(str(out_ideas), str(out_kudos))
+    with open(out_ideas, encoding="utf-8") as f:
+        assert list(csv.DictReader(f))[0]["idea_text"] == "Oat milk"
+    with open(out_kudos, encoding="utf-8") as f:
+        assert list(csv.DictReader(f))[0]["message"] == "thanks"
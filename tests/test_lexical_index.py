@@ -0,0 +1,68 @@
+import pytest
+
+import lexical_index
+
+
+def _doc(i, title, body="", **meta):
+    return {"id": f"s{i}", "text": f"{title}\n{body}", "meta": dict(title=title, **meta)}
+
+
+@pytest.fixture
+def index():
+    docs = [
+        _doc(0, "2.3 Closing Checklist (The \"Last Out\")", "Lock the doors."),
+        _doc(1, "3.3.1 Latte", "Step 1: Pull a double shot."),
+        _doc(2, "3.3.4 Mocha (Flavored Latte)", "Step 1: Add chocolate."),
+        _doc(3, "3.2 Milk Steaming Standard", "Steam to 65C."),
+    ]
+    return lexical_index.BM25Index.build(docs)
+
+
+def title_of(index, found):
+    return index.docs[found[0]]["meta"]["title"]
+
+
+@pytest.mark.parametrize("query", ["section 3.3.1", "Section 3.3.1?", "see § 3.3.1", "3.3.1", " 3.3.1. "])
+def test_section_number_reference(index, query):
+    found = index.exact_match(query)
+    assert found[1] == "number"
+    assert title_of(index, found) == "3.3.1 Latte"
+
+
+@pytest.mark.parametrize("query", ["what does 3.0 mean", "it costs 2.50 now", "is 3.3.1 about milk?", "3.2 grams of coffee"])
+def test_numbers_inside_a_question_are_not_references(index, query):
+    assert index.exact_match(query) is None
+
+
+def test_one_word_title_only_matches_the_whole_query(index):
+    assert title_of(index, index.exact_match("Latte")) == "3.3.1 Latte"
+    assert title_of(index, index.exact_match("3.3.1 Latte")) == "3.3.1 Latte"
+    assert index.exact_match("how do I make a latte for a customer?") is None
+
+
+def test_multi_word_title_inside_a_question(index):
+    found = index.exact_match("what goes on the closing checklist tonight?")
+    assert found[1] == "title"
+    assert title_of(index, found) == "2.3 Closing Checklist (The \"Last Out\")"
+    assert title_of(index, index.exact_match("how hot for milk steaming standard")) == "3.2 Milk Steaming Standard"
+
+
+def test_chunks_map_back_to_their_section():
+    docs = [_doc(0, "3.3.1 Latte", "Step 1", parent_id="s9", chunk=0),
+            _doc(1, "3.3.1 Latte", "Step 2", parent_id="s9", chunk=1)]
+    parent = {"id": "s9", "text": "3.3.1 Latte\nStep 1\nStep 2", "meta": {"title": "3.3.1 Latte"}}
+    index = lexical_index.BM25Index.build(docs, parents=[parent])
+    idx, kind = index.exact_match("section 3.3.1")
+    assert index.parent(index.docs[idx]) is parent
+    assert index.children["s9"] == [0, 1]
+
+
+def test_load_index_evicts_older_generations(tmp_path, index):
+    persist = str(tmp_path)
+    lexical_index._loaded.clear()
+    for physical in ("arai_collection__v1", "arai_collection__v2", "kai_collection__v1"):
+        lexical_index.save_index(index, persist, physical)
+    lexical_index.load_index(persist, "arai_collection__v1")
+    lexical_index.load_index(persist, "kai_collection__v1")
+    assert lexical_index.load_index(persist, "arai_collection__v2") is not None
+    assert set(lexical_index._loaded) == {(persist, "arai_collection__v2"), (persist, "kai_collection__v1")}
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+from openai import AsyncOpenAI, OpenAI
+
+import llm_guard
+from fake_openai import FakeOpenAIServer
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def status_error(status):
+    request = httpx.Request("POST", "http://llm/v1/chat/completions")
+    return openai.APIStatusError("boom", response=httpx.Response(status, request=request), body=None)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_guard, "backoff_delay", lambda attempt: 0.0)
+
+
+def test_retry_until_success():
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise status_error(503)
+        return "ok"
+
+    stats = {}
+    assert llm_guard.call_with_retry(fn, breaker=llm_guard.CircuitBreaker(), stats=stats) == "ok"
+    assert stats["attempts"] == 3
+
+
+def test_bad_request_is_not_retried():
+    calls = []
+
+    def fn(timeout):
+        calls.append(1)
+        raise status_error(400)
+
+    with pytest.raises(openai.APIStatusError):
+        llm_guard.call_with_retry(fn, breaker=llm_guard.CircuitBreaker())
+    assert len(calls) == 1
+
+
+def test_breaker_opens_fails_fast_and_recovers():
+    breaker = llm_guard.CircuitBreaker(failures=2, cooldown=0.05)
+
+    def down(timeout):
+        raise status_error(503)
+
+    with pytest.raises(llm_guard.CircuitOpen):  # the third attempt finds the circuit open
+        llm_guard.call_with_retry(down, breaker=breaker)
+    assert breaker.state == "open"
+    with pytest.raises(llm_guard.CircuitOpen):
+        llm_guard.call_with_retry(lambda timeout: "never", breaker=breaker)
+    time.sleep(0.06)
+    assert llm_guard.call_with_retry(lambda timeout: "up", breaker=breaker) == "up"
+    assert breaker.state == "closed"
+
+
+def test_definite_error_ends_the_failure_streak():
+    breaker = llm_guard.CircuitBreaker(failures=3, cooldown=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    with pytest.raises(openai.APIStatusError):
+        llm_guard.call_with_retry(lambda timeout: (_ for _ in ()).throw(status_error(404)), breaker=breaker)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_local_error_frees_the_half_open_trial():
+    breaker = llm_guard.CircuitBreaker(failures=1, cooldown=0.0)
+    breaker.record_failure()
+    with pytest.raises(ValueError):  # the half-open trial ends in a local error
+        llm_guard.call_with_retry(lambda timeout: (_ for _ in ()).throw(ValueError("bad")), breaker=breaker)
+    assert breaker.allow()
+
+
+def test_single_flight_shares_one_call():
+    flight = llm_guard.SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(4)]
+    for t in followers:
+        t.start()
+    time.sleep(0.05)
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+    assert len(calls) == 1
+    assert sorted(results) == [("answer", False)] + [("answer", True)] * 4
+    assert flight.do("k", lambda: "again") == ("again", False)  # nothing kept afterwards
+
+
+def test_single_flight_shares_errors():
+    flight = llm_guard.SingleFlight()
+    with pytest.raises(KeyError):
+        flight.do("k", lambda: {}["missing"])
+    assert flight.do("k", lambda: 1) == (1, False)
+
+
+def test_stream_followers_replay_the_leaders_events():
+    with FakeOpenAIServer(latency=0.05, token_delay=0.01) as server:
+        client = OpenAI(base_url=server.base_url, api_key="fake")
+        flight = llm_guard.SingleFlight()
+
+        def open_stream():
+            return client.chat.completions.create(model="m", messages=MESSAGES, stream=True)
+
+        def read():
+            events, shared = flight.stream("k", open_stream)
+            text = "".join(e.choices[0].delta.content or "" for e in events if e.choices)
+            out.append((text, shared))
+
+        out = []
+        threads = [threading.Thread(target=read) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        assert server.requests == 1
+        assert len({text for text, _ in out}) == 1 and out[0][0]
+        assert sorted(shared for _, shared in out) == [False] + [True] * 4
+
+
+def test_async_calls_and_streams_are_shared():
+    async def main(server):
+        client = AsyncOpenAI(base_url=server.base_url, api_key="fake")
+        flight = llm_guard.SingleFlight()
+
+        async def call():
+            return await flight.ado("c", lambda: client.chat.completions.create(model="m", messages=MESSAGES))
+
+        async def stream():
+            events, shared = flight.astream("s", lambda: client.chat.completions.create(
+                model="m", messages=MESSAGES, stream=True))
+            text = ""
+            async for event in events:
+                text += (event.choices[0].delta.content or "") if event.choices else ""
+            return text, shared
+
+        calls = await asyncio.gather(*(call() for _ in range(5)))
+        streams = await asyncio.gather(*(stream() for _ in range(5)))
+        return calls, streams
+
+    with FakeOpenAIServer(latency=0.05, token_delay=0.01) as server:
+        calls, streams = asyncio.run(main(server))
+        assert server.requests == 2
+    assert sorted(shared for _, shared in calls) == [False] + [True] * 4
+    assert len({text for text, _ in streams}) == 1 and streams[0][0]
+    assert sorted(shared for _, shared in streams) == [False] + [True] * 4
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import arai_rag
+
+
+def _hit(title, sentences):
+    return {"id": title, "text": "\n".join([title] + sentences), "score": 0.5, "match": "vector",
+            "meta": {"title": title, "sentences": json.dumps(sentences)}}
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(arai_rag, "count_tokens", lambda text: len(text.split()))
+    monkeypatch.setattr(arai_rag, "agent_lexical_index", lambda agent: None)
+
+
+STEPS = [f"Step {n}: do the {n}th thing carefully." for n in range(1, 9)]  # 7 words each
+
+
+def test_step_list_is_whole_or_left_out():
+    # 8 steps x 7 words = 56 tokens: more than the budget, so no step is sent
+    intro = ["Closing takes about an hour."]
+    packed, used = arai_rag.pack_context("how do I close the shop", "arai", [_hit("2.3 Closing", intro + STEPS)],
+                                         budget=30)
+    assert packed[0][1] == intro
+    packed, used = arai_rag.pack_context("how do I close the shop", "arai", [_hit("2.3 Closing", intro + STEPS)],
+                                         budget=61)
+    assert packed[0][1] == intro + STEPS
+    assert used == 61
+
+
+def test_whole_section_fits():
+    packed, used = arai_rag.pack_context("close", "arai", [_hit("2.3 Closing", STEPS)], budget=500)
+    assert packed[0][1] == STEPS
+    assert used == 56
+
+
+def test_target_is_kept_over_budget():
+    packed, used = arai_rag.pack_context("close", "arai", [_hit("2.3 Closing", STEPS)], budget=3)
+    assert packed[0][1] == STEPS
+
+
+def test_related_sections_need_a_shared_term_and_keep_their_order():
+    target = _hit("3.3.1 Latte", ["Pull a double shot.", "Steam the milk."])
+    unrelated = _hit("6.1 Hygiene", ["Wash your hands."])
+    related = _hit("3.2 Milk", ["Milk is steamed to 65C.", "Never reheat milk."])
+    packed, _ = arai_rag.pack_context("steam milk for a latte", "arai", [target, unrelated, related], budget=500)
+    assert [hit["id"] for hit, _ in packed] == ["3.3.1 Latte", "3.2 Milk"]
+    assert packed[1][1] == ["Milk is steamed to 65C.", "Never reheat milk."]
+
+
+def test_long_target_keeps_the_relevant_sentence_and_leaves_room():
+    filler = [f"General note number {n} about the store." for n in range(40)]  # 7 words each
+    target = _hit("2.3 Closing", filler + ["Empty the grinder hopper every night."])
+    related = _hit("5.2 Grinders", ["Clean the grinder burrs weekly.", "Store beans airtight."])
+    packed, used = arai_rag.pack_context("when do I empty the grinder hopper", "arai", [target, related],
+                                         budget=40)
+    sentences = dict((hit["id"], lines) for hit, lines in packed)
+    assert "Empty the grinder hopper every night." in sentences["2.3 Closing"]
+    assert "Clean the grinder burrs weekly." in sentences["5.2 Grinders"]
+    assert used <= 40
@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+from schedule_state import ScheduleState
+
+
+@pytest.fixture
+def state():
+    schedule = pd.DataFrame([[1, 0, 1], [0, 1, 1], [0, 0, 0]],
+                            index=["Alice", "Bob", "Cara"], columns=["Mon_AM", "Mon_PM", "Tue_AM"])
+    return ScheduleState.from_frame(schedule)
+
+
+def test_swap_moves_a_shift_to_the_employee_without_it(state):
+    assert state.swap("Alice", "Cara", "Mon_AM")
+    assert state.to_frame().loc[["Alice", "Cara"], "Mon_AM"].tolist() == [0, 1]
+    # Both assigned, both free, or unknown names: nothing to move
+    assert not state.swap("Alice", "Bob", "Tue_AM")
+    assert not state.swap("Alice", "Cara", "Mon_PM")
+    assert not state.swap("Alice", "Zed", "Mon_AM")
+    assert not state.swap("Alice", "Bob", "Sun_AM")
+    assert state.cursor == 1
+
+
+def test_undo_redo_and_reset(state):
+    original = state.matrix.copy()
+    state.swap("Alice", "Cara", "Mon_AM")
+    state.swap("Bob", "Cara", "Mon_PM")
+    after = state.matrix.copy()
+    assert state.undo() and state.undo() and not state.undo()
+    assert (state.matrix == original).all()
+    assert state.redo() and state.redo() and not state.redo()
+    assert (state.matrix == after).all()
+    state.undo()
+    state.swap("Cara", "Bob", "Tue_AM")  # a new edit drops the redo tail
+    assert not state.can_redo
+    state.reset()
+    assert (state.matrix == original).all() and state.journal == []
+
+
+def test_revision_changes_on_every_edit(state):
+    seen = {state.revision}
+    state.swap("Alice", "Cara", "Mon_AM")
+    seen.add(state.revision)
+    state.undo()
+    seen.add(state.revision)
+    assert len(seen) == 3
+
+
+def test_to_csv_matches_pandas_in_chunks(state):
+    state.swap("Alice", "Cara", "Mon_AM")
+    assert state.to_csv(chunk_rows=2) == state.to_frame().to_csv(index=True).encode("utf-8")
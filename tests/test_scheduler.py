@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import scheduler
+
+
+def roster(avail, max_hours):
+    n_emp, n_shifts = avail.shape
+    df = pd.DataFrame(avail, columns=[f"S{j}" for j in range(n_shifts)])
+    df.insert(0, "MaxHoursPerWeek", max_hours)
+    df.insert(0, "Employee", [f"E{i}" for i in range(n_emp)])
+    return df
+
+
+def assert_valid(schedule, avail_df):
+    avail = avail_df.set_index("Employee").loc[schedule.index, schedule.columns].to_numpy()
+    caps = pd.to_numeric(avail_df.set_index("Employee").loc[schedule.index, "MaxHoursPerWeek"],
+                         errors="coerce").fillna(0).to_numpy()
+    cells = schedule.to_numpy()
+    assert (cells <= avail).all(), "assigned a shift to someone unavailable"
+    assert (cells.sum(axis=0) <= 1).all(), "a shift has two employees"
+    assert (cells.sum(axis=1) <= caps).all(), "someone is over their cap"
+
+
+def coverage(schedule):
+    return int(schedule.to_numpy().any(axis=0).sum())
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_repair_matches_a_full_resolve(seed):
+    # Caps never bind, so every shift with an available employee is coverable:
+    # the repaired schedule must cover exactly as much as solving from scratch
+    rng = np.random.default_rng(seed)
+    n_emp, n_shifts = 12, 15
+    avail_df = roster((rng.random((n_emp, n_shifts)) < 0.3).astype(int), [n_shifts] * n_emp)
+    schedule = scheduler.solve_schedule(avail_df, seed=seed)
+    before = schedule.copy()
+
+    cells = {(f"E{rng.integers(n_emp)}", f"S{rng.integers(n_shifts)}"): int(rng.integers(2)) for _ in range(5)}
+    removed = [f"E{rng.integers(n_emp)}"]
+    changes = scheduler.repair_schedule(schedule, avail_df, availability=cells, removed=removed)
+
+    assert removed[0] not in schedule.index
+    assert list(avail_df["Employee"]) == list(schedule.index)
+    assert_valid(schedule, avail_df)
+    assert coverage(schedule) == coverage(scheduler.solve_schedule(avail_df.reset_index(drop=True), seed=seed))
+    # Shifts not named in the changes keep their employee
+    touched = {c["shift"] for c in changes}
+    untouched = [s for s in schedule.columns if s not in touched]
+    kept = before.loc[schedule.index, untouched]
+    assert (schedule[untouched].to_numpy() == kept.to_numpy()).all()
+
+
+def test_lost_availability_moves_the_shift():
+    avail_df = roster(np.array([[1, 1], [1, 0]]), [5, 5])
+    schedule = pd.DataFrame([[1, 1], [0, 0]], index=["E0", "E1"], columns=["S0", "S1"])
+    changes = scheduler.repair_schedule(schedule, avail_df, availability={("E0", "S0"): 0})
+    assert changes == [{"shift": "S0", "removed": "E0", "assigned": "E1"}]
+    assert schedule.loc["E1", "S0"] == 1 and schedule.loc["E0", "S1"] == 1
+
+
+def test_lower_cap_gives_up_latest_shifts():
+    avail_df = roster(np.array([[1, 1, 1], [0, 0, 1]]), [3, 3])
+    schedule = pd.DataFrame([[1, 1, 1], [0, 0, 0]], index=["E0", "E1"], columns=["S0", "S1", "S2"])
+    changes = scheduler.repair_schedule(schedule, avail_df, max_hours={"E0": 1})
+    assert schedule.loc["E0"].tolist() == [1, 0, 0]
+    assert {c["shift"]: c["assigned"] for c in changes} == {"S1": None, "S2": "E1"}
+
+
+def test_blank_cap_means_no_shifts():
+    avail_df = roster(np.array([[1, 1]]), [2])
+    schedule = pd.DataFrame([[1, 1]], index=["E0"], columns=["S0", "S1"])
+    scheduler.repair_schedule(schedule, avail_df, max_hours={"E0": float("nan")})
+    assert schedule.to_numpy().sum() == 0
+
+
+def test_raised_cap_picks_up_open_shifts():
+    avail_df = roster(np.array([[1, 1, 0]]), [1])
+    schedule = pd.DataFrame([[1, 0, 0]], index=["E0"], columns=["S0", "S1", "S2"])
+    changes = scheduler.repair_schedule(schedule, avail_df, max_hours={"E0": 3})
+    assert schedule.loc["E0"].tolist() == [1, 1, 0]
+    assert changes == [{"shift": "S1", "removed": None, "assigned": "E0"}]
+
+
+def test_removed_employee_other_changes_are_ignored():
+    avail_df = roster(np.array([[1, 0], [1, 1]]), [2, 2])
+    schedule = pd.DataFrame([[1, 0], [0, 1]], index=["E0", "E1"], columns=["S0", "S1"])
+    changes = scheduler.repair_schedule(schedule, avail_df, removed=["E0"], max_hours={"E0": 5},
+                                        availability={("E0", "S1"): 1})
+    assert list(schedule.index) == ["E1"]
+    assert list(avail_df["Employee"]) == ["E1"]
+    assert changes == [{"shift": "S0", "removed": "E0", "assigned": "E1"}]
+
+
+@pytest.mark.parametrize("delta", [{"removed": ["Nobody"]}, {"max_hours": {"Nobody": 2}},
+                                   {"availability": {("E0", "S9"): 1}},
+                                   {"availability": {("E0", "S0"): 0, ("Nobody", "S0"): 1}}])
+def test_bad_delta_changes_nothing(delta):
+    avail_df = roster(np.array([[1, 1]]), [2])
+    schedule = pd.DataFrame([[1, 1]], index=["E0"], columns=["S0", "S1"])
+    before_avail, before_schedule = avail_df.copy(), schedule.copy()
+    with pytest.raises(KeyError):
+        scheduler.repair_schedule(schedule, avail_df, **delta)
+    pd.testing.assert_frame_equal(avail_df, before_avail)
+    pd.testing.assert_frame_equal(schedule, before_schedule)
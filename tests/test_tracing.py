@@ -0,0 +1,15 @@
+import urllib.request
+
+import tracing
+
+
+def test_serve_metrics_binds_loopback_by_default():
+    httpd = tracing.serve_metrics(0)
+    try:
+        host, port = httpd.server_address[:2]
+        assert host == "127.0.0.1"
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as resp:
+            assert resp.status == 200
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
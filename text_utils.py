@@ -0,0 +1,42 @@
+# text_utils.py
+"""Sentence splitting and token counting shared by ingest and arai_rag."""
+import re
+from functools import lru_cache
+
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[\.\!\?])\s+|(?=Step \d+:)')
+TOKEN_ESTIMATE_RE = re.compile(r"\w{1,4}|[^\w\s]")  # ~ BPE pieces: short word chunks and punctuation
+
+
+def split_sentences(text):
+    # Split on punctuation or "Step n:"
+    sents = SENTENCE_SPLIT_RE.split(text.strip())
+    return [s.strip() for s in sents if s.strip()]
+
+
+def section_sentences(title, text):
+    """
+    The section's sentences/steps as they go into a prompt: split, with
+    lines repeating the section title dropped and duplicates removed.
+    """
+    title = title.strip()
+    sentences = []
+    seen = set()
+    for s in split_sentences(text):
+        if s != title and s not in seen:
+            sentences.append(s)
+            seen.add(s)
+    return sentences
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text):
+    """
+    Token count from the embedding model's tokenizer, falling back to a
+    word-piece estimate if it cannot be loaded. These are MiniLM WordPiece
+    tokens, not GPT tokens: budgets built on them are approximate.
+    """
+    from embeddings import get_tokenizer
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return len(TOKEN_ESTIMATE_RE.findall(text))
+    return len(tokenizer.encode(text, add_special_tokens=False))
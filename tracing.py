@@ -0,0 +1,270 @@
+# tracing.py
+"""
+Lightweight tracing for the RAG pipeline.
+
+A trace is one request (e.g. one answer_question call) made of named
+spans (embed, vector_query, llm, ...). Each span records its duration in
+milliseconds plus whatever attributes the code attaches (hit counts,
+distances, token counts, cache or fallback outcomes).
+
+    with tracing.trace("answer", agent="arai"):
+        with tracing.span("embed") as sp:
+            sp["texts"] = 1
+
+Finished traces are appended as one JSON line to a rotating log
+(TRACE_FILE), and folded into in-memory per-stage latency windows that
+back stage_percentiles() and the Prometheus text exposition.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+# ---------------- CONFIG ----------------
+TRACING_ENABLED = os.getenv("RAG_TRACING", "1") != "0"
+TRACE_FILE = os.getenv("RAG_TRACE_FILE", "rag_traces.jsonl")  # empty string: no file export
+TRACE_MAX_BYTES = 5 * 1024 * 1024
+TRACE_BACKUPS = 3
+STATS_WINDOW = 1000  # most recent durations kept per stage for percentiles
+METRICS_PORT = int(os.getenv("RAG_METRICS_PORT", "0")) or None
+METRICS_HOST = os.getenv("RAG_METRICS_HOST", "127.0.0.1")  # "0.0.0.0" exposes /metrics on every interface
+OUTCOME_KEYS = ("cache", "fallback", "unrelated", "llm_error", "answer_mode")
+TOKEN_KEYS = ("prompt_tokens", "completion_tokens")
+# ----------------------------------------
+
+_current = contextvars.ContextVar("rag_trace", default=None)
+_stats_lock = threading.Lock()
+_durations = defaultdict(lambda: deque(maxlen=STATS_WINDOW))  # stage -> recent ms
+_duration_totals = defaultdict(lambda: [0, 0.0])  # stage -> [count, sum ms]
+_outcomes = defaultdict(int)  # (key, value) -> count
+_tokens = defaultdict(int)  # prompt_tokens/completion_tokens -> total
+_logger = None
+_logger_lock = threading.Lock()
+
+
+class Trace:
+    """One traced request; spans are appended as they finish."""
+
+    def __init__(self, name, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = dict(attrs)
+        self.spans = []
+        self.wall_start = time.time()
+        self._start = time.perf_counter()
+        self._finished = False
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time a stage; yields its attribute dict for the caller to fill in."""
+        record = {"name": name, "attrs": dict(attrs)}
+        start = time.perf_counter()
+        try:
+            yield record["attrs"]
+        except Exception as e:
+            record["attrs"]["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["offset_ms"] = round((start - self._start) * 1000, 3)
+            record["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            self.spans.append(record)
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self._start) * 1000, 3)
+
+    def finish(self, **attrs):
+        """Record the trace once; later calls are ignored."""
+        if self._finished:
+            return
+        self._finished = True
+        self.attrs.update(attrs)
+        duration_ms = self.elapsed_ms()
+        if TRACING_ENABLED:
+            _record(self, duration_ms)
+
+
+def start_trace(name, **attrs):
+    """A trace to finish explicitly, for requests that outlive one call (streams)."""
+    return Trace(name, **attrs)
+
+
+@contextmanager
+def activate(trace_obj):
+    """Make `trace_obj` the current trace for span()/annotate() in this context."""
+    token = _current.set(trace_obj)
+    try:
+        yield trace_obj
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def trace(name, **attrs):
+    """
+    A root trace finished on exit. Inside another trace it is recorded as
+    a span of that trace instead, so traced helpers compose.
+    """
+    parent = _current.get()
+    if parent is not None:
+        with parent.span(name, **attrs) as sp:
+            yield sp
+        return
+    tr = Trace(name, **attrs)
+    try:
+        with activate(tr):
+            yield tr.attrs
+    except Exception as e:
+        tr.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        tr.finish()
+
+
+@contextmanager
+def span(name, **attrs):
+    """A span of the current trace; outside any trace it becomes its own trace."""
+    parent = _current.get()
+    if parent is None:
+        with trace(name, **attrs) as sp:
+            yield sp
+    else:
+        with parent.span(name, **attrs) as sp:
+            yield sp
+
+
+def annotate(**attrs):
+    """Attach outcome attributes (cache=..., fallback=...) to the current trace."""
+    tr = _current.get()
+    if tr is not None:
+        tr.attrs.update(attrs)
+
+
+# ---------------- EXPORT ----------------
+def _get_logger():
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                logger = logging.getLogger("rag.trace")
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                if TRACE_FILE:
+                    handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_MAX_BYTES,
+                                                  backupCount=TRACE_BACKUPS, encoding="utf-8")
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    logger.addHandler(handler)
+                _logger = logger
+    return _logger
+
+
+def _record(tr, duration_ms):
+    with _stats_lock:
+        for stage, ms in [(tr.name, duration_ms)] + [(s["name"], s["duration_ms"]) for s in tr.spans]:
+            _durations[stage].append(ms)
+            totals = _duration_totals[stage]
+            totals[0] += 1
+            totals[1] += ms
+        for key in OUTCOME_KEYS:
+            if key in tr.attrs:
+                _outcomes[(key, str(tr.attrs[key]).lower())] += 1
+        for s in tr.spans:
+            for key in TOKEN_KEYS:
+                _tokens[key] += int(s["attrs"].get(key) or 0)
+
+    logger = _get_logger()
+    if logger.handlers:
+        logger.info(json.dumps({
+            "trace_id": tr.id,
+            "name": tr.name,
+            "ts": round(tr.wall_start, 3),
+            "duration_ms": duration_ms,
+            "attrs": tr.attrs,
+            "spans": tr.spans,
+        }, default=str))
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def stage_percentiles():
+    """{stage: {"count", "p50_ms", "p95_ms"}} over the recent window of each stage."""
+    with _stats_lock:
+        windows = {stage: sorted(values) for stage, values in _durations.items() if values}
+        counts = {stage: totals[0] for stage, totals in _duration_totals.items()}
+    return {stage: {"count": counts[stage],
+                    "p50_ms": _percentile(values, 0.50),
+                    "p95_ms": _percentile(values, 0.95)}
+            for stage, values in sorted(windows.items())}
+
+
+def prometheus_text():
+    """All metrics in the Prometheus text exposition format."""
+    with _stats_lock:
+        windows = {stage: sorted(values) for stage, values in _durations.items() if values}
+        totals = {stage: list(t) for stage, t in _duration_totals.items()}
+        outcomes = dict(_outcomes)
+        tokens = dict(_tokens)
+
+    lines = ["# HELP rag_stage_duration_seconds Latency of each RAG pipeline stage.",
+             "# TYPE rag_stage_duration_seconds summary"]
+    for stage, values in sorted(windows.items()):
+        for q in (0.5, 0.95):
+            lines.append(f'rag_stage_duration_seconds{{stage="{stage}",quantile="{q}"}} '
+                         f"{_percentile(values, q) / 1000:.6f}")
+        count, total_ms = totals[stage]
+        lines.append(f'rag_stage_duration_seconds_sum{{stage="{stage}"}} {total_ms / 1000:.6f}')
+        lines.append(f'rag_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+    lines += ["# HELP rag_outcomes_total Cache, fallback and error outcomes of traced requests.",
+              "# TYPE rag_outcomes_total counter"]
+    for (key, value), count in sorted(outcomes.items()):
+        lines.append(f'rag_outcomes_total{{outcome="{key}",value="{value}"}} {count}')
+    lines += ["# HELP rag_llm_tokens_total Tokens sent to and received from the LLM.",
+              "# TYPE rag_llm_tokens_total counter"]
+    for key in TOKEN_KEYS:
+        lines.append(f'rag_llm_tokens_total{{kind="{key.split("_")[0]}"}} {tokens.get(key, 0)}')
+    return "\n".join(lines) + "\n"
+
+
+def dump_metrics(path):
+    """Write prometheus_text() to a file, e.g. for a node_exporter textfile collector."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+def serve_metrics(port=METRICS_PORT, host=METRICS_HOST):
+    """
+    Serve prometheus_text() on http://host:port/metrics from a daemon thread.
+    Loopback only by default; pass host="0.0.0.0" (or set RAG_METRICS_HOST)
+    to let a scraper on another machine reach it.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd